@@ -1,4 +1,5 @@
 import uuid
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database.session import get_db
@@ -17,6 +18,7 @@ from app.schemas.admin import (
 from app.schemas.economy import CreditAccountResponse
 from app.schemas.benchmark import BenchmarkResultResponse
 from app.services import admin_service
+from app.services.pagination import next_cursor
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -25,14 +27,22 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 def list_users(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    users, total = admin_service.get_all_users(db, page, page_size)
+    try:
+        users, total = admin_service.get_all_users(
+            db, page, page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return {
         "users": [UserResponse.model_validate(u) for u in users],
         "total": total,
         "page": page,
         "page_size": page_size,
+        "next_cursor": next_cursor(users, page_size),
     }
 
 
@@ -127,12 +137,20 @@ def deactivate_kill_switch(
 def get_audit_log(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    logs, total = admin_service.get_audit_log(db, page, page_size)
+    try:
+        logs, total = admin_service.get_audit_log(
+            db, page, page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return AuditLogListResponse(
         logs=[AuditLogResponse.model_validate(log) for log in logs],
         total=total,
         page=page,
         page_size=page_size,
+        next_cursor=next_cursor(logs, page_size),
     )
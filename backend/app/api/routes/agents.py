@@ -1,6 +1,9 @@
+import json
 import uuid
-from typing import Optional
+from contextlib import aclosing
+from typing import Optional, AsyncIterator
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database.session import get_db
 from app.schemas.agent import (
@@ -8,6 +11,7 @@ from app.schemas.agent import (
     AgentListResponse, AgentExecuteRequest, AgentExecuteResponse,
 )
 from app.services import agent_service
+from app.services.pagination import next_cursor
 from app.services.execution_service import execution_service
 
 router = APIRouter(prefix="/agents", tags=["agents"])
@@ -20,15 +24,22 @@ def list_agents(
     status: Optional[str] = None,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    agents, total = agent_service.list_agents(
-        db, category=category, search=search, status=status,
-        page=page, page_size=page_size,
-    )
+    try:
+        agents, total = agent_service.list_agents(
+            db, category=category, search=search, status=status,
+            page=page, page_size=page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Search results are relevance-ranked, so they only continue by cursor when asked to
     return AgentListResponse(
         agents=[AgentResponse.model_validate(a) for a in agents],
         total=total, page=page, page_size=page_size,
+        next_cursor=next_cursor(agents, page_size) if cursor or not search else None,
     )
 
 
@@ -124,6 +135,7 @@ async def execute_agent(
         raise HTTPException(status_code=404, detail="Agent not found")
 
     agent_config = {
+        "agent_id": str(agent.id),
         "system_prompt": agent.system_prompt,
         "model_provider": agent.model_provider,
         "model_name": agent.model_name,
@@ -144,4 +156,43 @@ async def execute_agent(
         tokens_used=result.tokens_used,
         cost=result.cost,
         duration_ms=result.duration_ms,
+        cached=result.cached,
+    )
+
+
+@router.post("/{agent_id}/execute/stream")
+async def stream_execute_agent(
+    agent_id: uuid.UUID,
+    request: AgentExecuteRequest,
+    db: Session = Depends(get_db),
+):
+    """Execute an agent and stream tokens back as Server-Sent Events."""
+    agent = agent_service.get_agent(db, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    agent_config = {
+        "agent_id": str(agent.id),
+        "system_prompt": agent.system_prompt,
+        "model_provider": agent.model_provider,
+        "model_name": agent.model_name,
+        "tools": agent.tools,
+        "parameters": agent.parameters,
+    }
+
+    async def event_stream() -> AsyncIterator[str]:
+        # aclosing: a client disconnect closes the agent stream too, so it records partial usage
+        async with aclosing(execution_service.stream_agent(
+            agent_config=agent_config,
+            input_data=request.input,
+            user_id=str(agent_id),  # Placeholder
+            db=db,
+        )) as events:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -1,4 +1,5 @@
 import uuid
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database.session import get_db
@@ -76,13 +77,23 @@ def get_subscription(user_id: uuid.UUID, db: Session = Depends(get_db)):
 def get_usage(
     user_id: uuid.UUID,
     period: str = Query("month", pattern="^(day|week|month)$"),
+    include_records: bool = False,
+    cursor: Optional[str] = None,
+    page_size: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db),
 ):
-    usage = billing_service.get_usage(db, user_id, period)
+    try:
+        usage = billing_service.get_usage(
+            db, user_id, period,
+            include_records=include_records, cursor=cursor, page_size=page_size,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return UsageStatsResponse(
         user_id=usage["user_id"],
         total_requests=usage["total_requests"],
         total_tokens=usage["total_tokens"],
         total_cost=usage["total_cost"],
         records=[UsageRecordResponse.model_validate(r) for r in usage["records"]],
+        next_cursor=usage["next_cursor"],
     )
@@ -1,4 +1,5 @@
 import uuid
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database.session import get_db
@@ -8,10 +9,13 @@ from app.schemas.economy import (
     TransactionListResponse,
     AddCreditsRequest,
     SpendCreditsRequest,
+    TransferCreditsRequest,
+    TransferCreditsResponse,
     LeaderboardEntry,
     LeaderboardResponse,
 )
 from app.services import economy_service
+from app.services.pagination import next_cursor
 
 router = APIRouter(prefix="/economy", tags=["economy"])
 
@@ -27,14 +31,22 @@ def get_transactions(
     user_id: uuid.UUID,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    transactions, total = economy_service.get_transactions(db, user_id, page, page_size)
+    try:
+        transactions, total = economy_service.get_transactions(
+            db, user_id, page, page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return TransactionListResponse(
         transactions=[CreditTransactionResponse.model_validate(t) for t in transactions],
         total=total,
         page=page,
         page_size=page_size,
+        next_cursor=next_cursor(transactions, page_size),
     )
 
 
@@ -49,6 +61,7 @@ def add_credits(
         amount=request.amount,
         transaction_type=request.transaction_type,
         description=request.description,
+        reference_id=request.reference_id,
     )
     return CreditTransactionResponse.model_validate(transaction)
 
@@ -63,12 +76,30 @@ def spend_credits(
         user_id=request.user_id,
         amount=request.amount,
         description=request.description,
+        reference_id=request.reference_id,
     )
     if not transaction:
         raise HTTPException(status_code=400, detail="Insufficient balance")
     return CreditTransactionResponse.model_validate(transaction)
 
 
+@router.post("/credits/transfer", response_model=TransferCreditsResponse, status_code=201)
+def transfer_credits(
+    request: TransferCreditsRequest,
+    db: Session = Depends(get_db),
+):
+    transactions = economy_service.transfer_credits(
+        db,
+        [economy_service.CreditTransfer(**t.model_dump()) for t in request.transfers],
+        reference_id=request.reference_id,
+    )
+    if transactions is None:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    return TransferCreditsResponse(
+        transactions=[CreditTransactionResponse.model_validate(t) for t in transactions],
+    )
+
+
 @router.get("/leaderboard", response_model=LeaderboardResponse)
 def get_leaderboard(
     limit: int = Query(10, ge=1, le=100),
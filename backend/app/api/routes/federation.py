@@ -1,6 +1,7 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, sessionmaker
 from app.database.session import get_db
 from app.schemas.federation import (
     FederationNodeCreate,
@@ -8,6 +9,10 @@ from app.schemas.federation import (
     FederationNodeListResponse,
     FederatedAgentResponse,
     FederatedAgentListResponse,
+    FederationSyncResponse,
+    AgentChange,
+    AgentChangesResponse,
+    NodeSyncResult,
 )
 from app.services import federation_service
 
@@ -33,11 +38,38 @@ def list_nodes(db: Session = Depends(get_db)):
 
 
 @router.post("/nodes/{node_id}/sync", response_model=list[FederatedAgentResponse])
-def sync_agents(node_id: uuid.UUID, db: Session = Depends(get_db)):
-    agents = federation_service.sync_agents(db, node_id)
+async def sync_agents(node_id: uuid.UUID, full: bool = False, db: Session = Depends(get_db)):
+    agents = await federation_service.sync_agents(db, node_id, full=full)
     return [FederatedAgentResponse.model_validate(a) for a in agents]
 
 
+@router.post("/sync", response_model=FederationSyncResponse)
+async def sync_all_nodes(db: Session = Depends(get_db)):
+    counts = await federation_service.sync_all_nodes(sessionmaker(bind=db.get_bind()))
+    return FederationSyncResponse(
+        results=[NodeSyncResult(node_id=node_id, agents_synced=n) for node_id, n in counts.items()],
+        total_agents=sum(counts.values()),
+    )
+
+
+@router.get("/changes", response_model=AgentChangesResponse)
+def get_agent_changes(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    try:
+        changes = federation_service.get_agent_changes(db, since, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid watermark")
+    return AgentChangesResponse(
+        agents=[AgentChange.model_validate(a) for a in changes["agents"]],
+        deleted=changes["deleted"],
+        next_watermark=changes["next_watermark"],
+        has_more=changes["has_more"],
+    )
+
+
 @router.post("/nodes/{node_id}/heartbeat", response_model=FederationNodeResponse)
 def heartbeat(node_id: uuid.UUID, db: Session = Depends(get_db)):
     node = federation_service.health_check(db, node_id)
@@ -1,4 +1,5 @@
 import uuid
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database.session import get_db
@@ -11,6 +12,7 @@ from app.schemas.governance import (
     VotingResultsResponse,
 )
 from app.services import governance_service
+from app.services.pagination import next_cursor
 
 router = APIRouter(prefix="/governance", tags=["governance"])
 
@@ -32,14 +34,22 @@ def list_proposals(
     status: str = Query(None),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    proposals, total = governance_service.list_proposals(db, status, page, page_size)
+    try:
+        proposals, total = governance_service.list_proposals(
+            db, status, page, page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return ProposalListResponse(
         proposals=[ProposalResponse.model_validate(p) for p in proposals],
         total=total,
         page=page,
         page_size=page_size,
+        next_cursor=next_cursor(proposals, page_size),
     )
 
 
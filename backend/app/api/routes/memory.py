@@ -9,6 +9,7 @@ from app.schemas.memory import (
     KnowledgeCreateRequest, KnowledgeResponse, KnowledgeSearchResponse,
 )
 from app.services import memory_service
+from app.services.pagination import next_cursor
 
 router = APIRouter(prefix="/memory", tags=["memory"])
 
@@ -32,9 +33,12 @@ def search_knowledge(
     query: str = Query(...),
     category: Optional[str] = None,
     limit: int = Query(10, ge=1, le=100),
+    mode: str = Query("semantic", pattern="^(semantic|keyword)$"),
     db: Session = Depends(get_db),
 ):
-    results, total = memory_service.search_knowledge(db, query=query, category=category, limit=limit)
+    results, total = memory_service.search_knowledge(
+        db, query=query, category=category, limit=limit, mode=mode,
+    )
     return KnowledgeSearchResponse(
         results=[KnowledgeResponse.model_validate(r) for r in results],
         total=total,
@@ -66,10 +70,11 @@ def search_agent_memories(
     query: str = Query(...),
     namespace: Optional[str] = None,
     limit: int = Query(10, ge=1, le=100),
+    mode: str = Query("keyword", pattern="^(semantic|keyword|hybrid)$"),
     db: Session = Depends(get_db),
 ):
     memories = memory_service.search_memories(
-        db, agent_id=agent_id, query=query, namespace=namespace, limit=limit,
+        db, agent_id=agent_id, query=query, namespace=namespace, limit=limit, mode=mode,
     )
     return [MemoryResponse.model_validate(m) for m in memories]
 
@@ -80,14 +85,21 @@ def list_memories(
     namespace: Optional[str] = None,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    memories, total = memory_service.list_memories(
-        db, agent_id=agent_id, namespace=namespace, page=page, page_size=page_size,
-    )
+    try:
+        memories, total = memory_service.list_memories(
+            db, agent_id=agent_id, namespace=namespace, page=page, page_size=page_size,
+            cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return MemoryListResponse(
         memories=[MemoryResponse.model_validate(m) for m in memories],
         total=total, page=page, page_size=page_size,
+        next_cursor=next_cursor(memories, page_size, sort_attr="updated_at"),
     )
 
 
@@ -1,6 +1,8 @@
 import time
 from fastapi import APIRouter, Request
 from starlette.responses import PlainTextResponse
+from app.services.execution_service import execution_service
+from app.services.usage_ingest_service import usage_ingestor
 
 router = APIRouter(tags=["metrics"])
 
@@ -66,5 +68,68 @@ def get_metrics():
         "# HELP db_connections_active Number of active database connections.",
         "# TYPE db_connections_active gauge",
         f'db_connections_active {_metrics["db_connections_active"]}',
+        "",
+        "# HELP completion_cache_hits_total Exact completion cache hits.",
+        "# TYPE completion_cache_hits_total counter",
+        f"completion_cache_hits_total {execution_service.completion_cache.hits}",
+        "",
+        "# HELP completion_cache_misses_total Exact completion cache misses.",
+        "# TYPE completion_cache_misses_total counter",
+        f"completion_cache_misses_total {execution_service.completion_cache.misses}",
+        "",
+        "# HELP semantic_cache_hits_total Semantic (near-duplicate) cache hits.",
+        "# TYPE semantic_cache_hits_total counter",
+        f"semantic_cache_hits_total {execution_service.semantic_cache.hits}",
+        "",
+        "# HELP semantic_cache_misses_total Semantic (near-duplicate) cache misses.",
+        "# TYPE semantic_cache_misses_total counter",
+        f"semantic_cache_misses_total {execution_service.semantic_cache.misses}",
+        "",
+        "# HELP usage_ingest_pending Usage rows queued for the write-behind ingestor.",
+        "# TYPE usage_ingest_pending gauge",
+        f"usage_ingest_pending {usage_ingestor.pending}",
+        "",
+        "# HELP usage_ingest_dropped_total Usage rows dropped because the ingest queue was full.",
+        "# TYPE usage_ingest_dropped_total counter",
+        f"usage_ingest_dropped_total {usage_ingestor.rows_dropped}",
+        "",
+        "# HELP usage_ingest_dead_lettered_total Usage rows moved to usage_dead_letters after repeated failures.",
+        "# TYPE usage_ingest_dead_lettered_total counter",
+        f"usage_ingest_dead_lettered_total {usage_ingestor.rows_dead_lettered}",
     ]
+    lines.extend(_admission_lines())
     return "\n".join(lines) + "\n"
+
+
+def _admission_lines():
+    """Per-provider LLM admission queue metrics."""
+    admission = execution_service.admission.snapshot()
+    families = [
+        ("llm_queue_depth", "gauge", "LLM calls waiting for admission, by provider and priority."),
+        ("llm_in_flight", "gauge", "LLM calls currently admitted, by provider."),
+        ("llm_admission_wait_seconds_sum", "counter", "Total seconds LLM calls waited for admission."),
+        ("llm_admission_wait_seconds_count", "counter", "Number of LLM calls admitted."),
+        ("llm_admission_wait_seconds_max", "gauge", "Longest admission wait in seconds."),
+    ]
+    samples = {name: [] for name, _, _ in families}
+    for provider, stats in sorted(admission.items()):
+        for priority, depth in stats["queue_depth"].items():
+            samples["llm_queue_depth"].append(
+                f'llm_queue_depth{{provider="{provider}",priority="{priority}"}} {depth}'
+            )
+        label = f'{{provider="{provider}"}}'
+        samples["llm_in_flight"].append(f"llm_in_flight{label} {stats['in_flight']}")
+        samples["llm_admission_wait_seconds_sum"].append(
+            f"llm_admission_wait_seconds_sum{label} {stats['wait_seconds_sum']:.6f}"
+        )
+        samples["llm_admission_wait_seconds_count"].append(
+            f"llm_admission_wait_seconds_count{label} {stats['admitted']}"
+        )
+        samples["llm_admission_wait_seconds_max"].append(
+            f"llm_admission_wait_seconds_max{label} {stats['wait_seconds_max']:.6f}"
+        )
+
+    lines = []
+    for name, kind, description in families:
+        lines.extend(["", f"# HELP {name} {description}", f"# TYPE {name} {kind}", *samples[name]])
+    return lines
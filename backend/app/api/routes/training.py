@@ -8,6 +8,7 @@ from app.schemas.training import (
     FineTunedModelResponse, FineTunedModelListResponse,
 )
 from app.services import fine_tuning_service
+from app.services.pagination import next_cursor
 
 router = APIRouter(prefix="/training", tags=["training"])
 
@@ -52,12 +53,20 @@ def get_job_status(job_id: uuid.UUID, db: Session = Depends(get_db)):
 def list_jobs(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    jobs, total = fine_tuning_service.list_jobs(db, page=page, page_size=page_size)
+    try:
+        jobs, total = fine_tuning_service.list_jobs(
+            db, page=page, page_size=page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return TrainingJobListResponse(
         jobs=[TrainingJobResponse.model_validate(j) for j in jobs],
         total=total, page=page, page_size=page_size,
+        next_cursor=next_cursor(jobs, page_size),
     )
 
 
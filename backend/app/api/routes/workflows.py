@@ -1,6 +1,6 @@
 import uuid
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database.session import get_db
 from app.schemas.workflow import (
@@ -8,6 +8,8 @@ from app.schemas.workflow import (
     WorkflowListResponse, WorkflowExecuteRequest, WorkflowExecutionResponse,
 )
 from app.services import orchestration_service
+from app.services.pagination import next_cursor
+from app.services.workflow_engine_service import workflow_engine_service, session_factory_for
 
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
@@ -18,15 +20,21 @@ def list_workflows(
     is_public: Optional[bool] = None,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    workflows, total = orchestration_service.list_workflows(
-        db, is_template=is_template, is_public=is_public,
-        page=page, page_size=page_size,
-    )
+    try:
+        workflows, total = orchestration_service.list_workflows(
+            db, is_template=is_template, is_public=is_public,
+            page=page, page_size=page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return WorkflowListResponse(
         workflows=[WorkflowResponse.model_validate(w) for w in workflows],
         total=total, page=page, page_size=page_size,
+        next_cursor=next_cursor(workflows, page_size),
     )
 
 
@@ -34,15 +42,21 @@ def list_workflows(
 def list_templates(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
 ):
-    workflows, total = orchestration_service.list_workflows(
-        db, is_template=True, is_public=True,
-        page=page, page_size=page_size,
-    )
+    try:
+        workflows, total = orchestration_service.list_workflows(
+            db, is_template=True, is_public=True,
+            page=page, page_size=page_size, cursor=cursor, with_total=include_total,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return WorkflowListResponse(
         workflows=[WorkflowResponse.model_validate(w) for w in workflows],
         total=total, page=page, page_size=page_size,
+        next_cursor=next_cursor(workflows, page_size),
     )
 
 
@@ -87,6 +101,7 @@ def delete_workflow(workflow_id: uuid.UUID, db: Session = Depends(get_db)):
 def execute_workflow(
     workflow_id: uuid.UUID,
     request: WorkflowExecuteRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     workflow = orchestration_service.get_workflow(db, workflow_id)
@@ -100,7 +115,15 @@ def execute_workflow(
         triggered_by=triggered_by,
         input_data=request.input_data,
     )
-    return WorkflowExecutionResponse.model_validate(execution)
+    response = WorkflowExecutionResponse.model_validate(execution)
+
+    # Steps run after the response is sent, in their own session
+    background_tasks.add_task(
+        workflow_engine_service.run_execution,
+        execution.id,
+        session_factory_for(db),
+    )
+    return response
 
 
 @router.get("/{workflow_id}/executions/{execution_id}", response_model=WorkflowExecutionResponse)
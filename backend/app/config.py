@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -15,6 +15,31 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
 
+    # Rate limiting ("memory" token bucket per worker, or "redis" shared sliding window)
+    rate_limit_backend: str = "memory"
+    rate_limit_max_requests: int = 100
+    rate_limit_window_seconds: float = 60.0
+    rate_limit_max_keys: int = 100000
+
+    # API key usage ("memory" per-worker rolling counters, or "redis" shared counters)
+    api_key_counter_backend: str = "memory"
+    api_key_rate_window_seconds: float = 3600.0
+    api_key_usage_flush_seconds: float = 5.0
+    api_key_cache_enabled: bool = True
+    api_key_cache_ttl_seconds: float = 60.0
+    api_key_cache_max_entries: int = 10000
+    api_key_cache_redis: bool = False
+
+    # Usage ingestion (write-behind bulk inserts of usage rows)
+    usage_ingest_flush_interval_ms: int = 250
+    usage_ingest_batch_size: int = 500
+    usage_ingest_max_pending: int = 10000
+    usage_ingest_max_attempts: int = 3
+    usage_ingest_max_wait_seconds: float = 5.0
+
+    # Platform stats (served from memory, recomputed at most this often)
+    platform_stats_max_age_seconds: float = 60.0
+
     # Auth
     secret_key: str = "dev-secret-key-change-in-production"
     algorithm: str = "HS256"
@@ -26,6 +51,70 @@ class Settings(BaseSettings):
     mistral_api_key: Optional[str] = None
     groq_api_key: Optional[str] = None
     ollama_base_url: Optional[str] = None
+    # Default admission cap for Ollama; match the server's OLLAMA_NUM_PARALLEL so
+    # extra calls queue here (by priority) rather than on the server's connections
+    ollama_max_parallel: int = 4
+
+    # Provider HTTP connection pools
+    llm_http2: bool = True
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 30.0
+
+    # Adaptive model routing (live latency/error statistics per provider and model)
+    router_ewma_alpha: float = 0.2
+    router_error_threshold: float = 0.5
+    router_min_samples: int = 5
+    router_cooldown_seconds: float = 30.0
+    router_history_minutes: float = 60.0
+
+    # Provider call resilience (retries, per-provider circuit breakers, hedging)
+    llm_max_retries: int = 2
+    llm_retry_base_delay_seconds: float = 0.2
+    llm_retry_max_delay_seconds: float = 2.0
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_recovery_seconds: float = 30.0
+    llm_hedging_enabled: bool = True
+    llm_hedge_min_delay_ms: float = 200.0
+    llm_hedge_default_delay_ms: float = 5000.0
+
+    # Provider admission: in-flight cap and tokens-per-minute budget (0 = unlimited),
+    # overridable per provider, e.g. {"groq": {"max_concurrency": 8, "tokens_per_minute": 20000}}
+    llm_max_concurrency: int = 32
+    llm_tokens_per_minute: int = 0
+    llm_provider_limits: Dict[str, Dict[str, int]] = {}
+
+    # Prompt budgeting: inputs over the model's context window are trimmed
+    # ("truncate") or refused ("reject"); calls whose worst-case cost exceeds
+    # the limit are refused before sending (0 = no limit)
+    prompt_overflow: str = "truncate"
+    llm_max_cost_per_call: float = 0.0
+
+    # Completion cache. Off by default: when enabled, agents with
+    # parameters.temperature == 0 are cached; parameters.cache = true opts an
+    # agent in regardless of this flag.
+    completion_cache_enabled: bool = False
+    completion_cache_ttl_seconds: float = 3600.0
+    completion_cache_max_entries: int = 1024
+    completion_cache_redis: bool = False
+    semantic_cache_threshold: float = 0.9
+    semantic_cache_ttl_seconds: float = 3600.0
+    semantic_cache_max_entries_per_agent: int = 500
+
+    # Knowledge base ANN index (in-memory only when no path is set)
+    knowledge_index_path: Optional[str] = None
+    knowledge_index_nprobe: int = 8
+    knowledge_index_train_threshold: int = 20000
+
+    # Workflows
+    workflow_max_concurrency: int = 4
+
+    # Federation sync
+    federation_sync_concurrency: int = 8
+    federation_sync_page_size: int = 100
+    federation_sync_timeout_seconds: float = 10.0
+    # Changes newer than this are held back from the delta feed until in-flight commits land
+    federation_changes_settle_seconds: float = 2.0
 
     # Stripe
     stripe_secret_key: Optional[str] = None
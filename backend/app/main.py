@@ -4,21 +4,45 @@ from contextlib import asynccontextmanager
 from app.config import settings
 from app.api.routes import agents, workflows, auth, federation, protocol, economy, memory, benchmarks, training, research, governance, billing, admin, platform
 from app.api.routes import metrics as metrics_route
-from app.middleware.rate_limiter import RateLimiterMiddleware
+from app.middleware.rate_limiter import RateLimiterMiddleware, build_rate_limiter
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.request_id import RequestIDMiddleware
 from app.services.meta_agent_service import meta_agent_service
+from app.services.execution_service import execution_service
+from app.services.usage_counter_service import api_key_usage
+from app.services.billing_service import api_key_cache
+from app.services.usage_ingest_service import usage_ingestor
 import logging
 import redis as redis_lib
 
 logger = logging.getLogger(__name__)
 
+# Built here rather than inside the middleware so shutdown can close its connections
+rate_limiter = build_rate_limiter(settings.rate_limit_max_requests, settings.rate_limit_window_seconds)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await execution_service.open_clients()
+    api_key_cache.start_listener()
+    await usage_ingestor.start()
     logger.info("Starting meta-agent background evaluation scheduler")
     meta_agent_service.start_background_evaluation(agents=[])
     yield
     meta_agent_service.stop_scheduled_evaluation()
     logger.info("Stopped meta-agent evaluation scheduler")
+    await execution_service.close_clients()
+    await rate_limiter.aclose()
+    api_key_cache.stop_listener()
+    # Drain queued usage rows before the process exits
+    try:
+        await usage_ingestor.stop()
+    except Exception as exc:
+        logger.error("Dropped %d queued usage rows on shutdown: %s", usage_ingestor.pending, exc)
+    try:
+        api_key_usage.flush_with()
+    except Exception as exc:
+        logger.warning("Could not flush API key usage on shutdown: %s", exc)
 
 
 app = FastAPI(
@@ -32,7 +56,16 @@ app = FastAPI(
 )
 
 # Rate limiter middleware
-app.add_middleware(RateLimiterMiddleware, max_requests=100, window_seconds=60)
+app.add_middleware(
+    RateLimiterMiddleware,
+    max_requests=settings.rate_limit_max_requests,
+    window_seconds=settings.rate_limit_window_seconds,
+    limiter=rate_limiter,
+)
+
+# Request metrics and X-Request-ID (outermost of the two, so rate-limited responses carry an ID too)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIDMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -0,0 +1,31 @@
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.api.routes.metrics import (
+    increment_request_metrics, decrement_active_requests, record_latency,
+)
+
+
+class MetricsMiddleware:
+    """Feeds the /metrics request counters and latency totals.
+
+    Latency is measured until the response body has been fully sent, so
+    streaming responses are counted for their whole duration.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        increment_request_metrics()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            record_latency(time.perf_counter() - started)
+            decrement_active_requests()
@@ -1,45 +1,182 @@
 import time
 import os
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional, Tuple
+
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+class TokenBucketLimiter:
+    """Per-process token bucket: O(1) per request, bounded to ``max_keys`` clients.
+
+    Each key holds ``max_requests`` tokens refilled continuously over
+    ``window_seconds``. Past ``max_keys`` the least recently seen key is evicted,
+    so IP churn cannot grow memory and only the quietest clients are forgiven.
+    """
+
+    def __init__(self, max_requests: int = 100, window_seconds: float = 60.0, max_keys: int = 100_000):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.refill_rate = max_requests / window_seconds
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def hit(self, key: str) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (float(self.max_requests), now))
+        tokens = min(float(self.max_requests), tokens + (now - updated_at) * self.refill_rate)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        retry_after = 0.0 if allowed else (1.0 - tokens) / self.refill_rate
+        return RateLimitResult(allowed, int(tokens), retry_after)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def aclose(self) -> None:
+        self._buckets.clear()
+
 
+# Sliding-window log in a sorted set. Uses the Redis server clock so every worker
+# and node agrees on the window; keys expire once idle for a full window.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local member = ARGV[3]
+redis.replicate_commands()
+local clock = redis.call('TIME')
+local now_ms = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now_ms - window_ms)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now_ms, member)
+    redis.call('PEXPIRE', key, window_ms)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window_ms - now_ms}
+"""
 
-class RateLimiterMiddleware(BaseHTTPMiddleware):
-    """Simple in-memory rate limiting middleware.
 
-    Limits requests per IP address using a sliding window approach.
-    Disabled during testing to avoid interfering with test suites.
+class RedisSlidingWindowLimiter:
+    """Sliding-window limiter shared by all workers through one atomic Lua script.
+
+    Falls back to a local token bucket while Redis is unreachable so an outage
+    degrades to per-worker limits instead of failing every request.
     """
 
-    def __init__(self, app, max_requests: int = 100, window_seconds: int = 60):
-        super().__init__(app)
+    KEY_PREFIX = "ratelimit:"
+    RETRY_SECONDS = 5.0
+
+    def __init__(
+        self,
+        redis_url: str,
+        max_requests: int = 100,
+        window_seconds: float = 60.0,
+        max_keys: int = 100_000,
+        client: Any = None,
+    ):
+        self.redis_url = redis_url
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self._requests: dict[str, list[float]] = {}
+        self.fallback = TokenBucketLimiter(max_requests, window_seconds, max_keys)
+        self._redis: Any = client
+        self._script: Any = None
+        self._retry_at = 0.0
+
+    def _get_script(self) -> Any:
+        if self._script is None:
+            if self._redis is None:
+                import redis.asyncio as redis_asyncio
+
+                self._redis = redis_asyncio.from_url(self.redis_url, socket_connect_timeout=2)
+            self._script = self._redis.register_script(SLIDING_WINDOW_SCRIPT)
+        return self._script
+
+    async def hit(self, key: str) -> RateLimitResult:
+        if time.monotonic() < self._retry_at:
+            return await self.fallback.hit(key)
+        try:
+            allowed, remaining, retry_after_ms = await self._get_script()(
+                keys=[self.KEY_PREFIX + key],
+                args=[self.max_requests, int(self.window_seconds * 1000), uuid.uuid4().hex],
+            )
+        except Exception as exc:
+            logger.warning("Redis rate limiter unavailable, using local limits: %s", exc)
+            self._retry_at = time.monotonic() + self.RETRY_SECONDS
+            return await self.fallback.hit(key)
+        return RateLimitResult(bool(allowed), int(remaining), max(0.0, int(retry_after_ms) / 1000.0))
+
+    async def aclose(self) -> None:
+        """Close the Redis connection pool; called from the app's shutdown hooks."""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+            self._script = None
+        await self.fallback.aclose()
+
 
-    async def dispatch(self, request: Request, call_next):
-        if os.environ.get("TESTING") == "1":
-            return await call_next(request)
+def build_rate_limiter(max_requests: Optional[int] = None, window_seconds: Optional[float] = None):
+    max_requests = max_requests or settings.rate_limit_max_requests
+    window_seconds = window_seconds or settings.rate_limit_window_seconds
+    if settings.rate_limit_backend == "redis":
+        return RedisSlidingWindowLimiter(
+            settings.redis_url, max_requests, window_seconds, settings.rate_limit_max_keys,
+        )
+    return TokenBucketLimiter(max_requests, window_seconds, settings.rate_limit_max_keys)
 
-        client_ip = request.client.host if request.client else "unknown"
-        now = time.time()
-        cutoff = now - self.window_seconds
 
-        timestamps = self._requests.get(client_ip, [])
-        timestamps = [t for t in timestamps if t > cutoff]
+class RateLimiterMiddleware:
+    """Rate limiting middleware keyed on client IP.
 
-        if len(timestamps) >= self.max_requests:
-            return JSONResponse(
+    The limiter is pluggable: an in-process token bucket by default, or a Redis
+    sliding window (``rate_limit_backend = "redis"``) so limits hold across
+    workers and nodes. Disabled during testing to avoid interfering with test suites.
+    """
+
+    def __init__(self, app: ASGIApp, max_requests: int = 100, window_seconds: int = 60, limiter: Any = None):
+        self.app = app
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.limiter = limiter if limiter is not None else build_rate_limiter(max_requests, window_seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or os.environ.get("TESTING") == "1":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        result = await self.limiter.hit(client[0] if client else "unknown")
+
+        if not result.allowed:
+            retry_after = max(1, int(result.retry_after + 0.999))
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "detail": "Too many requests. Please try again later.",
-                    "retry_after": self.window_seconds,
+                    "retry_after": retry_after,
                 },
-                headers={"Retry-After": str(self.window_seconds)},
+                headers={"Retry-After": str(retry_after)},
             )
+            await response(scope, receive, send)
+            return
 
-        timestamps.append(now)
-        self._requests[client_ip] = timestamps
-
-        return await call_next(request)
+        await self.app(scope, receive, send)
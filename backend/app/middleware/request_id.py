@@ -0,0 +1,48 @@
+import re
+import uuid
+import contextvars
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_ID_HEADER = b"x-request-id"
+_VALID_REQUEST_ID = re.compile(rb"^[A-Za-z0-9._:-]{1,128}$")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """ID of the request being handled in the current context, if any."""
+    return request_id_var.get()
+
+
+class RequestIDMiddleware:
+    """Propagates ``X-Request-ID``: reuses a well-formed incoming ID or mints one,
+    exposes it via ``get_request_id()`` and ``request.state.request_id``, and
+    echoes it on the response."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = next((value for name, value in scope["headers"] if name == REQUEST_ID_HEADER), None)
+        raw_id = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex.encode()
+        request_id = raw_id.decode("ascii")
+        scope.setdefault("state", {})["request_id"] = request_id
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != REQUEST_ID_HEADER]
+                headers.append((REQUEST_ID_HEADER, raw_id))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
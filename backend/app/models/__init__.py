@@ -1,4 +1,4 @@
-from app.models.agent import Agent, AgentVersion
+from app.models.agent import Agent, AgentTombstone, AgentVersion
 from app.models.workflow import Workflow, WorkflowStep, WorkflowExecution
 from app.models.user import User
 from app.models.review import Review
@@ -6,17 +6,19 @@ from app.models.model_usage import ModelUsage
 from app.models.federation import FederationNode, FederatedAgent
 from app.models.aacp import AgentMessage
 from app.models.economy import CreditAccount, CreditTransaction
-from app.models.memory import AgentMemory, KnowledgeBase
+from app.models.memory import AgentMemory, AgentMemoryRevision, KnowledgeBase, KnowledgeChange
 from app.models.benchmark import BenchmarkResult
 from app.models.training import TrainingJob, FineTunedModel
 from app.models.research import ResearchPaper, TrendingModel
 from app.models.governance import Proposal, Vote
-from app.models.billing import ApiKey, BillingPlan, Subscription, UsageRecord
+from app.models.billing import (
+    ApiKey, BillingPlan, Subscription, UsageDeadLetter, UsageRecord, UsageRollup, UsageRollupCoverage,
+)
 from app.models.admin import AuditLog, PlatformAnnouncement, EmergencyKillSwitch
 from app.models.platform_stats import PlatformSnapshot
 
 __all__ = [
-    "Agent", "AgentVersion",
+    "Agent", "AgentTombstone", "AgentVersion",
     "Workflow", "WorkflowStep", "WorkflowExecution",
     "User",
     "Review",
@@ -24,12 +26,13 @@ __all__ = [
     "FederationNode", "FederatedAgent",
     "AgentMessage",
     "CreditAccount", "CreditTransaction",
-    "AgentMemory", "KnowledgeBase",
+    "AgentMemory", "AgentMemoryRevision", "KnowledgeBase", "KnowledgeChange",
     "BenchmarkResult",
     "TrainingJob", "FineTunedModel",
     "ResearchPaper", "TrendingModel",
     "Proposal", "Vote",
-    "ApiKey", "BillingPlan", "Subscription", "UsageRecord",
+    "ApiKey", "BillingPlan", "Subscription", "UsageDeadLetter", "UsageRecord", "UsageRollup",
+    "UsageRollupCoverage",
     "AuditLog", "PlatformAnnouncement", "EmergencyKillSwitch",
     "PlatformSnapshot",
 ]
@@ -1,11 +1,12 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Uuid, JSON
+from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Uuid, JSON, Index
 from app.database.session import Base
 
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (Index("ix_audit_logs_created_at_id", "created_at", "id"),)
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     admin_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, Text, Enum, ForeignKey, JSON, Uuid
+from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, Text, Enum, ForeignKey, JSON, Uuid, DDL, Index, event
 from sqlalchemy.orm import relationship
 from app.database.session import Base
 import enum
@@ -37,6 +37,10 @@ class AgentStatus(str, enum.Enum):
 
 class Agent(Base):
     __tablename__ = "agents"
+    __table_args__ = (
+        Index("ix_agents_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_agents_updated_at_id", "updated_at", "id"),
+    )
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String(200), nullable=False, index=True)
@@ -86,6 +90,63 @@ class Agent(Base):
     reviews = relationship("Review", back_populates="agent")
 
 
+class AgentTombstone(Base):
+    """Marks a deleted agent so federation peers pulling changes can drop their copy."""
+
+    __tablename__ = "agent_tombstones"
+    __table_args__ = (Index("ix_agent_tombstones_deleted_at_agent_id", "deleted_at", "agent_id"),)
+
+    agent_id = Column(Uuid, primary_key=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+@event.listens_for(Agent, "after_delete")
+def _record_agent_tombstone(mapper, connection, target):
+    connection.execute(
+        AgentTombstone.__table__.insert().values(agent_id=target.id, deleted_at=datetime.utcnow())
+    )
+
+
+# Full-text search document for marketplace discovery. Postgres indexes the weighted
+# tsvector expression with GIN (queries must use the identical expression); SQLite
+# keeps an external-content FTS5 table in sync with triggers.
+AGENT_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(long_description, '')), 'C') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(tags::text, '')), 'D')"
+)
+AGENT_FTS_TABLE = "agents_fts"
+_FTS_COLUMNS = "name, description, long_description, tags"
+
+for _statement in [
+    f"CREATE INDEX IF NOT EXISTS ix_agents_search_document ON agents USING GIN (({AGENT_SEARCH_DOCUMENT}))",
+]:
+    event.listen(Agent.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+for _statement in [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {AGENT_FTS_TABLE} USING fts5("
+    f"{_FTS_COLUMNS}, content='agents', tokenize='porter unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS agents_fts_ai AFTER INSERT ON agents BEGIN "
+    f"INSERT INTO {AGENT_FTS_TABLE}(rowid, {_FTS_COLUMNS}) "
+    f"VALUES (new.rowid, new.name, new.description, new.long_description, new.tags); END",
+    f"CREATE TRIGGER IF NOT EXISTS agents_fts_ad AFTER DELETE ON agents BEGIN "
+    f"INSERT INTO {AGENT_FTS_TABLE}({AGENT_FTS_TABLE}, rowid, {_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.rowid, old.name, old.description, old.long_description, old.tags); END",
+    f"CREATE TRIGGER IF NOT EXISTS agents_fts_au AFTER UPDATE OF {_FTS_COLUMNS} ON agents BEGIN "
+    f"INSERT INTO {AGENT_FTS_TABLE}({AGENT_FTS_TABLE}, rowid, {_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.rowid, old.name, old.description, old.long_description, old.tags); "
+    f"INSERT INTO {AGENT_FTS_TABLE}(rowid, {_FTS_COLUMNS}) "
+    f"VALUES (new.rowid, new.name, new.description, new.long_description, new.tags); END",
+]:
+    event.listen(Agent.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+event.listen(
+    Agent.__table__, "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {AGENT_FTS_TABLE}").execute_if(dialect="sqlite"),
+)
+
+
 class AgentVersion(Base):
     __tablename__ = "agent_versions"
 
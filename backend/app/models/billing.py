@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Uuid, JSON
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Index, Uuid, JSON, Text, UniqueConstraint
 from app.database.session import Base
 
 
@@ -9,7 +9,7 @@ class ApiKey(Base):
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     user_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
-    key_hash = Column(String(255), nullable=False)
+    key_hash = Column(String(255), nullable=False, index=True)
     name = Column(String(200), nullable=False)
     tier = Column(String(20), default="free")
     rate_limit = Column(Integer, default=100)
@@ -48,6 +48,9 @@ class Subscription(Base):
 
 class UsageRecord(Base):
     __tablename__ = "usage_records"
+    __table_args__ = (
+        Index("ix_usage_records_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     user_id = Column(Uuid, nullable=False)
@@ -57,3 +60,43 @@ class UsageRecord(Base):
     tokens_used = Column(Integer, default=0)
     cost = Column(Float, default=0.0)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UsageDeadLetter(Base):
+    """A usage row the ingest queue could not write after repeated attempts."""
+
+    __tablename__ = "usage_dead_letters"
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    table_name = Column(String(100), nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UsageRollup(Base):
+    """Per-user usage totals for one hour or one day, maintained on ingest."""
+
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "granularity", "bucket_start", name="uq_usage_rollups_bucket"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, nullable=False)
+    granularity = Column(String(10), nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    tokens_used = Column(Integer, default=0, nullable=False)
+    cost = Column(Float, default=0.0, nullable=False)
+
+
+class UsageRollupCoverage(Base):
+    """Single row: rollups hold all usage from ``covers_from`` (an hour boundary) on.
+    Usage before it is summed from raw records."""
+
+    __tablename__ = "usage_rollup_coverage"
+
+    id = Column(Integer, primary_key=True)
+    covers_from = Column(DateTime, nullable=False)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Float, DateTime, Text, ForeignKey, Uuid
+from sqlalchemy import Column, String, Float, DateTime, Text, ForeignKey, Uuid, Index
 from app.database.session import Base
 
 
@@ -18,6 +18,10 @@ class CreditAccount(Base):
 
 class CreditTransaction(Base):
     __tablename__ = "credit_transactions"
+    __table_args__ = (
+        Index("ix_credit_transactions_account_created_at_id", "account_id", "created_at", "id"),
+        Index("uq_credit_transactions_account_reference", "account_id", "reference_id", unique=True),
+    )
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     account_id = Column(Uuid, ForeignKey("credit_accounts.id"), nullable=False)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, JSON, Uuid
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, JSON, Uuid, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.database.session import Base
 
@@ -16,6 +16,7 @@ class FederationNode(Base):
     status = Column(String(20), default="pending")
     agent_count = Column(Integer, default=0)
     last_heartbeat = Column(DateTime)
+    sync_watermark = Column(String(200))
     created_at = Column(DateTime, default=datetime.utcnow)
 
     agents = relationship("FederatedAgent", back_populates="node", cascade="all, delete-orphan")
@@ -23,6 +24,9 @@ class FederationNode(Base):
 
 class FederatedAgent(Base):
     __tablename__ = "federated_agents"
+    __table_args__ = (
+        UniqueConstraint("node_id", "remote_agent_id", name="uq_federated_agents_node_remote"),
+    )
 
     id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     node_id = Column(Uuid, ForeignKey("federation_nodes.id"), nullable=False)
@@ -1,8 +1,16 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Float, Integer, DateTime, Text, JSON, Uuid
+from sqlalchemy import (
+    Boolean, Column, String, Float, Integer, DateTime, Text, JSON, Uuid, LargeBinary, event, insert, select, update,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.database.session import Base
 
+# Revision key shared by every agent's memories (the cross-agent search partition)
+ALL_AGENTS = uuid.UUID(int=0)
+
 
 class AgentMemory(Base):
     __tablename__ = "agent_memories"
@@ -13,6 +21,8 @@ class AgentMemory(Base):
     key = Column(String(500), nullable=False)
     content = Column(Text, nullable=False)
     embedding = Column(JSON, default=list)
+    # Same embedding packed as float32 for vectorised similarity search
+    embedding_vector = Column(LargeBinary)
     memory_type = Column(String(20), nullable=False, default="episodic")
     metadata_extra = Column(JSON, default=dict)
     access_count = Column(Integer, default=0)
@@ -20,6 +30,39 @@ class AgentMemory(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class AgentMemoryRevision(Base):
+    """Changes on every write to an agent's memories, so cached embedding matrices
+    can be validated with a primary-key lookup instead of aggregating the rows."""
+
+    __tablename__ = "agent_memory_revisions"
+
+    agent_id = Column(Uuid, primary_key=True)
+    revision = Column(Uuid, nullable=False, default=uuid.uuid4)
+
+
+@event.listens_for(AgentMemory, "after_insert")
+@event.listens_for(AgentMemory, "after_update")
+@event.listens_for(AgentMemory, "after_delete")
+def _bump_memory_revision(mapper, connection, target):
+    table = AgentMemoryRevision.__table__
+    rows = [{"agent_id": key, "revision": uuid.uuid4()} for key in {target.agent_id or ALL_AGENTS, ALL_AGENTS}]
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["agent_id"], set_={"revision": statement.excluded.revision},
+        )
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        result = connection.execute(
+            update(table).where(table.c.agent_id == row["agent_id"]).values(revision=row["revision"])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table), [row])
+
+
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_base"
 
@@ -32,3 +75,44 @@ class KnowledgeBase(Base):
     tags = Column(JSON, default=list)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class KnowledgeChange(Base):
+    """Append-only log of knowledge_base inserts and deletes (tombstones), so each
+    worker's vector index can replay only what changed since its watermark."""
+
+    __tablename__ = "knowledge_changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    knowledge_id = Column(Uuid, nullable=False)
+    deleted = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+def _log_knowledge_changes(connection, ids, deleted: bool) -> None:
+    if ids:
+        now = datetime.utcnow()
+        connection.execute(insert(KnowledgeChange.__table__), [
+            {"knowledge_id": knowledge_id, "deleted": deleted, "created_at": now} for knowledge_id in ids
+        ])
+
+
+@event.listens_for(KnowledgeBase, "after_insert")
+def _log_knowledge_insert(mapper, connection, target):
+    _log_knowledge_changes(connection, [target.id], deleted=False)
+
+
+@event.listens_for(KnowledgeBase, "after_delete")
+def _log_knowledge_delete(mapper, connection, target):
+    _log_knowledge_changes(connection, [target.id], deleted=True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _log_knowledge_bulk_delete(state):
+    """Bulk ``query(KnowledgeBase).delete()`` skips mapper events; tombstone its rows first."""
+    if not state.is_delete or state.bind_mapper is None or state.bind_mapper.class_ is not KnowledgeBase:
+        return
+    where = state.statement.whereclause
+    query = select(KnowledgeBase.id) if where is None else select(KnowledgeBase.id).where(where)
+    ids = state.session.execute(query).scalars().all()
+    _log_knowledge_changes(state.session.connection(), ids, deleted=True)
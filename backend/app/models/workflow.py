@@ -44,6 +44,8 @@ class Workflow(Base):
     variables = Column(JSON, default=dict)
     is_template = Column(Boolean, default=False)
     is_public = Column(Boolean, default=False)
+    # Background workflows queue their agent calls behind interactive traffic
+    is_background = Column(Boolean, default=False)
 
     # Status
     status = Column(String(20), default=WorkflowStatus.DRAFT.value)
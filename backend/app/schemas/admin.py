@@ -19,9 +19,10 @@ class AuditLogResponse(BaseModel):
 
 class AuditLogListResponse(BaseModel):
     logs: List[AuditLogResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class AnnouncementCreate(BaseModel):
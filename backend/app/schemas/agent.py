@@ -65,9 +65,10 @@ class AgentResponse(AgentBase):
 
 class AgentListResponse(BaseModel):
     agents: List[AgentResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class AgentExecuteRequest(BaseModel):
@@ -82,3 +83,4 @@ class AgentExecuteResponse(BaseModel):
     tokens_used: int = 0
     cost: float = 0.0
     duration_ms: int = 0
+    cached: bool = False
@@ -85,3 +85,4 @@ class UsageStatsResponse(BaseModel):
     total_tokens: int
     total_cost: float
     records: List[UsageRecordResponse]
+    next_cursor: Optional[str] = None
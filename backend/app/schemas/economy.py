@@ -30,9 +30,10 @@ class CreditTransactionResponse(BaseModel):
 
 class TransactionListResponse(BaseModel):
     transactions: List[CreditTransactionResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class AddCreditsRequest(BaseModel):
@@ -40,12 +41,30 @@ class AddCreditsRequest(BaseModel):
     amount: float = Field(..., gt=0)
     transaction_type: str = Field(default="bonus", pattern="^(earned|bonus|refund)$")
     description: str = ""
+    reference_id: Optional[str] = Field(default=None, max_length=180)
 
 
 class SpendCreditsRequest(BaseModel):
     user_id: UUID
     amount: float = Field(..., gt=0)
     description: str = ""
+    reference_id: Optional[str] = Field(default=None, max_length=180)
+
+
+class TransferItem(BaseModel):
+    from_user_id: UUID
+    to_user_id: UUID
+    amount: float = Field(..., gt=0)
+    description: str = ""
+
+
+class TransferCreditsRequest(BaseModel):
+    transfers: List[TransferItem] = Field(..., min_length=1, max_length=500)
+    reference_id: Optional[str] = Field(default=None, max_length=180)
+
+
+class TransferCreditsResponse(BaseModel):
+    transactions: List[CreditTransactionResponse]
 
 
 class LeaderboardEntry(BaseModel):
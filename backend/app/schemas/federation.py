@@ -47,3 +47,31 @@ class FederationNodeListResponse(BaseModel):
 class FederatedAgentListResponse(BaseModel):
     agents: List[FederatedAgentResponse]
     total: int
+
+
+class AgentChange(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    name: str
+    description: str
+    category: str
+    average_rating: Optional[float] = None
+    updated_at: datetime
+
+
+class AgentChangesResponse(BaseModel):
+    agents: List[AgentChange]
+    deleted: List[UUID]
+    next_watermark: Optional[str] = None
+    has_more: bool
+
+
+class NodeSyncResult(BaseModel):
+    node_id: UUID
+    agents_synced: int
+
+
+class FederationSyncResponse(BaseModel):
+    results: List[NodeSyncResult]
+    total_agents: int
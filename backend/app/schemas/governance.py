@@ -29,9 +29,10 @@ class ProposalResponse(BaseModel):
 
 class ProposalListResponse(BaseModel):
     proposals: List[ProposalResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class VoteCreate(BaseModel):
@@ -35,9 +35,10 @@ class MemoryResponse(BaseModel):
 
 class MemoryListResponse(BaseModel):
     memories: List[MemoryResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class MemorySearchRequest(BaseModel):
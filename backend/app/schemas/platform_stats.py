@@ -18,6 +18,8 @@ class PlatformStatsResponse(BaseModel):
     top_models: Optional[List[Any]] = None
     top_agents: Optional[List[Any]] = None
     benchmark_trends: Optional[List[Any]] = None
+    refreshed_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
 
 class PlatformSnapshotResponse(BaseModel):
@@ -43,9 +43,10 @@ class TrainingJobResponse(BaseModel):
 
 class TrainingJobListResponse(BaseModel):
     jobs: List[TrainingJobResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class FineTunedModelResponse(BaseModel):
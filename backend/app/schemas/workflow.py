@@ -34,6 +34,7 @@ class WorkflowCreate(BaseModel):
     variables: Dict[str, Any] = {}
     is_template: bool = False
     is_public: bool = False
+    is_background: bool = False
 
 
 class WorkflowUpdate(BaseModel):
@@ -43,6 +44,7 @@ class WorkflowUpdate(BaseModel):
     variables: Optional[Dict[str, Any]] = None
     is_template: Optional[bool] = None
     is_public: Optional[bool] = None
+    is_background: Optional[bool] = None
     status: Optional[str] = None
 
 
@@ -57,6 +59,7 @@ class WorkflowResponse(BaseModel):
     status: str
     is_template: bool
     is_public: bool
+    is_background: bool
     variables: Dict[str, Any] = {}
     total_runs: int
     average_duration: float
@@ -67,9 +70,10 @@ class WorkflowResponse(BaseModel):
 
 class WorkflowListResponse(BaseModel):
     workflows: List[WorkflowResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class WorkflowExecuteRequest(BaseModel):
@@ -8,6 +8,7 @@ from app.models.user import User
 from app.models.agent import Agent
 from app.models.economy import CreditAccount
 from app.models.benchmark import BenchmarkResult
+from app.services.pagination import paginate
 
 
 def log_action(
@@ -37,15 +38,12 @@ def get_all_users(
     db: Session,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[User], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[User], Optional[int]]:
     query = db.query(User)
-    total = query.count()
-    users = (
-        query.order_by(desc(User.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
+    total = query.count() if with_total else None
+    users = paginate(query, User.created_at, User.id, page, page_size, cursor)
     return users, total
 
 
@@ -189,15 +187,12 @@ def get_audit_log(
     db: Session,
     page: int = 1,
     page_size: int = 50,
-) -> Tuple[List[AuditLog], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[AuditLog], Optional[int]]:
     query = db.query(AuditLog)
-    total = query.count()
-    logs = (
-        query.order_by(desc(AuditLog.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
+    total = query.count() if with_total else None
+    logs = paginate(query, AuditLog.created_at, AuditLog.id, page, page_size, cursor)
     return logs, total
 
 
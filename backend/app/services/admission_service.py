@@ -0,0 +1,168 @@
+"""
+Admission service - per-provider concurrency limits and token budgets with
+priority queues for outbound LLM calls.
+
+Each provider gets a gate admitting at most ``max_concurrency`` calls at once
+and spending from a tokens-per-minute bucket. Waiting calls are served in
+strict priority order (interactive runs before workflows before background
+evaluation), FIFO within a priority. Queue depth and time spent waiting are
+exported through ``/metrics``.
+"""
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+    BACKGROUND = 2
+
+
+class ProviderGate:
+    """Admission for one provider: a concurrency cap plus a token bucket.
+
+    ``tokens_per_minute`` of 0 disables the budget. A request larger than the
+    bucket is clamped to it, so it waits for a full bucket instead of forever.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int = 0):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    def queue_depth(self, priority: Optional[Priority] = None) -> int:
+        return sum(
+            1 for p, _, _, future in self._waiters
+            if not future.done() and (priority is None or p == priority)
+        )
+
+    def _refill(self) -> None:
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0,
+        )
+        self._refilled_at = now
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._waiters and self.in_flight < self.max_concurrency:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens_per_minute and self._tokens < tokens:
+                # Head of line waits for the bucket; wake up when it has refilled enough
+                delay = (tokens - self._tokens) * 60.0 / self.tokens_per_minute
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._admit(tokens)
+            future.set_result(None)
+
+    def _admit(self, tokens: int) -> None:
+        self.in_flight += 1
+        if self.tokens_per_minute:
+            self._tokens -= tokens
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, tokens: int = 0) -> float:
+        """Wait for admission; returns the seconds spent waiting."""
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        self._refill()
+        started = time.monotonic()
+        if (
+            not self.queue_depth()
+            and self.in_flight < self.max_concurrency
+            and (not self.tokens_per_minute or self._tokens >= tokens)
+        ):
+            self._admit(tokens)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._sequence), tokens, future))
+            if self._timer is None:
+                self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Admitted just as we were cancelled: hand the slot back
+                    self.release()
+                raise
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.wait_seconds_sum += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return waited
+
+    def release(self, refund_tokens: int = 0) -> None:
+        """Free a slot; ``refund_tokens`` returns an over-estimate to the bucket."""
+        self.in_flight -= 1
+        if self.tokens_per_minute and refund_tokens:
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + refund_tokens)
+        if self._waiters and self._timer is None:
+            self._dispatch()
+
+
+class AdmissionController:
+    """Lazily creates one ``ProviderGate`` per provider from settings."""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None):
+        self.limits = limits if limits is not None else settings.llm_provider_limits
+        self.gates: Dict[str, ProviderGate] = {}
+
+    def gate(self, provider: str) -> ProviderGate:
+        gate = self.gates.get(provider)
+        if gate is None:
+            limits = self.limits.get(provider, {})
+            # A local Ollama server only decodes OLLAMA_NUM_PARALLEL sequences at once
+            default_concurrency = settings.ollama_max_parallel if provider == "ollama" else settings.llm_max_concurrency
+            gate = self.gates[provider] = ProviderGate(
+                max_concurrency=limits.get("max_concurrency", default_concurrency),
+                tokens_per_minute=limits.get("tokens_per_minute", settings.llm_tokens_per_minute),
+            )
+        return gate
+
+    @asynccontextmanager
+    async def admit(
+        self, provider: str, priority: Priority = Priority.INTERACTIVE, tokens: int = 0,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Hold a slot for one call. Set ``ticket["tokens_used"]`` to refund unused budget."""
+        gate = self.gate(provider)
+        await gate.acquire(priority, tokens)
+        ticket: Dict[str, Any] = {"tokens_reserved": tokens, "tokens_used": None}
+        try:
+            yield ticket
+        finally:
+            used = ticket["tokens_used"]
+            gate.release(max(0, tokens - used) if used is not None else 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            provider: {
+                "in_flight": gate.in_flight,
+                "queue_depth": {p.name.lower(): gate.queue_depth(p) for p in Priority},
+                "admitted": gate.admitted,
+                "wait_seconds_sum": gate.wait_seconds_sum,
+                "wait_seconds_max": gate.wait_seconds_max,
+            }
+            for provider, gate in self.gates.items()
+        }
@@ -1,11 +1,13 @@
+import re
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional, List, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from app.models.agent import Agent, AgentStatus
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import or_, func, text, literal_column, Float, Integer
+from app.models.agent import Agent, AgentStatus, AGENT_SEARCH_DOCUMENT, AGENT_FTS_TABLE
 from app.schemas.agent import AgentCreate, AgentUpdate
 from app.services.utils import generate_slug
+from app.services.pagination import paginate
 
 
 def create_agent(db: Session, agent_data: AgentCreate, publisher_id: uuid.UUID) -> Agent:
@@ -42,6 +44,50 @@ def get_agent_by_slug(db: Session, slug: str) -> Optional[Agent]:
     return db.query(Agent).filter(Agent.slug == slug).first()
 
 
+def _search_terms(search: str) -> List[str]:
+    return re.findall(r"\w+", search.lower())
+
+
+def _apply_search(db: Session, query: Query, search: str, ranked: bool = True) -> Query:
+    """Filter to agents matching every search term (as a prefix), best matches first.
+
+    Postgres matches against the GIN-indexed tsvector and ranks with length-normalised
+    ts_rank_cd; SQLite uses FTS5 with bm25(). Name hits outweigh description, long
+    description and tags on both. ``ranked=False`` keeps only the filter, for keyset pages.
+    """
+    terms = _search_terms(search)
+    dialect = db.get_bind().dialect.name
+    if terms and dialect == "postgresql":
+        document = literal_column(f"({AGENT_SEARCH_DOCUMENT})")
+        ts_query = func.to_tsquery(
+            literal_column("'english'::regconfig"), " & ".join(f"{term}:*" for term in terms)
+        )
+        query = query.filter(document.op("@@")(ts_query))
+        return query.order_by(func.ts_rank_cd(document, ts_query, 32).desc()) if ranked else query
+    if terms and dialect == "sqlite":
+        matches = (
+            text(
+                f"SELECT rowid, bm25({AGENT_FTS_TABLE}, 10.0, 4.0, 1.0, 2.0) AS rank "
+                f"FROM {AGENT_FTS_TABLE} WHERE {AGENT_FTS_TABLE} MATCH :fts_query"
+            )
+            .bindparams(fts_query=" ".join(f'"{term}"*' for term in terms))
+            .columns(rowid=Integer, rank=Float)
+            .subquery("search_matches")
+        )
+        query = query.join(matches, matches.c.rowid == literal_column("agents.rowid"))
+        # bm25() is lower-is-better
+        return query.order_by(matches.c.rank) if ranked else query
+
+    search_term = f"%{search}%"
+    return query.filter(
+        or_(
+            Agent.name.ilike(search_term),
+            Agent.description.ilike(search_term),
+            Agent.long_description.ilike(search_term),
+        )
+    )
+
+
 def list_agents(
     db: Session,
     category: Optional[str] = None,
@@ -49,7 +95,9 @@ def list_agents(
     status: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[Agent], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[Agent], Optional[int]]:
     query = db.query(Agent)
 
     if status:
@@ -61,16 +109,10 @@ def list_agents(
         query = query.filter(Agent.category == category)
 
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Agent.name.ilike(search_term),
-                Agent.description.ilike(search_term),
-            )
-        )
+        query = _apply_search(db, query, search, ranked=cursor is None)
 
-    total = query.count()
-    agents = query.order_by(Agent.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    total = query.count() if with_total else None
+    agents = paginate(query, Agent.created_at, Agent.id, page, page_size, cursor)
 
     return agents, total
 
@@ -2,14 +2,23 @@ import uuid
 import hashlib
 import secrets
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from app.models.billing import ApiKey, BillingPlan, Subscription, UsageRecord
+from sqlalchemy import and_, desc, func, insert, or_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models.billing import ApiKey, BillingPlan, Subscription, UsageRecord, UsageRollup, UsageRollupCoverage
+from app.config import settings
+from app.services.cache_service import build_api_key_cache
+from app.services.usage_counter_service import api_key_rate_counter, api_key_usage
+from app.services.usage_ingest_service import usage_ingestor
+from app.services.pagination import paginate, next_cursor
 
 
 TIER_RATE_LIMITS = {"free": 100, "pro": 1000, "enterprise": 10000}
 
+api_key_cache = build_api_key_cache()
+
 
 def create_api_key(
     db: Session,
@@ -34,34 +43,50 @@ def create_api_key(
     return api_key, raw_key
 
 
+def _api_key_snapshot(api_key: ApiKey) -> dict:
+    return {
+        "id": api_key.id,
+        "user_id": api_key.user_id,
+        "name": api_key.name,
+        "tier": api_key.tier,
+        "rate_limit": api_key.rate_limit,
+        "is_active": api_key.is_active,
+        "created_at": api_key.created_at,
+        "expires_at": api_key.expires_at,
+    }
+
+
 def validate_api_key(db: Session, key: str) -> Optional[ApiKey]:
+    """Return the key if it is active, unexpired and under its rate limit.
+
+    Cache hits skip the database and return a detached, read-only ApiKey built
+    from the cached snapshot (usage_count and last_used_at are not populated).
+    """
     key_hash = hashlib.sha256(key.encode()).hexdigest()
-    api_key = (
-        db.query(ApiKey)
-        .filter(ApiKey.key_hash == key_hash, ApiKey.is_active.is_(True))
-        .first()
-    )
-    if not api_key:
-        return None
+    cached = api_key_cache.get(key_hash) if settings.api_key_cache_enabled else None
+    if cached is not None:
+        api_key = ApiKey(**cached)
+    else:
+        api_key = (
+            db.query(ApiKey)
+            .filter(ApiKey.key_hash == key_hash, ApiKey.is_active.is_(True))
+            .first()
+        )
+        if not api_key:
+            return None
+        if settings.api_key_cache_enabled:
+            api_key_cache.set(key_hash, _api_key_snapshot(api_key))
 
     if api_key.expires_at and datetime.utcnow() > api_key.expires_at:
         return None
 
-    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-    recent_usage = (
-        db.query(func.count(UsageRecord.id))
-        .filter(
-            UsageRecord.api_key_id == api_key.id,
-            UsageRecord.created_at >= one_hour_ago,
-        )
-        .scalar()
-    )
-    if recent_usage >= api_key.rate_limit:
+    allowed, _ = api_key_rate_counter.hit(str(api_key.id), api_key.rate_limit)
+    if not allowed:
         return None
 
-    api_key.last_used_at = datetime.utcnow()
-    api_key.usage_count += 1
-    db.commit()
+    # usage_count / last_used_at are written behind in batches
+    api_key_usage.record(api_key.id)
+    api_key_usage.flush_if_due()
     return api_key
 
 
@@ -81,6 +106,7 @@ def revoke_api_key(db: Session, key_id: uuid.UUID) -> Optional[ApiKey]:
     api_key.is_active = False
     db.commit()
     db.refresh(api_key)
+    api_key_cache.invalidate(api_key.key_hash)
     return api_key
 
 
@@ -134,43 +160,224 @@ def record_usage(
     tokens: int = 0,
     cost: float = 0.0,
 ) -> UsageRecord:
-    record = UsageRecord(
-        user_id=user_id,
-        api_key_id=api_key_id,
-        endpoint=endpoint,
-        method=method,
-        tokens_used=tokens,
-        cost=cost,
-    )
-    db.add(record)
+    """Queue a usage record for the write-behind ingestor and return it unsaved."""
+    values = {
+        "id": uuid.uuid4(),
+        "user_id": user_id,
+        "api_key_id": api_key_id,
+        "endpoint": endpoint,
+        "method": method,
+        "tokens_used": tokens,
+        "cost": cost,
+        "created_at": datetime.utcnow(),
+    }
+    usage_ingestor.enqueue(db.get_bind(), UsageRecord, values)
+    return UsageRecord(**values)
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_deltas(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    deltas: Dict[Tuple[Any, str, datetime], List[float]] = {}
+    for row in rows:
+        created_at = row.get("created_at") or datetime.utcnow()
+        for granularity, bucket_start in (("hour", _hour(created_at)), ("day", _day(created_at))):
+            totals = deltas.setdefault((row["user_id"], granularity, bucket_start), [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += row.get("tokens_used") or 0
+            totals[2] += row.get("cost") or 0.0
+    return [
+        {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "granularity": granularity,
+            "bucket_start": bucket_start,
+            "requests": requests,
+            "tokens_used": tokens,
+            "cost": cost,
+        }
+        for (user_id, granularity, bucket_start), (requests, tokens, cost) in deltas.items()
+    ]
+
+
+# Set once this process has seen the coverage row in place
+_rollup_coverage_marked = False
+
+
+def _mark_rollup_coverage(connection: Any, rows: List[Dict[str, Any]]) -> None:
+    """On the first rollup write, record that rollups cover usage from the next hour on.
+
+    Everything before that hour, including records written before rollups
+    existed, keeps being summed from usage_records, so nothing is lost or
+    counted twice.
+    """
+    global _rollup_coverage_marked
+    if _rollup_coverage_marked:
+        return
+    table = UsageRollupCoverage.__table__
+    earliest = min(row.get("created_at") or datetime.utcnow() for row in rows)
+    row = {"id": 1, "covers_from": _hour(earliest) + timedelta(hours=1)}
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        connection.execute(dialect_insert(table).on_conflict_do_nothing(index_elements=["id"]), [row])
+    elif connection.execute(table.select().where(table.c.id == 1)).first() is None:
+        connection.execute(insert(table), [row])
+    _rollup_coverage_marked = True
+
+
+def _set_rollup_coverage(db: Session, covers_from: datetime) -> None:
+    coverage = db.get(UsageRollupCoverage, 1)
+    if coverage is None:
+        db.add(UsageRollupCoverage(id=1, covers_from=covers_from))
+    else:
+        coverage.covers_from = covers_from
+
+
+def apply_usage_rollups(connection: Any, rows: List[Dict[str, Any]]) -> None:
+    """Add freshly ingested usage records to their hourly and daily rollup buckets."""
+    deltas = _rollup_deltas(rows)
+    if not deltas:
+        return
+    _mark_rollup_coverage(connection, rows)
+    table = UsageRollup.__table__
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "granularity", "bucket_start"],
+            set_={
+                "requests": table.c.requests + statement.excluded.requests,
+                "tokens_used": table.c.tokens_used + statement.excluded.tokens_used,
+                "cost": table.c.cost + statement.excluded.cost,
+            },
+        )
+        connection.execute(statement, deltas)
+        return
+    for delta in deltas:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.user_id == delta["user_id"],
+                table.c.granularity == delta["granularity"],
+                table.c.bucket_start == delta["bucket_start"],
+            )
+            .values(
+                requests=table.c.requests + delta["requests"],
+                tokens_used=table.c.tokens_used + delta["tokens_used"],
+                cost=table.c.cost + delta["cost"],
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table), [delta])
+
+
+def rebuild_usage_rollups(db: Session, user_id: Optional[uuid.UUID] = None) -> int:
+    """Recompute rollups from raw usage records, e.g. for rows ingested before rollups existed."""
+    rollups = db.query(UsageRollup)
+    records = db.query(UsageRecord)
+    if user_id:
+        rollups = rollups.filter(UsageRollup.user_id == user_id)
+        records = records.filter(UsageRecord.user_id == user_id)
+    rollups.delete(synchronize_session=False)
+    rows = [
+        {"user_id": r.user_id, "tokens_used": r.tokens_used, "cost": r.cost, "created_at": r.created_at}
+        for r in records.yield_per(10000)
+    ]
+    apply_usage_rollups(db.connection(), rows)
+    if user_id is None:
+        # Every record is rolled up now, so raw records are no longer needed for totals
+        _set_rollup_coverage(db, datetime(1970, 1, 1))
     db.commit()
-    db.refresh(record)
-    return record
+    return len(rows)
+
+
+usage_ingestor.add_flush_hook(UsageRecord.__table__, apply_usage_rollups)
 
 
 def get_usage(
     db: Session,
     user_id: uuid.UUID,
     period: str = "month",
+    include_records: bool = False,
+    cursor: Optional[str] = None,
+    page_size: int = 100,
 ) -> dict:
+    """Usage totals for the period, answered from rollups at hour granularity.
+
+    Whole days inside the window come from daily buckets and the partial days at
+    either end from hourly ones. The part of the window before rollups started
+    covering usage (see UsageRollupCoverage) is summed from raw records. Raw
+    records are only listed when requested, one keyset page at a time.
+    """
     period_map = {"day": 1, "week": 7, "month": 30}
     days = period_map.get(period, 30)
-    since = datetime.utcnow() - timedelta(days=days)
+    now = datetime.utcnow()
+    since = now - timedelta(days=days)
+    covers_from = db.query(UsageRollupCoverage.covers_from).filter(UsageRollupCoverage.id == 1).scalar() or now
 
-    records = (
-        db.query(UsageRecord)
-        .filter(UsageRecord.user_id == user_id, UsageRecord.created_at >= since)
-        .order_by(desc(UsageRecord.created_at))
-        .all()
-    )
+    totals = [0, 0, 0.0]
+    if since < covers_from:
+        raw = (
+            db.query(
+                func.count(UsageRecord.id),
+                func.coalesce(func.sum(UsageRecord.tokens_used), 0),
+                func.coalesce(func.sum(UsageRecord.cost), 0.0),
+            )
+            .filter(
+                UsageRecord.user_id == user_id,
+                UsageRecord.created_at >= since,
+                UsageRecord.created_at < covers_from,
+            )
+            .one()
+        )
+        totals = [a + b for a, b in zip(totals, raw)]
+
+    rollup_since = max(since, covers_from)
+    if rollup_since < now:
+        first_full_day = _day(rollup_since) if rollup_since == _day(rollup_since) else _day(rollup_since) + timedelta(days=1)
+        today = _day(now)
+        hourly = UsageRollup.granularity == "hour"
+        daily = UsageRollup.granularity == "day"
+        rolled = (
+            db.query(
+                func.coalesce(func.sum(UsageRollup.requests), 0),
+                func.coalesce(func.sum(UsageRollup.tokens_used), 0),
+                func.coalesce(func.sum(UsageRollup.cost), 0.0),
+            )
+            .filter(
+                UsageRollup.user_id == user_id,
+                or_(
+                    and_(
+                        hourly,
+                        UsageRollup.bucket_start >= _hour(rollup_since),
+                        UsageRollup.bucket_start < min(first_full_day, today),
+                    ),
+                    and_(daily, UsageRollup.bucket_start >= first_full_day, UsageRollup.bucket_start < today),
+                    and_(hourly, UsageRollup.bucket_start >= max(today, _hour(rollup_since))),
+                ),
+            )
+            .one()
+        )
+        totals = [a + b for a, b in zip(totals, rolled)]
 
-    total_tokens = sum(r.tokens_used for r in records)
-    total_cost = sum(r.cost for r in records)
+    records: List[UsageRecord] = []
+    if include_records:
+        query = db.query(UsageRecord).filter(UsageRecord.user_id == user_id, UsageRecord.created_at >= since)
+        records = paginate(query, UsageRecord.created_at, UsageRecord.id, page_size=page_size, cursor=cursor)
 
     return {
         "user_id": user_id,
-        "total_requests": len(records),
-        "total_tokens": total_tokens,
-        "total_cost": total_cost,
+        "total_requests": int(totals[0]),
+        "total_tokens": int(totals[1]),
+        "total_cost": float(totals[2]),
         "records": records,
+        "next_cursor": next_cursor(records, page_size) if include_records else None,
     }
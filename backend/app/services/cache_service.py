@@ -0,0 +1,311 @@
+"""
+Completion cache - content-addressed cache for provider completions.
+Entries are keyed on provider, model, messages and max_tokens. An in-process
+LRU tier with TTL sits in front of an optional Redis tier shared across workers.
+The semantic cache additionally matches near-duplicate user messages per agent
+by cosine similarity of their memory-service embeddings. The API key cache
+holds validated key snapshots and drops them on revocation across workers.
+"""
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+from app.config import settings
+from app.services.memory_service import generate_embedding, cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+
+def completion_cache_key(
+    provider: str, model: str, messages: List[Dict[str, str]], max_tokens: int
+) -> str:
+    payload = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """In-process LRU cache whose entries expire after ``ttl_seconds``."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CompletionCache:
+    """Two-tier completion cache: in-process LRU, then Redis when enabled."""
+
+    REDIS_PREFIX = "completion:"
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        redis_url: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.redis_url = redis_url
+        self._redis: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_redis(self) -> Any:
+        if self.redis_url and self._redis is None:
+            import redis.asyncio as redis_asyncio
+
+            self._redis = redis_asyncio.from_url(self.redis_url, socket_connect_timeout=2)
+        return self._redis
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.local.get(key)
+        if value is None:
+            value = await self._redis_get(key)
+            if value is not None:
+                self.local.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.local.set(key, value)
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(self.REDIS_PREFIX + key, json.dumps(value), ex=int(self.ttl_seconds))
+        except Exception as exc:
+            logger.warning("Completion cache Redis write failed: %s", exc)
+
+    async def _redis_get(self, key: str) -> Optional[Dict[str, Any]]:
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self.REDIS_PREFIX + key)
+        except Exception as exc:
+            logger.warning("Completion cache Redis read failed: %s", exc)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def clear(self) -> None:
+        self.local.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class SemanticEntry:
+    def __init__(self, scope: str, embedding: List[float], value: Dict[str, Any], expires_at: float):
+        self.scope = scope
+        self.embedding = embedding
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    """Per-agent cache of completions looked up by user-message similarity.
+
+    ``scope`` pins a hit to the same provider, model, system prompt and max_tokens,
+    so only the user message is compared approximately.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        ttl_seconds: float = 3600.0,
+        max_entries_per_agent: int = 500,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_agent = max_entries_per_agent
+        self._entries: Dict[str, Deque[SemanticEntry]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self,
+        agent_key: str,
+        scope: str,
+        text: str,
+        threshold: Optional[float] = None,
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return (value, similarity) of the closest live entry above the threshold."""
+        minimum = self.threshold if threshold is None else threshold
+        entries = self._entries.get(agent_key)
+        best: Optional[SemanticEntry] = None
+        best_score = minimum
+        if entries:
+            now = time.monotonic()
+            live = [e for e in entries if e.expires_at > now]
+            if len(live) != len(entries):
+                self._entries[agent_key] = deque(live, maxlen=self.max_entries_per_agent)
+            embedding = generate_embedding(text)
+            for entry in live:
+                if entry.scope != scope:
+                    continue
+                score = cosine_similarity(embedding, entry.embedding)
+                if score >= best_score:
+                    best, best_score = entry, score
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return best.value, best_score
+
+    def store(self, agent_key: str, scope: str, text: str, value: Dict[str, Any]) -> None:
+        entries = self._entries.setdefault(agent_key, deque(maxlen=self.max_entries_per_agent))
+        entries.append(
+            SemanticEntry(scope, generate_embedding(text), value, time.monotonic() + self.ttl_seconds)
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class ApiKeyCache:
+    """Thread-safe LRU/TTL cache of validated API keys, keyed on the key's SHA-256 hash.
+
+    Revocations are broadcast on a Redis channel when ``redis_url`` is set; every
+    worker that called ``start_listener()`` drops the entry as soon as the message
+    arrives. The TTL bounds staleness if a message is missed or Redis is down.
+    """
+
+    CHANNEL = "api-key-invalidations"
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 60.0,
+        redis_url: Optional[str] = None,
+    ):
+        self.local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.redis_url = redis_url
+        self._lock = threading.Lock()
+        self._redis: Any = None
+        self._listener: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self.local.get(key_hash)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key_hash: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self.local.set(key_hash, value)
+
+    def invalidate(self, key_hash: str, publish: bool = True) -> None:
+        with self._lock:
+            self.local.delete(key_hash)
+        if publish and self.redis_url:
+            try:
+                self._get_redis().publish(self.CHANNEL, key_hash)
+            except Exception as exc:
+                logger.warning("API key invalidation publish failed: %s", exc)
+
+    def _get_redis(self) -> Any:
+        if self._redis is None:
+            import redis as redis_lib
+
+            self._redis = redis_lib.from_url(self.redis_url, socket_connect_timeout=2)
+        return self._redis
+
+    def _on_message(self, message: Dict[str, Any]) -> None:
+        data = message.get("data")
+        if isinstance(data, bytes):
+            self.invalidate(data.decode("utf-8"), publish=False)
+
+    def start_listener(self) -> None:
+        if not self.redis_url or self._listener is not None:
+            return
+        try:
+            pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.CHANNEL: self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+        except Exception as exc:
+            logger.warning("API key invalidation listener unavailable, relying on TTL: %s", exc)
+
+    def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self.local.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def build_completion_cache() -> CompletionCache:
+    return CompletionCache(
+        max_entries=settings.completion_cache_max_entries,
+        ttl_seconds=settings.completion_cache_ttl_seconds,
+        redis_url=settings.redis_url if settings.completion_cache_redis else None,
+    )
+
+
+def build_semantic_cache() -> SemanticCache:
+    return SemanticCache(
+        threshold=settings.semantic_cache_threshold,
+        ttl_seconds=settings.semantic_cache_ttl_seconds,
+        max_entries_per_agent=settings.semantic_cache_max_entries_per_agent,
+    )
+
+
+def build_api_key_cache() -> ApiKeyCache:
+    return ApiKeyCache(
+        max_entries=settings.api_key_cache_max_entries,
+        ttl_seconds=settings.api_key_cache_ttl_seconds,
+        redis_url=settings.redis_url if settings.api_key_cache_redis else None,
+    )
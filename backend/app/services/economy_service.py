@@ -1,8 +1,27 @@
+"""
+Economy service - credit accounts and an append-only transaction ledger.
+
+Balance changes are single conditional UPDATEs evaluated by the database
+(``balance = balance - :amount WHERE balance >= :amount``), so concurrent spends
+can never overdraw an account however requests interleave. A ``reference_id``
+makes a change idempotent: it is unique per account, and replaying it returns
+the transaction already recorded instead of moving credits twice.
+"""
 import uuid
-from typing import Optional, List, Tuple
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional, List, Tuple
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, insert, update
 from app.models.economy import CreditAccount, CreditTransaction
+from app.services.pagination import paginate
+
+
+class CreditTransfer(NamedTuple):
+    from_user_id: uuid.UUID
+    to_user_id: uuid.UUID
+    amount: float
+    description: str = ""
 
 
 def get_or_create_account(db: Session, user_id: uuid.UUID) -> CreditAccount:
@@ -10,7 +29,12 @@ def get_or_create_account(db: Session, user_id: uuid.UUID) -> CreditAccount:
     if not account:
         account = CreditAccount(user_id=user_id)
         db.add(account)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created it first
+            db.rollback()
+            return db.query(CreditAccount).filter(CreditAccount.user_id == user_id).one()
         db.refresh(account)
     return account
 
@@ -20,27 +44,99 @@ def get_balance(db: Session, user_id: uuid.UUID) -> float:
     return account.balance
 
 
+def _account_id(db: Session, user_id: uuid.UUID) -> uuid.UUID:
+    account_id = db.query(CreditAccount.id).filter(CreditAccount.user_id == user_id).scalar()
+    return account_id if account_id is not None else get_or_create_account(db, user_id).id
+
+
+def _find_reference(
+    db: Session, account_id: uuid.UUID, reference_id: Optional[str],
+) -> Optional[CreditTransaction]:
+    if reference_id is None:
+        return None
+    return (
+        db.query(CreditTransaction)
+        .filter(CreditTransaction.account_id == account_id, CreditTransaction.reference_id == reference_id)
+        .first()
+    )
+
+
+def _apply_delta(db: Session, account_id: uuid.UUID, amount: float) -> bool:
+    """Atomically move ``amount`` in or out of an account; debits never overdraw.
+
+    Returns False when a debit would take the balance below zero.
+    """
+    table = CreditAccount.__table__
+    statement = update(table).where(table.c.id == account_id)
+    if amount < 0:
+        statement = statement.where(table.c.balance >= -amount).values(
+            balance=table.c.balance + amount,
+            total_spent=table.c.total_spent - amount,
+            updated_at=datetime.utcnow(),
+        )
+    else:
+        statement = statement.values(
+            balance=table.c.balance + amount,
+            total_earned=table.c.total_earned + amount,
+            updated_at=datetime.utcnow(),
+        )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(statement.returning(table.c.balance)).first() is not None
+    return db.execute(statement).rowcount == 1
+
+
+def _record(
+    db: Session,
+    rows: List[Dict[str, Any]],
+) -> List[CreditTransaction]:
+    """Insert ledger rows in one statement and commit, without a refresh per row."""
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("id", uuid.uuid4())
+        row.setdefault("created_at", now)
+    db.execute(insert(CreditTransaction), rows)
+    db.commit()
+    return [CreditTransaction(**row) for row in rows]
+
+
+def _apply(
+    db: Session,
+    account_id: uuid.UUID,
+    amount: float,
+    transaction_type: str,
+    description: str,
+    reference_id: Optional[str],
+) -> Optional[CreditTransaction]:
+    existing = _find_reference(db, account_id, reference_id)
+    if existing:
+        return existing
+    delta = -amount if transaction_type == "spent" else amount
+    if not _apply_delta(db, account_id, delta):
+        db.rollback()
+        return None
+    try:
+        return _record(db, [{
+            "account_id": account_id,
+            "amount": amount,
+            "transaction_type": transaction_type,
+            "description": description,
+            "reference_id": reference_id,
+        }])[0]
+    except IntegrityError:
+        # A concurrent request with the same reference won; its change stands alone
+        db.rollback()
+        return _find_reference(db, account_id, reference_id)
+
+
 def add_credits(
     db: Session,
     user_id: uuid.UUID,
     amount: float,
     transaction_type: str = "bonus",
     description: str = "",
+    reference_id: Optional[str] = None,
 ) -> CreditTransaction:
-    account = get_or_create_account(db, user_id)
-    account.balance += amount
-    account.total_earned += amount
-
-    transaction = CreditTransaction(
-        account_id=account.id,
-        amount=amount,
-        transaction_type=transaction_type,
-        description=description,
-    )
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-    return transaction
+    return _apply(db, _account_id(db, user_id), amount, transaction_type, description, reference_id)
 
 
 def spend_credits(
@@ -48,24 +144,76 @@ def spend_credits(
     user_id: uuid.UUID,
     amount: float,
     description: str = "",
+    reference_id: Optional[str] = None,
 ) -> Optional[CreditTransaction]:
-    account = get_or_create_account(db, user_id)
-    if account.balance < amount:
-        return None
+    """Debit ``amount`` if the balance covers it; returns None when it does not."""
+    return _apply(db, _account_id(db, user_id), amount, "spent", description, reference_id)
 
-    account.balance -= amount
-    account.total_spent += amount
 
-    transaction = CreditTransaction(
-        account_id=account.id,
-        amount=amount,
-        transaction_type="spent",
-        description=description,
+def transfer_credits(
+    db: Session,
+    transfers: List[CreditTransfer],
+    reference_id: Optional[str] = None,
+) -> Optional[List[CreditTransaction]]:
+    """Apply a batch of transfers all-or-nothing in one database transaction.
+
+    Debits and credits are netted per account and applied in account-id order,
+    so concurrent batches lock rows in the same order and cannot deadlock.
+    Returns None, with nothing applied, if any account would be overdrawn.
+    With ``reference_id`` each leg is recorded as ``<reference_id>:<n>``, and
+    replaying the batch returns the transactions already recorded.
+    """
+    if not transfers:
+        return []
+    account_ids = {}
+    for transfer in transfers:
+        for user_id in (transfer.from_user_id, transfer.to_user_id):
+            if user_id not in account_ids:
+                account_ids[user_id] = _account_id(db, user_id)
+
+    rows: List[Dict[str, Any]] = []
+    deltas: Dict[uuid.UUID, float] = {}
+    for index, transfer in enumerate(transfers):
+        legs = (
+            (account_ids[transfer.from_user_id], -transfer.amount, "transfer_out"),
+            (account_ids[transfer.to_user_id], transfer.amount, "transfer_in"),
+        )
+        for leg, (account_id, delta, transaction_type) in enumerate(legs):
+            deltas[account_id] = deltas.get(account_id, 0.0) + delta
+            rows.append({
+                "account_id": account_id,
+                "amount": transfer.amount,
+                "transaction_type": transaction_type,
+                "description": transfer.description,
+                "reference_id": f"{reference_id}:{index * 2 + leg}" if reference_id else None,
+            })
+
+    if reference_id:
+        existing = _find_batch(db, rows)
+        if existing:
+            return existing
+
+    for account_id in sorted(deltas, key=str):
+        if deltas[account_id] and not _apply_delta(db, account_id, deltas[account_id]):
+            db.rollback()
+            return None
+    try:
+        return _record(db, rows)
+    except IntegrityError:
+        db.rollback()
+        if reference_id:
+            return _find_batch(db, rows)
+        raise
+
+
+def _find_batch(db: Session, rows: List[Dict[str, Any]]) -> List[CreditTransaction]:
+    query = db.query(CreditTransaction).filter(
+        CreditTransaction.account_id.in_({row["account_id"] for row in rows}),
+        CreditTransaction.reference_id.in_([row["reference_id"] for row in rows]),
     )
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-    return transaction
+    found = {(t.account_id, t.reference_id): t for t in query}
+    keys = [(row["account_id"], row["reference_id"]) for row in rows]
+    return [found[key] for key in keys if key in found]
 
 
 def get_transactions(
@@ -73,15 +221,14 @@ def get_transactions(
     user_id: uuid.UUID,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[CreditTransaction], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[CreditTransaction], Optional[int]]:
     account = get_or_create_account(db, user_id)
     query = db.query(CreditTransaction).filter(CreditTransaction.account_id == account.id)
-    total = query.count()
-    transactions = (
-        query.order_by(desc(CreditTransaction.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
+    total = query.count() if with_total else None
+    transactions = paginate(
+        query, CreditTransaction.created_at, CreditTransaction.id, page, page_size, cursor,
     )
     return transactions, total
 
@@ -4,14 +4,29 @@ Routes to OpenAI, Anthropic, Mistral, Groq, or local Ollama based on config.
 Falls back to simulated response if no API keys are configured.
 """
 import uuid
+import json
+import asyncio
 import time
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import threading
+from collections import deque
+from typing import Dict, Any, Deque, Optional, List, AsyncIterator, Tuple
+from datetime import datetime, timedelta
 
 import httpx
 
 from app.config import settings
+from app.services.usage_ingest_service import usage_ingestor
+from app.services.admission_service import AdmissionController, Priority
+from app.services.token_budget import (
+    PromptBudgetError,
+    estimate_message_tokens,
+    fit_messages,
+)
+from app.services.resilience import CircuitBreaker, CircuitOpenError, backoff_delay, hedged, is_retryable
+from app.services.cache_service import (
+    build_completion_cache, build_semantic_cache, completion_cache_key,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +66,21 @@ PROVIDER_MODELS: Dict[str, List[str]] = {
     "ollama": [],
 }
 
+PROVIDER_BASE_URLS: Dict[str, str] = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com/v1",
+    "mistral": "https://api.mistral.ai/v1",
+    "groq": "https://api.groq.com/openai/v1",
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
 class ExecutionResult:
     def __init__(
@@ -62,6 +92,7 @@ class ExecutionResult:
         cost: float = 0.0,
         duration_ms: int = 0,
         error: Optional[str] = None,
+        cached: bool = False,
     ):
         self.execution_id = execution_id
         self.status = status
@@ -70,10 +101,70 @@ class ExecutionResult:
         self.cost = cost
         self.duration_ms = duration_ms
         self.error = error
+        self.cached = cached
+
+
+class ModelStats:
+    """Rolling outcome statistics for one provider/model, or for a whole provider.
+
+    Latency and throughput are EWMAs over successful calls; ``error_rate`` is an
+    EWMA over all calls. ``p95_ms`` comes from the last ``window`` latencies.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        self.alpha = alpha
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.samples = 0
+        self.ewma_latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.tokens_per_second: Optional[float] = None
+        # Demotion state: 0 means healthy; past deadlines admit one re-probe
+        self.demoted_until = 0.0
+        self.cooldown = 0.0
+        self.probing = False
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else self.alpha * value + (1 - self.alpha) * current
+
+    def observe(self, latency_ms: float, ok: bool, tokens_output: int = 0) -> None:
+        self.samples += 1
+        # Plain mean until there are enough samples for the EWMA to be unbiased
+        weight = max(self.alpha, 1.0 / self.samples)
+        self.error_rate = weight * (0.0 if ok else 1.0) + (1 - weight) * self.error_rate
+        if not ok:
+            return
+        self.latencies.append(latency_ms)
+        self.ewma_latency_ms = self._ewma(self.ewma_latency_ms, latency_ms)
+        if tokens_output and latency_ms > 0:
+            self.tokens_per_second = self._ewma(self.tokens_per_second, tokens_output / (latency_ms / 1000.0))
+
+    @property
+    def p95_ms(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "ewma_latency_ms": self.ewma_latency_ms,
+            "p95_latency_ms": self.p95_ms,
+            "error_rate": self.error_rate,
+            "tokens_per_second": self.tokens_per_second,
+            "demoted": self.demoted_until > time.monotonic(),
+        }
 
 
 class ModelRouter:
-    """Selects the best model based on task requirements and preferences."""
+    """Selects the best model based on task requirements, preferences and live health.
+
+    Every provider call feeds per-model and per-provider ``ModelStats``. A model
+    or provider whose error rate crosses ``error_threshold`` is demoted for a
+    cooldown, then re-probed with a single request: success restores it,
+    failure doubles the cooldown. ``optimize_for="speed"`` ranks the speed
+    candidates by observed EWMA latency instead of their static order.
+    """
 
     TASK_MODEL_MAP: Dict[str, Dict[str, str]] = {
         "coding": {"provider": "openai", "model": "gpt-4"},
@@ -100,6 +191,49 @@ class ModelRouter:
         {"provider": "openai", "model": "gpt-3.5-turbo"},
     ]
 
+    # Interchangeable models across providers, used for failover and hedging
+    MODEL_TIERS: List[List[Dict[str, str]]] = [
+        [
+            {"provider": "openai", "model": "gpt-4"},
+            {"provider": "openai", "model": "gpt-4-turbo"},
+            {"provider": "anthropic", "model": "claude-3-opus-20240229"},
+            {"provider": "mistral", "model": "mistral-large-latest"},
+        ],
+        [
+            {"provider": "anthropic", "model": "claude-3-sonnet-20240229"},
+            {"provider": "mistral", "model": "mistral-medium-latest"},
+            {"provider": "groq", "model": "llama-3.1-70b-versatile"},
+        ],
+        [
+            {"provider": "openai", "model": "gpt-3.5-turbo"},
+            {"provider": "anthropic", "model": "claude-3-haiku-20240307"},
+            {"provider": "mistral", "model": "mistral-small-latest"},
+            {"provider": "groq", "model": "llama-3.1-8b-instant"},
+            {"provider": "groq", "model": "mixtral-8x7b-32768"},
+        ],
+    ]
+
+    MAX_COOLDOWN_SECONDS = 600.0
+
+    def __init__(
+        self,
+        alpha: Optional[float] = None,
+        error_threshold: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        cooldown_seconds: Optional[float] = None,
+    ):
+        self.alpha = alpha if alpha is not None else settings.router_ewma_alpha
+        self.error_threshold = (
+            error_threshold if error_threshold is not None else settings.router_error_threshold
+        )
+        self.min_samples = min_samples if min_samples is not None else settings.router_min_samples
+        self.cooldown_seconds = (
+            cooldown_seconds if cooldown_seconds is not None else settings.router_cooldown_seconds
+        )
+        self.history_loaded = False
+        self._stats: Dict[Tuple[str, Optional[str]], ModelStats] = {}
+        self._lock = threading.Lock()
+
     def _provider_available(self, provider: str) -> bool:
         key_map = {
             "openai": settings.openai_api_key,
@@ -110,44 +244,170 @@ class ModelRouter:
         }
         return bool(key_map.get(provider))
 
-    def select_model(
+    def record(self, provider: str, model: str, latency_ms: float, ok: bool, tokens_output: int = 0) -> None:
+        """Feed one call outcome into the model's and the provider's statistics."""
+        now = time.monotonic()
+        with self._lock:
+            for key in ((provider, model), (provider, None)):
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = ModelStats(self.alpha)
+                stats.observe(latency_ms, ok, tokens_output)
+                if stats.probing:
+                    stats.probing = False
+                    if ok:
+                        stats.demoted_until = stats.cooldown = stats.error_rate = 0.0
+                    else:
+                        stats.cooldown = min(self.MAX_COOLDOWN_SECONDS, stats.cooldown * 2)
+                        stats.demoted_until = now + stats.cooldown
+                elif (
+                    not stats.demoted_until
+                    and stats.samples >= self.min_samples
+                    and stats.error_rate >= self.error_threshold
+                ):
+                    stats.cooldown = self.cooldown_seconds
+                    stats.demoted_until = now + stats.cooldown
+                    logger.warning(
+                        "Demoting %s for %.0fs (error rate %.2f)",
+                        model if key[1] else provider, stats.cooldown, stats.error_rate,
+                    )
+
+    def load_history(self, db: Any, minutes: Optional[float] = None, limit: int = 2000) -> int:
+        """Seed statistics from recent ModelUsage rows; returns how many were replayed."""
+        from app.models.model_usage import ModelUsage
+
+        since = datetime.utcnow() - timedelta(minutes=minutes or settings.router_history_minutes)
+        rows = (
+            db.query(
+                ModelUsage.model_provider, ModelUsage.model_name, ModelUsage.latency_ms,
+                ModelUsage.status, ModelUsage.tokens_output,
+            )
+            .filter(ModelUsage.created_at >= since)
+            .order_by(ModelUsage.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        for provider, model, latency_ms, status, tokens_output in reversed(rows):
+            self.record(provider, model, latency_ms or 0, status == "completed", tokens_output or 0)
+        self.history_loaded = True
+        return len(rows)
+
+    def stats(self, provider: str, model: Optional[str] = None) -> Optional[ModelStats]:
+        return self._stats.get((provider, model))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                f"{provider}/{model}" if model else provider: stats.as_dict()
+                for (provider, model), stats in self._stats.items()
+            }
+
+    def equivalents(self, provider: str, model: str) -> List[Dict[str, str]]:
+        """Healthy models on other providers in the same tier, fastest observed first."""
+        for tier in self.MODEL_TIERS:
+            if {"provider": provider, "model": model} in tier:
+                candidates = [
+                    c for c in tier
+                    if c["provider"] != provider and self._eligible(c["provider"], c["model"], True)
+                ]
+                return [c for _, c in sorted(enumerate(candidates), key=self._speed_rank)]
+        return []
+
+    def hedge_delay_ms(self, provider: str, model: str) -> float:
+        """How long to wait before hedging: the model's observed p95, once known."""
+        stats = self._stats.get((provider, model))
+        if stats is None or stats.samples < self.min_samples or stats.p95_ms is None:
+            return settings.llm_hedge_default_delay_ms
+        return max(settings.llm_hedge_min_delay_ms, stats.p95_ms)
+
+    def _eligible(self, provider: str, model: str, respect_health: bool) -> bool:
+        if not self._provider_available(provider):
+            return False
+        if not respect_health:
+            return True
+        now = time.monotonic()
+        for key in ((provider, None), (provider, model)):
+            stats = self._stats.get(key)
+            if stats is not None and stats.demoted_until > now:
+                return False
+        return True
+
+    def _claim(self, provider: str, model: str) -> None:
+        """Turn a lapsed demotion into an in-flight re-probe for the chosen model."""
+        now = time.monotonic()
+        with self._lock:
+            for key in ((provider, None), (provider, model)):
+                stats = self._stats.get(key)
+                if stats is not None and 0 < stats.demoted_until <= now:
+                    stats.probing = True
+                    stats.demoted_until = now + stats.cooldown
+
+    def _speed_rank(self, index_and_candidate: Tuple[int, Dict[str, str]]) -> Tuple[float, float, int]:
+        index, candidate = index_and_candidate
+        stats = self._stats.get((candidate["provider"], candidate["model"]))
+        if stats is None or stats.ewma_latency_ms is None:
+            return float("inf"), float("inf"), index
+        return stats.ewma_latency_ms, stats.p95_ms, index
+
+    def _select(
         self,
-        task_type: Optional[str] = None,
-        preferred_provider: Optional[str] = None,
-        preferred_model: Optional[str] = None,
-        optimize_for: str = "quality",
+        task_type: Optional[str],
+        preferred_provider: Optional[str],
+        preferred_model: Optional[str],
+        optimize_for: str,
+        respect_health: bool,
     ) -> Optional[Dict[str, str]]:
-        """Select best available model. Returns None if no providers configured."""
         if preferred_provider and preferred_model:
-            if self._provider_available(preferred_provider):
+            if self._eligible(preferred_provider, preferred_model, respect_health):
                 return {"provider": preferred_provider, "model": preferred_model}
 
         if optimize_for == "speed":
-            for candidate in self.SPEED_MODELS:
-                if self._provider_available(candidate["provider"]):
+            for _, candidate in sorted(enumerate(self.SPEED_MODELS), key=self._speed_rank):
+                if self._eligible(candidate["provider"], candidate["model"], respect_health):
                     return candidate
 
         if optimize_for == "cost":
             for candidate in self.COST_MODELS:
-                if self._provider_available(candidate["provider"]):
+                if self._eligible(candidate["provider"], candidate["model"], respect_health):
                     return candidate
 
         if task_type and task_type in self.TASK_MODEL_MAP:
             candidate = self.TASK_MODEL_MAP[task_type]
-            if self._provider_available(candidate["provider"]):
+            if self._eligible(candidate["provider"], candidate["model"], respect_health):
                 return candidate
 
         for provider, models in PROVIDER_MODELS.items():
             if provider == "ollama":
                 continue
-            if self._provider_available(provider) and models:
-                return {"provider": provider, "model": models[0]}
+            for model in models:
+                if self._eligible(provider, model, respect_health):
+                    return {"provider": provider, "model": model}
 
-        if self._provider_available("ollama"):
+        if self._eligible("ollama", "llama3", respect_health):
             return {"provider": "ollama", "model": "llama3"}
 
         return None
 
+    def select_model(
+        self,
+        task_type: Optional[str] = None,
+        preferred_provider: Optional[str] = None,
+        preferred_model: Optional[str] = None,
+        optimize_for: str = "quality",
+    ) -> Optional[Dict[str, str]]:
+        """Select best available model. Returns None if no providers configured.
+
+        Demoted models and providers are skipped while anything healthy is
+        available; if everything is demoted the static preference order applies.
+        """
+        for respect_health in (True, False):
+            choice = self._select(task_type, preferred_provider, preferred_model, optimize_for, respect_health)
+            if choice is not None:
+                if respect_health:
+                    self._claim(choice["provider"], choice["model"])
+                return choice
+        return None
+
 
 class AgentExecutionService:
     """Handles agent execution with safety controls and multi-model routing."""
@@ -158,6 +418,53 @@ class AgentExecutionService:
         self.max_tokens_per_request = 4096
         self.model_router = ModelRouter()
         self.http_timeout = 120.0
+        self.provider_base_urls: Dict[str, str] = dict(PROVIDER_BASE_URLS)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.completion_cache = build_completion_cache()
+        self.semantic_cache = build_semantic_cache()
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.admission = AdmissionController()
+
+    def _base_url(self, provider: str) -> str:
+        if provider == "ollama":
+            return self.provider_base_urls.get(
+                "ollama", settings.ollama_base_url or "http://localhost:11434"
+            )
+        return self.provider_base_urls[provider]
+
+    def _get_client(self, provider: str) -> httpx.AsyncClient:
+        """Return the pooled keep-alive client for a provider, creating it on first use."""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            http2 = settings.llm_http2 and _http2_available()
+            if settings.llm_http2 and not http2:
+                logger.warning("h2 is not installed; %s client falls back to HTTP/1.1", provider)
+            client = httpx.AsyncClient(
+                base_url=self._base_url(provider),
+                timeout=self.http_timeout,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.llm_max_connections,
+                    max_keepalive_connections=settings.llm_max_keepalive_connections,
+                    keepalive_expiry=settings.llm_keepalive_expiry,
+                ),
+            )
+            self._clients[provider] = client
+        return client
+
+    async def open_clients(self) -> None:
+        """Create pooled clients for every configured provider (called from app lifespan)."""
+        await self.close_clients()
+        for provider in PROVIDER_MODELS:
+            if self.model_router._provider_available(provider):
+                self._get_client(provider)
+
+    async def close_clients(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        await self.completion_cache.close()
 
     def check_rate_limit(self, user_id: str) -> bool:
         now = time.time()
@@ -185,27 +492,27 @@ class AgentExecutionService:
     async def _execute_openai(
         self, model: str, messages: List[Dict[str, str]], max_tokens: int
     ) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.openai_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-            usage = data.get("usage", {})
-            return {
-                "content": data["choices"][0]["message"]["content"],
-                "tokens_input": usage.get("prompt_tokens", 0),
-                "tokens_output": usage.get("completion_tokens", 0),
-            }
+        client = self._get_client("openai")
+        response = await client.post(
+            "/chat/completions",
+            headers={
+                "Authorization": f"Bearer {settings.openai_api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage", {})
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "tokens_input": usage.get("prompt_tokens", 0),
+            "tokens_output": usage.get("completion_tokens", 0),
+        }
 
     async def _execute_anthropic(
         self, model: str, messages: List[Dict[str, str]], max_tokens: int
@@ -226,101 +533,247 @@ class AgentExecutionService:
         if system_msg:
             body["system"] = system_msg
 
-        async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "x-api-key": settings.anthropic_api_key,
-                    "anthropic-version": "2023-06-01",
-                    "Content-Type": "application/json",
-                },
-                json=body,
-            )
-            response.raise_for_status()
-            data = response.json()
-            usage = data.get("usage", {})
-            content_blocks = data.get("content", [])
-            text = content_blocks[0]["text"] if content_blocks else ""
-            return {
-                "content": text,
-                "tokens_input": usage.get("input_tokens", 0),
-                "tokens_output": usage.get("output_tokens", 0),
-            }
+        client = self._get_client("anthropic")
+        response = await client.post(
+            "/messages",
+            headers={
+                "x-api-key": settings.anthropic_api_key,
+                "anthropic-version": "2023-06-01",
+                "Content-Type": "application/json",
+            },
+            json=body,
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage", {})
+        content_blocks = data.get("content", [])
+        text = content_blocks[0]["text"] if content_blocks else ""
+        return {
+            "content": text,
+            "tokens_input": usage.get("input_tokens", 0),
+            "tokens_output": usage.get("output_tokens", 0),
+        }
 
     async def _execute_mistral(
         self, model: str, messages: List[Dict[str, str]], max_tokens: int
     ) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(
-                "https://api.mistral.ai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.mistral_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-            usage = data.get("usage", {})
-            return {
-                "content": data["choices"][0]["message"]["content"],
-                "tokens_input": usage.get("prompt_tokens", 0),
-                "tokens_output": usage.get("completion_tokens", 0),
-            }
+        client = self._get_client("mistral")
+        response = await client.post(
+            "/chat/completions",
+            headers={
+                "Authorization": f"Bearer {settings.mistral_api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage", {})
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "tokens_input": usage.get("prompt_tokens", 0),
+            "tokens_output": usage.get("completion_tokens", 0),
+        }
 
     async def _execute_groq(
         self, model: str, messages: List[Dict[str, str]], max_tokens: int
     ) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.groq_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-            usage = data.get("usage", {})
-            return {
-                "content": data["choices"][0]["message"]["content"],
-                "tokens_input": usage.get("prompt_tokens", 0),
-                "tokens_output": usage.get("completion_tokens", 0),
-            }
+        client = self._get_client("groq")
+        response = await client.post(
+            "/chat/completions",
+            headers={
+                "Authorization": f"Bearer {settings.groq_api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage", {})
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "tokens_input": usage.get("prompt_tokens", 0),
+            "tokens_output": usage.get("completion_tokens", 0),
+        }
 
     async def _execute_ollama(
         self, model: str, messages: List[Dict[str, str]], max_tokens: int
     ) -> Dict[str, Any]:
-        base_url = settings.ollama_base_url or "http://localhost:11434"
-        async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(
-                f"{base_url}/api/chat",
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "stream": False,
-                    "options": {"num_predict": max_tokens},
-                },
-            )
+        client = self._get_client("ollama")
+        response = await client.post(
+            "/api/chat",
+            json={
+                "model": model,
+                "messages": messages,
+                "stream": False,
+                "options": {"num_predict": max_tokens},
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        content = data.get("message", {}).get("content", "")
+        prompt_eval = data.get("prompt_eval_count", 0)
+        eval_count = data.get("eval_count", 0)
+        return {
+            "content": content,
+            "tokens_input": prompt_eval,
+            "tokens_output": eval_count,
+        }
+
+    async def _stream_openai_compatible(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        if provider == "openai":
+            body["stream_options"] = {"include_usage": True}
+
+        client = self._get_client(provider)
+        async with client.stream(
+            "POST",
+            "/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json=body,
+        ) as response:
             response.raise_for_status()
-            data = response.json()
-            content = data.get("message", {}).get("content", "")
-            prompt_eval = data.get("prompt_eval_count", 0)
-            eval_count = data.get("eval_count", 0)
-            return {
-                "content": content,
-                "tokens_input": prompt_eval,
-                "tokens_output": eval_count,
-            }
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                for choice in chunk.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield {"type": "token", "content": text}
+                # Groq reports usage under x_groq on the final chunk
+                usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                if usage:
+                    yield {
+                        "type": "usage",
+                        "tokens_input": usage.get("prompt_tokens", 0),
+                        "tokens_output": usage.get("completion_tokens", 0),
+                    }
+
+    async def _stream_anthropic(
+        self, model: str, messages: List[Dict[str, str]], max_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        system_msg = ""
+        chat_messages = []
+        for msg in messages:
+            if msg["role"] == "system":
+                system_msg = msg["content"]
+            else:
+                chat_messages.append(msg)
+
+        body: Dict[str, Any] = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": chat_messages,
+            "stream": True,
+        }
+        if system_msg:
+            body["system"] = system_msg
+
+        tokens_input = 0
+        client = self._get_client("anthropic")
+        async with client.stream(
+            "POST",
+            "/messages",
+            headers={
+                "x-api-key": settings.anthropic_api_key,
+                "anthropic-version": "2023-06-01",
+                "Content-Type": "application/json",
+            },
+            json=body,
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                event_type = event.get("type")
+                if event_type == "message_start":
+                    usage = event.get("message", {}).get("usage", {})
+                    tokens_input = usage.get("input_tokens", 0)
+                elif event_type == "content_block_delta":
+                    text = event.get("delta", {}).get("text")
+                    if text:
+                        yield {"type": "token", "content": text}
+                elif event_type == "message_delta":
+                    yield {
+                        "type": "usage",
+                        "tokens_input": tokens_input,
+                        "tokens_output": event.get("usage", {}).get("output_tokens", 0),
+                    }
+                elif event_type == "error":
+                    raise RuntimeError(event.get("error", {}).get("message", "Anthropic stream error"))
+
+    async def _stream_ollama(
+        self, model: str, messages: List[Dict[str, str]], max_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        client = self._get_client("ollama")
+        async with client.stream(
+            "POST",
+            "/api/chat",
+            json={
+                "model": model,
+                "messages": messages,
+                "stream": True,
+                "options": {"num_predict": max_tokens},
+            },
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                text = chunk.get("message", {}).get("content")
+                if text:
+                    yield {"type": "token", "content": text}
+                if chunk.get("done"):
+                    yield {
+                        "type": "usage",
+                        "tokens_input": chunk.get("prompt_eval_count", 0),
+                        "tokens_output": chunk.get("eval_count", 0),
+                    }
+
+    def _stream_provider(
+        self, provider: str, model: str, messages: List[Dict[str, str]], max_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        if provider in ("openai", "mistral", "groq"):
+            api_key = {
+                "openai": settings.openai_api_key,
+                "mistral": settings.mistral_api_key,
+                "groq": settings.groq_api_key,
+            }[provider]
+            return self._stream_openai_compatible(provider, api_key, model, messages, max_tokens)
+        if provider == "anthropic":
+            return self._stream_anthropic(model, messages, max_tokens)
+        if provider == "ollama":
+            return self._stream_ollama(model, messages, max_tokens)
+        raise ValueError(f"Unsupported provider: {provider}")
 
     def _simulate_response(
         self, agent_config: Dict[str, Any], input_data: Dict[str, Any]
@@ -344,9 +797,186 @@ class AgentExecutionService:
         handler = provider_map.get(provider)
         if handler is None:
             raise ValueError(f"Unsupported provider: {provider}")
-        return await handler(model, messages, max_tokens)
+        started = time.perf_counter()
+        try:
+            result = await handler(model, messages, max_tokens)
+        except Exception:
+            self.model_router.record(provider, model, (time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self.model_router.record(
+            provider, model, (time.perf_counter() - started) * 1000,
+            ok=True, tokens_output=result.get("tokens_output", 0),
+        )
+        return result
 
-    def _record_usage(
+    def _get_circuit_breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.circuit_breakers:
+            self.circuit_breakers[provider] = CircuitBreaker(
+                failure_threshold=settings.llm_breaker_failure_threshold,
+                recovery_timeout=settings.llm_breaker_recovery_seconds,
+            )
+        return self.circuit_breakers[provider]
+
+    @staticmethod
+    def _estimate_tokens(provider: str, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Worst-case tokens for admission: the estimated prompt plus the full completion."""
+        return estimate_message_tokens(messages, provider) + max_tokens
+
+    async def _call_guarded(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Dict[str, Any]:
+        """One admitted provider call behind its circuit breaker; the result names who served it.
+
+        Every exit reports to the breaker or releases its half-open probe slot,
+        including non-retryable errors and cancellation by a winning hedge.
+        """
+        breaker = self._get_circuit_breaker(provider)
+        if not breaker.can_execute():
+            raise CircuitOpenError(f"Circuit breaker open for provider {provider}")
+        reported = False
+        try:
+            async with self.admission.admit(
+                provider, priority, self._estimate_tokens(provider, messages, max_tokens),
+            ) as ticket:
+                try:
+                    result = await self._call_provider(provider, model, messages, max_tokens)
+                except Exception as exc:
+                    if is_retryable(exc):
+                        breaker.record_failure()
+                        reported = True
+                    raise
+                ticket["tokens_used"] = result.get("tokens_input", 0) + result.get("tokens_output", 0)
+            breaker.record_success()
+            reported = True
+            return {**result, "provider": provider, "model": model}
+        finally:
+            if not reported:
+                breaker.release_probe()
+
+    async def _call_resilient(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        priority: Priority = Priority.INTERACTIVE,
+        agent_config: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Call a provider with jittered retries, failover and tail-latency hedging.
+
+        Each attempt goes to the first target whose breaker admits calls,
+        starting with the routed model and then its equivalents on other
+        providers. Every target gets its own prompt budget (context window and
+        ``max_cost``); equivalents that fail it are left out. If the call is
+        still running after the model's p95 latency, the next target is hedged
+        in and whichever answers first wins. Errors that are not retryable (4xx
+        other than 429) are raised at once, and CircuitOpenError is raised
+        without backoff when every target's breaker is open.
+        """
+        agent_config = agent_config or {}
+        targets = []
+        for candidate in [(provider, model)] + [
+            (c["provider"], c["model"]) for c in self.model_router.equivalents(provider, model)
+        ]:
+            call = {"provider": candidate[0], "model": candidate[1], "messages": messages, "max_tokens": max_tokens}
+            try:
+                self._budget_call(call, agent_config)
+            except PromptBudgetError as exc:
+                if candidate == (provider, model):
+                    raise
+                logger.debug("Skipping failover target %s/%s: %s", candidate[0], candidate[1], exc)
+                continue
+            targets.append((call["provider"], call["model"], call["messages"], call["max_tokens"]))
+
+        last_error: Optional[BaseException] = None
+        for attempt in range(settings.llm_max_retries + 1):
+            ordered = [t for t in targets if self._get_circuit_breaker(t[0]).available()]
+            if not ordered:
+                raise CircuitOpenError(
+                    "Circuit breaker open for " + ", ".join(sorted({t[0] for t in targets}))
+                )
+            if attempt:
+                await asyncio.sleep(backoff_delay(
+                    attempt - 1, settings.llm_retry_base_delay_seconds, settings.llm_retry_max_delay_seconds,
+                ))
+            primary = ordered[0]
+            backup = ordered[1] if settings.llm_hedging_enabled and len(ordered) > 1 else None
+            try:
+                return await hedged(
+                    lambda: self._call_guarded(*primary, priority),
+                    (lambda: self._call_guarded(*backup, priority)) if backup else None,
+                    self.model_router.hedge_delay_ms(primary[0], primary[1]) / 1000.0,
+                )
+            except Exception as exc:
+                if not is_retryable(exc):
+                    raise
+                last_error = exc
+                logger.warning("Provider call to %s/%s failed (attempt %d): %s", primary[0], primary[1], attempt + 1, exc)
+                # Fail over: the target that just failed goes to the back of the line
+                targets.remove(primary)
+                targets.append(primary)
+        raise last_error
+
+    def _cache_enabled(self, agent_config: Dict[str, Any]) -> bool:
+        """Exact caching only for deterministic agents or ones that explicitly opt in.
+
+        A sampled completion (temperature > 0 or the provider default) is not a
+        stable answer to the prompt, so serving it again would pin one sample.
+        """
+        parameters = agent_config.get("parameters") or {}
+        opt_in = parameters.get("cache")
+        if opt_in is not None:
+            return opt_in is True
+        return settings.completion_cache_enabled and parameters.get("temperature") == 0
+
+    async def _call_provider_cached(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        agent_config: Optional[Dict[str, Any]] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Call the provider through the exact and (opt-in) semantic caches.
+
+        Returns (result, cache_hit) where cache_hit is "exact", "semantic" or None.
+        """
+        agent_config = agent_config or {}
+        parameters = agent_config.get("parameters") or {}
+        use_exact = self._cache_enabled(agent_config)
+        use_semantic = parameters.get("semantic_cache") is True
+
+        key = completion_cache_key(provider, model, messages, max_tokens)
+        if use_exact:
+            cached = await self.completion_cache.get(key)
+            if cached is not None:
+                return cached, "exact"
+
+        if use_semantic:
+            system_messages = [m for m in messages if m["role"] != "user"]
+            user_text = "\n".join(m["content"] for m in messages if m["role"] == "user")
+            scope = completion_cache_key(provider, model, system_messages, max_tokens)
+            agent_key = str(agent_config.get("agent_id") or scope)
+            match = self.semantic_cache.lookup(
+                agent_key, scope, user_text, threshold=parameters.get("semantic_cache_threshold"),
+            )
+            if match is not None:
+                return match[0], "semantic"
+
+        result = await self._call_resilient(provider, model, messages, max_tokens, priority, agent_config)
+        if use_exact:
+            await self.completion_cache.set(key, result)
+        if use_semantic:
+            self.semantic_cache.store(agent_key, scope, user_text, result)
+        return result, None
+
+    async def _record_usage(
         self,
         agent_id: Optional[str],
         user_id: str,
@@ -358,31 +988,99 @@ class AgentExecutionService:
         latency_ms: int,
         status: str,
         db: Any = None,
+        wait: bool = True,
     ) -> None:
+        """Queue a ModelUsage row, waiting briefly for room if the ingest queue is full.
+
+        With ``wait=False`` the row is queued without ever suspending (or dropped
+        if the queue is full), for cleanup code that may be running under
+        cancellation.
+        """
         if db is None:
             return
         try:
             from app.models.model_usage import ModelUsage
 
-            usage = ModelUsage(
-                agent_id=agent_id if agent_id else None,
-                user_id=user_id,
-                model_provider=provider,
-                model_name=model,
-                tokens_input=tokens_input,
-                tokens_output=tokens_output,
-                cost=cost,
-                latency_ms=latency_ms,
-                status=status,
-            )
-            db.add(usage)
-            db.commit()
+            row = {
+                "id": uuid.uuid4(),
+                "agent_id": uuid.UUID(str(agent_id)) if agent_id else None,
+                "user_id": uuid.UUID(str(user_id)),
+                "model_provider": provider,
+                "model_name": model,
+                "tokens_input": tokens_input,
+                "tokens_output": tokens_output,
+                "cost": cost,
+                "latency_ms": latency_ms,
+                "status": status,
+                "created_at": datetime.utcnow(),
+            }
+            if wait:
+                await usage_ingestor.put(db.get_bind(), ModelUsage, row)
+            else:
+                usage_ingestor.enqueue(db.get_bind(), ModelUsage, row)
         except Exception as exc:
             logger.warning("Failed to record model usage: %s", exc)
-            try:
-                db.rollback()
-            except Exception:
-                pass
+
+    def _prepare_call(
+        self, agent_config: Dict[str, Any], input_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Route the agent to a provider/model and build the chat messages for it."""
+        provider = agent_config.get("model_provider", "openai")
+        model = agent_config.get("model_name", "gpt-4")
+        system_prompt = agent_config.get("system_prompt", "You are a helpful assistant.")
+        max_tokens = min(
+            agent_config.get("max_tokens", self.max_tokens_per_request),
+            self.max_tokens_per_request,
+        )
+
+        routed = self.model_router.select_model(
+            task_type=agent_config.get("category"),
+            preferred_provider=provider,
+            preferred_model=model,
+            optimize_for=agent_config.get("optimize_for", "quality"),
+        )
+        if routed is not None:
+            provider = routed["provider"]
+            model = routed["model"]
+
+        user_message = input_data.get("query", input_data.get("input", str(input_data)))
+        return {
+            "provider": provider,
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message},
+            ],
+            "max_tokens": max_tokens,
+            "simulated": routed is None,
+        }
+
+    def _budget_call(self, call: Dict[str, Any], agent_config: Dict[str, Any]) -> None:
+        """Fit the prompt into the routed model's context window (trimming the input
+        or lowering ``max_tokens``) and pre-authorize its worst-case cost, raising
+        PromptBudgetError before anything is sent.
+
+        Agents can override ``prompt_overflow`` ("truncate" or "reject") and
+        ``max_cost`` (USD per call, 0 for no limit) in their parameters.
+        """
+        parameters = agent_config.get("parameters") or {}
+        overflow = parameters.get("prompt_overflow", settings.prompt_overflow)
+        budget = fit_messages(
+            call["provider"], call["model"], call["messages"], call["max_tokens"],
+            truncate=overflow != "reject",
+        )
+        if budget.truncated:
+            logger.info(
+                "Truncated input for %s/%s to ~%d tokens", call["provider"], call["model"], budget.input_tokens,
+            )
+
+        max_cost = parameters.get("max_cost", settings.llm_max_cost_per_call)
+        worst_case = self._calculate_cost(call["model"], budget.input_tokens, budget.max_tokens)
+        if max_cost and worst_case > max_cost:
+            raise PromptBudgetError(
+                f"Estimated cost ${worst_case:.4f} for {call['model']} exceeds the ${max_cost:.4f} per-call limit"
+            )
+        call.update(budget._asdict())
 
     async def execute_agent(
         self,
@@ -390,7 +1088,10 @@ class AgentExecutionService:
         input_data: Dict[str, Any],
         user_id: str,
         db: Any = None,
+        priority: Priority = Priority.INTERACTIVE,
     ) -> ExecutionResult:
+        """Run an agent once. ``priority`` orders the call in the provider's
+        admission queue when the provider is at its concurrency or token limit."""
         execution_id = str(uuid.uuid4())
         start_time = time.time()
 
@@ -401,25 +1102,19 @@ class AgentExecutionService:
                 error="Rate limit exceeded. Please try again later.",
             )
 
-        try:
-            provider = agent_config.get("model_provider", "openai")
-            model = agent_config.get("model_name", "gpt-4")
-            system_prompt = agent_config.get("system_prompt", "You are a helpful assistant.")
-            task_type = agent_config.get("category")
-            optimize_for = agent_config.get("optimize_for", "quality")
-            max_tokens = min(
-                agent_config.get("max_tokens", self.max_tokens_per_request),
-                self.max_tokens_per_request,
-            )
+        if db is not None and not self.model_router.history_loaded:
+            try:
+                self.model_router.load_history(db)
+            except Exception as exc:
+                self.model_router.history_loaded = True
+                logger.warning("Could not seed model router from usage history: %s", exc)
 
-            routed = self.model_router.select_model(
-                task_type=task_type,
-                preferred_provider=provider,
-                preferred_model=model,
-                optimize_for=optimize_for,
-            )
+        try:
+            call = self._prepare_call(agent_config, input_data)
+            provider = call["provider"]
+            model = call["model"]
 
-            if routed is None:
+            if call["simulated"]:
                 # No API keys configured – fall back to simulated response
                 sim = self._simulate_response(agent_config, input_data)
                 duration_ms = int((time.time() - start_time) * 1000)
@@ -436,24 +1131,39 @@ class AgentExecutionService:
                     duration_ms=duration_ms,
                 )
 
-            provider = routed["provider"]
-            model = routed["model"]
-
-            user_message = input_data.get("query", input_data.get("input", str(input_data)))
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ]
+            self._budget_call(call, agent_config)
+            messages = call["messages"]
+            max_tokens = call["max_tokens"]
 
-            result = await self._call_provider(provider, model, messages, max_tokens)
+            result, cache_hit = await self._call_provider_cached(
+                provider, model, messages, max_tokens, agent_config, priority,
+            )
+            # Failover or hedging may have served the call from an equivalent model
+            provider = result.get("provider", provider)
+            model = result.get("model", model)
 
             duration_ms = int((time.time() - start_time) * 1000)
+            if cache_hit:
+                return ExecutionResult(
+                    execution_id=execution_id,
+                    status="completed",
+                    output={
+                        "result": result["content"],
+                        "model": model,
+                        "provider": provider,
+                    },
+                    tokens_used=0,
+                    cost=0.0,
+                    duration_ms=duration_ms,
+                    cached=True,
+                )
+
             tokens_input = result.get("tokens_input", 0)
             tokens_output = result.get("tokens_output", 0)
             total_tokens = tokens_input + tokens_output
             cost = self._calculate_cost(model, tokens_input, tokens_output)
 
-            self._record_usage(
+            await self._record_usage(
                 agent_id=agent_config.get("agent_id"),
                 user_id=user_id,
                 provider=provider,
@@ -483,7 +1193,7 @@ class AgentExecutionService:
             duration_ms = int((time.time() - start_time) * 1000)
             logger.error("Execution failed: %s", e)
 
-            self._record_usage(
+            await self._record_usage(
                 agent_id=agent_config.get("agent_id"),
                 user_id=user_id,
                 provider=agent_config.get("model_provider", "unknown"),
@@ -503,6 +1213,149 @@ class AgentExecutionService:
                 duration_ms=duration_ms,
             )
 
+    async def stream_agent(
+        self,
+        agent_config: Dict[str, Any],
+        input_data: Dict[str, Any],
+        user_id: str,
+        db: Any = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Execute an agent, yielding ``start``/``token`` events and a final ``done`` or ``error``.
+
+        Usage is recorded once the provider stream ends, exactly as for execute_agent.
+        If the consumer goes away mid-stream (the client disconnects and the
+        generator is closed or cancelled), the tokens generated so far are
+        recorded with status ``cancelled``.
+        """
+        execution_id = str(uuid.uuid4())
+        start_time = time.time()
+
+        if not self.check_rate_limit(user_id):
+            yield {
+                "type": "error",
+                "execution_id": execution_id,
+                "error": "Rate limit exceeded. Please try again later.",
+            }
+            return
+
+        provider = agent_config.get("model_provider", "unknown")
+        model = agent_config.get("model_name", "unknown")
+        tokens_input = 0
+        tokens_output = 0
+        streamed_chars = 0
+        stream_started: Optional[float] = None
+        recorded = False
+        try:
+            call = self._prepare_call(agent_config, input_data)
+            provider = call["provider"]
+            model = call["model"]
+            yield {"type": "start", "execution_id": execution_id, "provider": provider, "model": model}
+
+            if call["simulated"]:
+                sim = self._simulate_response(agent_config, input_data)
+                yield {"type": "token", "content": sim["content"]}
+                yield {
+                    "type": "done",
+                    "execution_id": execution_id,
+                    "tokens_used": 0,
+                    "cost": 0.0,
+                    "duration_ms": int((time.time() - start_time) * 1000),
+                }
+                return
+
+            self._budget_call(call, agent_config)
+            estimate = self._estimate_tokens(provider, call["messages"], call["max_tokens"])
+            async with self.admission.admit(provider, priority, estimate) as ticket:
+                stream_started = time.perf_counter()
+                events = self._stream_provider(provider, model, call["messages"], call["max_tokens"])
+                async for event in events:
+                    if event["type"] == "usage":
+                        tokens_input = event["tokens_input"] or tokens_input
+                        tokens_output = event["tokens_output"] or tokens_output
+                        continue
+                    streamed_chars += len(event["content"])
+                    yield event
+
+                if not tokens_output and streamed_chars:
+                    # Provider sent no usage block; approximate at ~4 characters per token
+                    tokens_output = max(1, streamed_chars // 4)
+                ticket["tokens_used"] = tokens_input + tokens_output
+
+            self.model_router.record(
+                provider, model, (time.perf_counter() - stream_started) * 1000,
+                ok=True, tokens_output=tokens_output,
+            )
+            duration_ms = int((time.time() - start_time) * 1000)
+            cost = self._calculate_cost(model, tokens_input, tokens_output)
+            await self._record_usage(
+                agent_id=agent_config.get("agent_id"),
+                user_id=user_id,
+                provider=provider,
+                model=model,
+                tokens_input=tokens_input,
+                tokens_output=tokens_output,
+                cost=cost,
+                latency_ms=duration_ms,
+                status="completed",
+                db=db,
+            )
+            recorded = True
+            yield {
+                "type": "done",
+                "execution_id": execution_id,
+                "tokens_used": tokens_input + tokens_output,
+                "cost": cost,
+                "duration_ms": duration_ms,
+            }
+
+        except Exception as e:
+            duration_ms = int((time.time() - start_time) * 1000)
+            logger.error("Streaming execution failed: %s", e)
+            if stream_started is not None:
+                self.model_router.record(
+                    provider, model, (time.perf_counter() - stream_started) * 1000, ok=False,
+                )
+            await self._record_usage(
+                agent_id=agent_config.get("agent_id"),
+                user_id=user_id,
+                provider=provider,
+                model=model,
+                tokens_input=tokens_input,
+                tokens_output=tokens_output,
+                cost=self._calculate_cost(model, tokens_input, tokens_output),
+                latency_ms=duration_ms,
+                status="error",
+                db=db,
+            )
+            recorded = True
+            yield {
+                "type": "error",
+                "execution_id": execution_id,
+                "error": str(e),
+                "duration_ms": duration_ms,
+            }
+
+        finally:
+            if not recorded and stream_started is not None:
+                # Closed or cancelled mid-stream: bill what the provider has produced so far
+                if not tokens_output and streamed_chars:
+                    tokens_output = max(1, streamed_chars // 4)
+                tokens_input = tokens_input or call["input_tokens"]
+                await self._record_usage(
+                    agent_id=agent_config.get("agent_id"),
+                    user_id=user_id,
+                    provider=provider,
+                    model=model,
+                    tokens_input=tokens_input,
+                    tokens_output=tokens_output,
+                    cost=self._calculate_cost(model, tokens_input, tokens_output),
+                    latency_ms=int((time.time() - start_time) * 1000),
+                    status="cancelled",
+                    db=db,
+                    wait=False,
+                )
+
 
 # Singleton instance
 execution_service = AgentExecutionService()
@@ -1,9 +1,16 @@
 import uuid
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Any, AsyncIterator, Callable, Dict, NamedTuple, Optional, List
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, insert, or_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.config import settings
+from app.models.agent import Agent, AgentStatus, AgentTombstone
 from app.models.federation import FederationNode, FederatedAgent
 from app.schemas.federation import FederationNodeCreate
+from app.services.pagination import decode_cursor, encode_cursor
 import httpx
 import logging
 
@@ -25,59 +32,312 @@ def register_node(db: Session, node_data: FederationNodeCreate) -> FederationNod
     return node
 
 
-def sync_agents(db: Session, node_id: uuid.UUID) -> List[FederatedAgent]:
+class _NodeSnapshot(NamedTuple):
+    """The node fields the HTTP side of a sync reads, copied off the session so
+    page fetches never touch it while a worker thread is writing."""
+
+    id: uuid.UUID
+    name: str
+    url: str
+    api_key: Optional[str]
+    sync_watermark: Optional[str]
+
+
+def _agent_values(node: _NodeSnapshot, remote: Dict[str, Any], synced_at: datetime) -> Dict[str, Any]:
+    return {
+        "id": uuid.uuid4(),
+        "node_id": node.id,
+        "remote_agent_id": str(remote.get("id", "")),
+        "name": remote.get("name") or "Unknown",
+        "description": remote.get("description"),
+        "category": remote.get("category"),
+        "performance_score": remote.get("average_rating") or 0.0,
+        "origin_server": node.url,
+        "synced_at": synced_at,
+        "created_at": synced_at,
+    }
+
+
+def _upsert_agents(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Insert or refresh one page of federated agents, keyed on (node_id, remote_agent_id)."""
+    if not rows:
+        return
+    table = FederatedAgent.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["node_id", "remote_agent_id"],
+            set_={
+                column: statement.excluded[column]
+                for column in ("name", "description", "category", "performance_score", "origin_server", "synced_at")
+            },
+        )
+        db.execute(statement, rows)
+    else:
+        node_id = rows[0]["node_id"]
+        existing = {
+            remote_id: agent_id
+            for agent_id, remote_id in db.query(FederatedAgent.id, FederatedAgent.remote_agent_id).filter(
+                FederatedAgent.node_id == node_id,
+                FederatedAgent.remote_agent_id.in_([row["remote_agent_id"] for row in rows]),
+            )
+        }
+        updates = [
+            {**{k: v for k, v in row.items() if k != "created_at"}, "id": existing[row["remote_agent_id"]]}
+            for row in rows if row["remote_agent_id"] in existing
+        ]
+        if updates:
+            db.execute(update(FederatedAgent), updates)
+        inserts = [row for row in rows if row["remote_agent_id"] not in existing]
+        if inserts:
+            db.execute(insert(table), inserts)
+    db.commit()
+
+
+async def _iter_remote_pages(
+    client: httpx.AsyncClient, node: _NodeSnapshot, page_size: int,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield the remote catalog page by page, following next_cursor (or page numbers
+    for nodes that predate cursors). The next page is fetched while the caller
+    processes the current one."""
+
+    async def fetch(params: Dict[str, Any]) -> Dict[str, Any]:
+        response = await client.get(
+            f"{node.url}/api/v1/agents",
+            params=params,
+            headers={"Authorization": f"Bearer {node.api_key}"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    params: Dict[str, Any] = {"page_size": page_size, "include_total": "false"}
+    page = 1
+    pending = asyncio.ensure_future(fetch(params))
+    try:
+        while pending is not None:
+            body = await pending
+            pending = None
+            agents = body.get("agents", [])
+            if body.get("next_cursor"):
+                params = {**params, "cursor": body["next_cursor"]}
+                pending = asyncio.ensure_future(fetch(params))
+            elif "next_cursor" not in body and len(agents) >= page_size:
+                page += 1
+                pending = asyncio.ensure_future(fetch({**params, "page": page}))
+            yield agents
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def get_agent_changes(db: Session, since: Optional[str] = None, limit: int = 500) -> Dict[str, Any]:
+    """Agent changes after the ``since`` watermark, oldest first, for peers pulling deltas.
+
+    Published agents that changed are returned in full. Agents deleted or no
+    longer published are returned as ids in ``deleted``. Without ``since`` the
+    feed starts at the beginning, so replaying it is a full sync. Changes from
+    the last ``federation_changes_settle_seconds`` are held back so a commit
+    still in flight cannot land behind a watermark already handed out. Raises
+    ValueError for a malformed watermark.
+    """
+    horizon = datetime.utcnow() - timedelta(seconds=settings.federation_changes_settle_seconds)
+    agents = db.query(Agent).filter(Agent.updated_at <= horizon)
+    tombstones = db.query(AgentTombstone).filter(AgentTombstone.deleted_at <= horizon)
+    if since:
+        changed_at, row_id = decode_cursor(since)
+        agents = agents.filter(or_(
+            Agent.updated_at > changed_at, and_(Agent.updated_at == changed_at, Agent.id > row_id),
+        ))
+        tombstones = tombstones.filter(or_(
+            AgentTombstone.deleted_at > changed_at,
+            and_(AgentTombstone.deleted_at == changed_at, AgentTombstone.agent_id > row_id),
+        ))
+    agents = agents.order_by(Agent.updated_at, Agent.id).limit(limit + 1).all()
+    tombstones = tombstones.order_by(AgentTombstone.deleted_at, AgentTombstone.agent_id).limit(limit + 1).all()
+
+    events = sorted(
+        [(a.updated_at, a.id, a) for a in agents] + [(t.deleted_at, t.agent_id, None) for t in tombstones],
+        key=lambda event: (event[0], event[1]),
+    )
+    page = events[:limit]
+    return {
+        "agents": [a for _, _, a in page if a is not None and a.status == AgentStatus.PUBLISHED.value],
+        "deleted": [
+            row_id for _, row_id, a in page
+            if a is None or a.status != AgentStatus.PUBLISHED.value
+        ],
+        "next_watermark": encode_cursor(page[-1][0], page[-1][1]) if page else since,
+        "has_more": len(events) > limit,
+    }
+
+
+async def _iter_remote_changes(
+    client: httpx.AsyncClient, node: _NodeSnapshot, page_size: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield pages of the node's change feed from its stored watermark, prefetching
+    the next page while the caller applies the current one. A node without a
+    change feed raises httpx.HTTPStatusError (404) on the first page."""
+
+    async def fetch(since: Optional[str]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"limit": page_size}
+        if since:
+            params["since"] = since
+        response = await client.get(
+            f"{node.url}/api/v1/federation/changes",
+            params=params,
+            headers={"Authorization": f"Bearer {node.api_key}"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    pending = asyncio.ensure_future(fetch(node.sync_watermark))
+    try:
+        while pending is not None:
+            body = await pending
+            pending = None
+            if body.get("has_more"):
+                pending = asyncio.ensure_future(fetch(body.get("next_watermark")))
+            yield body
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def _load_node(db: Session, node_id: uuid.UUID, full: bool) -> Optional[_NodeSnapshot]:
     node = db.query(FederationNode).filter(FederationNode.id == node_id).first()
     if not node:
+        return None
+    if full:
+        node.sync_watermark = None
+    return _NodeSnapshot(node.id, node.name, node.url, node.api_key, node.sync_watermark)
+
+
+def _apply_changes(db: Session, node: _NodeSnapshot, body: Dict[str, Any]) -> None:
+    _upsert_agents(db, [_agent_values(node, ra, datetime.utcnow()) for ra in body.get("agents", [])])
+    deleted = [str(agent_id) for agent_id in body.get("deleted", [])]
+    if deleted:
+        db.query(FederatedAgent).filter(
+            FederatedAgent.node_id == node.id, FederatedAgent.remote_agent_id.in_(deleted),
+        ).delete(synchronize_session=False)
+    # The watermark only advances together with the changes it covers
+    stored = db.get(FederationNode, node.id)
+    stored.sync_watermark = body.get("next_watermark") or stored.sync_watermark
+    db.commit()
+
+
+def _finish_sync(
+    db: Session, node_id: uuid.UUID, started_at: datetime, complete: bool, from_scratch: bool,
+) -> List[FederatedAgent]:
+    if complete:
+        if from_scratch:
+            # A complete listing: anything not seen in it is gone from the node
+            db.query(FederatedAgent).filter(
+                FederatedAgent.node_id == node_id, FederatedAgent.synced_at < started_at,
+            ).delete(synchronize_session=False)
+        node = db.get(FederationNode, node_id)
+        node.agent_count = (
+            db.query(func.count(FederatedAgent.id)).filter(FederatedAgent.node_id == node_id).scalar()
+        )
+        node.last_heartbeat = datetime.utcnow()
+        db.commit()
+    return (
+        db.query(FederatedAgent)
+        .filter(FederatedAgent.node_id == node_id, FederatedAgent.synced_at >= started_at)
+        .all()
+    )
+
+
+async def sync_agents(
+    db: Session,
+    node_id: uuid.UUID,
+    client: Optional[httpx.AsyncClient] = None,
+    page_size: Optional[int] = None,
+    full: bool = False,
+) -> List[FederatedAgent]:
+    """Bring a node's federated agents up to date; returns the agents written.
+
+    Nodes with a change feed are synced incrementally from the stored
+    watermark, transferring only changed and deleted agents. ``full`` drops
+    the watermark and replays the feed from the start. Nodes without a feed
+    fall back to paging their whole catalog. Each page is committed with its
+    watermark, so a failed sync resumes where it stopped.
+
+    Pages are fetched on the event loop, but all work on ``db`` runs in a
+    worker thread, so page commits never block other requests. Each page is
+    parsed whole, so ``page_size`` bounds the memory a sync holds.
+    """
+    node = await asyncio.to_thread(_load_node, db, node_id, full)
+    if node is None:
         return []
 
+    page_size = page_size or settings.federation_sync_page_size
+    started_at = datetime.utcnow()
+    from_scratch = node.sync_watermark is None
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=settings.federation_sync_timeout_seconds)
+    complete = False
     try:
-        with httpx.Client(timeout=10.0) as client:
-            response = client.get(
-                f"{node.url}/api/v1/agents",
-                headers={"Authorization": f"Bearer {node.api_key}"},
-            )
-            response.raise_for_status()
-            remote_agents = response.json().get("agents", [])
+        try:
+            async for body in _iter_remote_changes(client, node, page_size):
+                await asyncio.to_thread(_apply_changes, db, node, body)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            from_scratch = True
+            async for remote_agents in _iter_remote_pages(client, node, page_size):
+                rows = [_agent_values(node, ra, datetime.utcnow()) for ra in remote_agents]
+                await asyncio.to_thread(_upsert_agents, db, rows)
+        complete = True
     except Exception as e:
+        await asyncio.to_thread(db.rollback)
         logger.warning("Failed to sync agents from node %s: %s", node.name, e)
-        remote_agents = []
+    finally:
+        if owns_client:
+            await client.aclose()
 
-    synced = []
-    for ra in remote_agents:
-        existing = (
-            db.query(FederatedAgent)
-            .filter(
-                FederatedAgent.node_id == node_id,
-                FederatedAgent.remote_agent_id == str(ra.get("id", "")),
-            )
-            .first()
-        )
-        if existing:
-            existing.name = ra.get("name", existing.name)
-            existing.description = ra.get("description", existing.description)
-            existing.category = ra.get("category", existing.category)
-            existing.performance_score = ra.get("average_rating", existing.performance_score)
-            existing.synced_at = datetime.utcnow()
-            synced.append(existing)
-        else:
-            federated_agent = FederatedAgent(
-                node_id=node_id,
-                remote_agent_id=str(ra.get("id", "")),
-                name=ra.get("name", "Unknown"),
-                description=ra.get("description"),
-                category=ra.get("category"),
-                performance_score=ra.get("average_rating", 0.0),
-                origin_server=node.url,
-            )
-            db.add(federated_agent)
-            synced.append(federated_agent)
+    return await asyncio.to_thread(_finish_sync, db, node_id, started_at, complete, from_scratch)
 
-    node.agent_count = len(synced)
-    node.last_heartbeat = datetime.utcnow()
-    db.commit()
-    for agent in synced:
-        db.refresh(agent)
-    return synced
+
+async def sync_all_nodes(
+    session_factory: Callable[[], Session],
+    concurrency: Optional[int] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Dict[uuid.UUID, int]:
+    """Sync every active node, at most ``concurrency`` at a time.
+
+    Each node gets its own session; all share one connection pool. Returns the
+    number of agents synced per node.
+    """
+    def active_node_ids() -> List[uuid.UUID]:
+        with session_factory() as db:
+            return [
+                node_id for (node_id,) in
+                db.query(FederationNode.id).filter(FederationNode.status == "active")
+            ]
+
+    node_ids = await asyncio.to_thread(active_node_ids)
+    semaphore = asyncio.Semaphore(concurrency or settings.federation_sync_concurrency)
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=settings.federation_sync_timeout_seconds)
+
+    async def sync_one(node_id: uuid.UUID) -> int:
+        async with semaphore:
+            db = session_factory()
+            try:
+                return len(await sync_agents(db, node_id, client=client))
+            finally:
+                await asyncio.to_thread(db.close)
+
+    try:
+        counts = await asyncio.gather(*(sync_one(node_id) for node_id in node_ids))
+    finally:
+        if owns_client:
+            await client.aclose()
+    return dict(zip(node_ids, counts))
 
 
 def health_check(db: Session, node_id: uuid.UUID) -> Optional[FederationNode]:
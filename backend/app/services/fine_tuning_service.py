@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import Optional, List, Tuple, Dict, Any
 from sqlalchemy.orm import Session
 from app.models.training import TrainingJob, FineTunedModel
+from app.services.pagination import paginate
 
 
 def create_training_job(
@@ -96,17 +97,14 @@ def list_jobs(
     user_id: Optional[uuid.UUID] = None,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[TrainingJob], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[TrainingJob], Optional[int]]:
     q = db.query(TrainingJob)
     if user_id:
         q = q.filter(TrainingJob.user_id == user_id)
-    total = q.count()
-    jobs = (
-        q.order_by(TrainingJob.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
+    total = q.count() if with_total else None
+    jobs = paginate(q, TrainingJob.created_at, TrainingJob.id, page, page_size, cursor)
     return jobs, total
 
 
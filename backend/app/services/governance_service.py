@@ -2,8 +2,8 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from app.models.governance import Proposal, Vote
+from app.services.pagination import paginate
 
 
 def create_proposal(
@@ -31,17 +31,14 @@ def list_proposals(
     status: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[Proposal], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[Proposal], Optional[int]]:
     query = db.query(Proposal)
     if status:
         query = query.filter(Proposal.status == status)
-    total = query.count()
-    proposals = (
-        query.order_by(desc(Proposal.created_at))
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
+    total = query.count() if with_total else None
+    proposals = paginate(query, Proposal.created_at, Proposal.id, page, page_size, cursor)
     return proposals, total
 
 
@@ -1,21 +1,68 @@
+import re
+import math
 import uuid
 import hashlib
 from datetime import datetime
 from typing import Optional, List, Tuple, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from app.models.memory import AgentMemory, KnowledgeBase
+from sqlalchemy import or_, func, update
+from app.config import settings
+from app.models.memory import ALL_AGENTS, AgentMemory, AgentMemoryRevision, KnowledgeBase, KnowledgeChange
+from app.services.pagination import paginate
+from app.services.vector_index import (
+    EmbeddingMatrix, EmbeddingMatrixCache, PartitionedIVFIndex, pack_embedding, unpack_embedding,
+)
 
+SEARCH_MODES = ("semantic", "keyword", "hybrid")
+HYBRID_SEMANTIC_WEIGHT = 0.7
 
-def _generate_embedding(text: str) -> List[float]:
-    """Generate a simple hash-based embedding vector for text."""
-    embedding = []
-    for i in range(32):
-        chunk = f"{text}:{i}"
-        h = hashlib.md5(chunk.encode()).hexdigest()
-        value = (int(h[:8], 16) / 0xFFFFFFFF) * 2 - 1
-        embedding.append(round(value, 6))
-    return embedding
+_memory_matrices = EmbeddingMatrixCache()
+
+_knowledge_index: Optional[PartitionedIVFIndex] = None
+# (seq, knowledge_id) of the last knowledge_changes entry replayed into the index
+_knowledge_index_watermark: Optional[Tuple[int, Optional[uuid.UUID]]] = None
+# A gap in knowledge_changes.seq may be a transaction that has not committed yet;
+# it is waited for this long before the watermark moves past it
+KNOWLEDGE_CHANGE_SETTLE_SECONDS = 30.0
+
+
+EMBEDDING_DIM = 256
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _text_features(text: str) -> List[str]:
+    words = _TOKEN_PATTERN.findall(text.lower())
+    features = [f"w:{w}" for w in words]
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def generate_embedding(text: str) -> List[float]:
+    """Embed text as an L2-normalised signed feature-hashing vector.
+
+    Words and character trigrams are hashed into EMBEDDING_DIM buckets, so texts
+    that share most of their wording land close together under cosine similarity.
+    """
+    vector = [0.0] * EMBEDDING_DIM
+    for feature in _text_features(text):
+        digest = hashlib.md5(feature.encode()).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0.0:
+        return vector
+    return [round(v / norm, 6) for v in vector]
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
 
 
 def store_memory(
@@ -27,13 +74,14 @@ def store_memory(
     memory_type: str = "episodic",
     metadata_extra: Optional[Dict[str, Any]] = None,
 ) -> AgentMemory:
-    embedding = _generate_embedding(content)
+    embedding = generate_embedding(content)
     memory = AgentMemory(
         agent_id=agent_id,
         namespace=namespace,
         key=key,
         content=content,
         embedding=embedding,
+        embedding_vector=pack_embedding(embedding),
         memory_type=memory_type,
         metadata_extra=metadata_extra or {},
     )
@@ -43,26 +91,143 @@ def store_memory(
     return memory
 
 
-def retrieve_memories(
+def _memory_filter(q, agent_id: Optional[uuid.UUID]):
+    if agent_id:
+        return q.filter(AgentMemory.agent_id == agent_id)
+    return q
+
+
+def _memory_matrix(db: Session, agent_id: Optional[uuid.UUID]) -> EmbeddingMatrix:
+    """Return the packed embedding matrix for one agent's memories, rebuilding it when stale.
+
+    The cache is keyed on the agent's memory revision, which every insert, update
+    or delete of its memories replaces (access-count bumps do not). This is a
+    read path: rows without a packed vector (written before they existed) are
+    embedded in memory for the cached matrix and never written back here.
+    """
+    signature = db.query(AgentMemoryRevision.revision).filter(
+        AgentMemoryRevision.agent_id == (agent_id or ALL_AGENTS)
+    ).scalar()
+    cached = _memory_matrices.get(agent_id, signature)
+    if cached is not None:
+        return cached
+
+    rows = _memory_filter(
+        db.query(AgentMemory.id, AgentMemory.namespace, AgentMemory.embedding_vector), agent_id
+    ).all()
+    vector_bytes = EMBEDDING_DIM * 4
+    stale_ids = [row.id for row in rows if not row.embedding_vector or len(row.embedding_vector) != vector_bytes]
+    backfilled: Dict[uuid.UUID, List[float]] = {}
+    for start in range(0, len(stale_ids), 1000):
+        for row in db.query(AgentMemory.id, AgentMemory.content, AgentMemory.embedding).filter(
+            AgentMemory.id.in_(stale_ids[start:start + 1000])
+        ):
+            embedding = row.embedding
+            if not embedding or len(embedding) != EMBEDDING_DIM:
+                embedding = generate_embedding(row.content)
+            backfilled[row.id] = embedding
+
+    keys, labels, vectors = [], [], []
+    for row in rows:
+        keys.append(row.id)
+        labels.append(row.namespace)
+        vectors.append(backfilled[row.id] if row.id in backfilled else unpack_embedding(row.embedding_vector))
+    matrix = EmbeddingMatrix(keys, labels, vectors, EMBEDDING_DIM)
+    _memory_matrices.put(agent_id, signature, matrix)
+    return matrix
+
+
+def _semantic_scores(
     db: Session,
     agent_id: Optional[uuid.UUID],
     query: str,
-    limit: int = 10,
-) -> List[AgentMemory]:
+    namespace: Optional[str],
+    limit: int,
+) -> List[Tuple[uuid.UUID, float]]:
+    matrix = _memory_matrix(db, agent_id)
+    return matrix.search(generate_embedding(query), limit, label=namespace)
+
+
+def _keyword_query(db: Session, agent_id: Optional[uuid.UUID], query: str, namespace: Optional[str]):
     q = db.query(AgentMemory)
     if agent_id:
         q = q.filter(AgentMemory.agent_id == agent_id)
+    if namespace:
+        q = q.filter(AgentMemory.namespace == namespace)
     search_term = f"%{query}%"
-    q = q.filter(
+    return q.filter(
         or_(
             AgentMemory.content.ilike(search_term),
             AgentMemory.key.ilike(search_term),
+            AgentMemory.namespace.ilike(search_term),
         )
     )
-    memories = q.order_by(AgentMemory.access_count.desc()).limit(limit).all()
-    for mem in memories:
-        mem.access_count += 1
-    db.commit()
+
+
+def _ranked_memories(
+    db: Session,
+    agent_id: Optional[uuid.UUID],
+    query: str,
+    namespace: Optional[str],
+    limit: int,
+    mode: str,
+) -> List[AgentMemory]:
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search mode: {mode}")
+
+    if mode == "semantic":
+        scored = _semantic_scores(db, agent_id, query, namespace, limit)
+    else:
+        # Hybrid: widen the semantic candidate pool and boost rows that also match the keyword
+        semantic = dict(_semantic_scores(db, agent_id, query, namespace, limit * 3))
+        keyword_ids = {
+            row.id for row in _keyword_query(db, agent_id, query, namespace)
+            .with_entities(AgentMemory.id).limit(limit * 3).all()
+        }
+        combined = {
+            memory_id: HYBRID_SEMANTIC_WEIGHT * semantic.get(memory_id, 0.0)
+            + (1 - HYBRID_SEMANTIC_WEIGHT) * (1.0 if memory_id in keyword_ids else 0.0)
+            for memory_id in set(semantic) | keyword_ids
+        }
+        scored = sorted(combined.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    if not scored:
+        return []
+    by_id = {
+        m.id: m for m in db.query(AgentMemory).filter(AgentMemory.id.in_([i for i, _ in scored])).all()
+    }
+    return [by_id[memory_id] for memory_id, _ in scored if memory_id in by_id]
+
+
+def retrieve_memories(
+    db: Session,
+    agent_id: Optional[uuid.UUID],
+    query: str,
+    limit: int = 10,
+    mode: str = "semantic",
+) -> List[AgentMemory]:
+    if mode == "keyword":
+        q = db.query(AgentMemory)
+        if agent_id:
+            q = q.filter(AgentMemory.agent_id == agent_id)
+        search_term = f"%{query}%"
+        q = q.filter(
+            or_(
+                AgentMemory.content.ilike(search_term),
+                AgentMemory.key.ilike(search_term),
+            )
+        )
+        memories = q.order_by(AgentMemory.access_count.desc()).limit(limit).all()
+    else:
+        memories = _ranked_memories(db, agent_id, query, None, limit, mode)
+    if memories:
+        # Core UPDATE: bumping access counts must not touch updated_at or the memory revision
+        db.execute(
+            update(AgentMemory)
+            .where(AgentMemory.id.in_([m.id for m in memories]))
+            .values(access_count=AgentMemory.access_count + 1, updated_at=AgentMemory.updated_at)
+        )
+        db.commit()
     return memories
 
 
@@ -72,27 +237,20 @@ def search_memories(
     query: str,
     namespace: Optional[str] = None,
     limit: int = 10,
+    mode: str = "keyword",
 ) -> List[AgentMemory]:
-    q = db.query(AgentMemory)
-    if agent_id:
-        q = q.filter(AgentMemory.agent_id == agent_id)
-    if namespace:
-        q = q.filter(AgentMemory.namespace == namespace)
-    search_term = f"%{query}%"
-    q = q.filter(
-        or_(
-            AgentMemory.content.ilike(search_term),
-            AgentMemory.key.ilike(search_term),
-            AgentMemory.namespace.ilike(search_term),
-        )
-    )
-    return q.order_by(AgentMemory.updated_at.desc()).limit(limit).all()
+    if mode == "keyword":
+        q = _keyword_query(db, agent_id, query, namespace)
+        return q.order_by(AgentMemory.updated_at.desc()).limit(limit).all()
+    return _ranked_memories(db, agent_id, query, namespace, limit, mode)
 
 
 def delete_memory(db: Session, memory_id: uuid.UUID) -> bool:
     memory = db.query(AgentMemory).filter(AgentMemory.id == memory_id).first()
     if not memory:
         return False
+    _memory_matrices.invalidate(memory.agent_id)
+    _memory_matrices.invalidate(None)
     db.delete(memory)
     db.commit()
     return True
@@ -108,7 +266,8 @@ def update_memory(
     if not memory:
         return None
     memory.content = content
-    memory.embedding = _generate_embedding(content)
+    memory.embedding = generate_embedding(content)
+    memory.embedding_vector = pack_embedding(memory.embedding)
     memory.updated_at = datetime.utcnow()
     if metadata_extra is not None:
         memory.metadata_extra = metadata_extra
@@ -123,20 +282,103 @@ def list_memories(
     namespace: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[AgentMemory], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[AgentMemory], Optional[int]]:
     q = db.query(AgentMemory)
     if agent_id:
         q = q.filter(AgentMemory.agent_id == agent_id)
     if namespace:
         q = q.filter(AgentMemory.namespace == namespace)
-    total = q.count()
-    memories = (
-        q.order_by(AgentMemory.updated_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
+    total = q.count() if with_total else None
+    memories = paginate(q, AgentMemory.updated_at, AgentMemory.id, page, page_size, cursor)
+    return memories, total
+
+
+def get_knowledge_index() -> PartitionedIVFIndex:
+    global _knowledge_index
+    if _knowledge_index is None:
+        _knowledge_index = PartitionedIVFIndex(
+            EMBEDDING_DIM,
+            directory=settings.knowledge_index_path,
+            nprobe=settings.knowledge_index_nprobe,
+            train_threshold=settings.knowledge_index_train_threshold,
+        )
+    return _knowledge_index
+
+
+def _index_knowledge_rows(db: Session, index: PartitionedIVFIndex, ids: List[uuid.UUID]) -> None:
+    for start in range(0, len(ids), 10000):
+        batch = db.query(KnowledgeBase).filter(KnowledgeBase.id.in_(ids[start:start + 10000])).all()
+        by_category: Dict[Optional[str], List[KnowledgeBase]] = {}
+        for k in batch:
+            by_category.setdefault(k.category, []).append(k)
+        for category, rows in by_category.items():
+            vectors = [
+                k.embedding if k.embedding and len(k.embedding) == EMBEDDING_DIM
+                else generate_embedding(k.content)
+                for k in rows
+            ]
+            index.add(category, [k.id for k in rows], vectors)
+
+
+def _reconcile_knowledge_index(db: Session, index: PartitionedIVFIndex) -> None:
+    """Full pass: index every missing row and drop ids whose rows are gone."""
+    index.refresh()
+    indexed = set(index.ids())
+    present = {row.id for row in db.query(KnowledgeBase.id)}
+    stale = indexed - present
+    if stale:
+        index.remove(list(stale))
+    _index_knowledge_rows(db, index, [i for i in present if i not in indexed])
+
+
+def _sync_knowledge_index(db: Session) -> PartitionedIVFIndex:
+    """Bring the index up to date with ``knowledge_base`` through any worker's writes.
+
+    The first sync in a process (or after the change log no longer matches the
+    watermark, e.g. a restored database) reconciles every row. After that only
+    the ``knowledge_changes`` entries past the watermark are replayed: inserted
+    rows are indexed and tombstoned ones removed. When nothing changed this
+    costs two primary-key lookups.
+    """
+    global _knowledge_index_watermark
+    index = get_knowledge_index()
+    latest = db.query(func.max(KnowledgeChange.seq)).scalar() or 0
+    watermark = _knowledge_index_watermark
+    if watermark is not None and watermark[0] > 0:
+        logged = db.query(KnowledgeChange.knowledge_id).filter(KnowledgeChange.seq == watermark[0]).scalar()
+        if logged != watermark[1]:
+            watermark = None
+    if watermark is not None and latest == watermark[0]:
+        return index
+
+    if watermark is None or latest < watermark[0]:
+        last = db.query(KnowledgeChange.knowledge_id).filter(KnowledgeChange.seq == latest).scalar()
+        _reconcile_knowledge_index(db, index)
+        _knowledge_index_watermark = (latest, last)
+        return index
+
+    changes = (
+        db.query(KnowledgeChange)
+        .filter(KnowledgeChange.seq > watermark[0])
+        .order_by(KnowledgeChange.seq)
         .all()
     )
-    return memories, total
+    index.refresh()
+    removed = {c.knowledge_id for c in changes if c.deleted}
+    if removed:
+        index.remove(list(removed))
+    _index_knowledge_rows(db, index, [c.knowledge_id for c in changes if c.knowledge_id not in removed])
+
+    # Replaying is idempotent, so stop the watermark at an unsettled gap and re-read from there
+    settled = datetime.utcnow().timestamp() - KNOWLEDGE_CHANGE_SETTLE_SECONDS
+    for change in changes:
+        if change.seq != watermark[0] + 1 and change.created_at.timestamp() > settled:
+            break
+        watermark = (change.seq, change.knowledge_id)
+    _knowledge_index_watermark = watermark
+    return index
 
 
 def add_knowledge(
@@ -147,7 +389,7 @@ def add_knowledge(
     category: Optional[str] = None,
     tags: Optional[List[str]] = None,
 ) -> KnowledgeBase:
-    embedding = _generate_embedding(content)
+    embedding = generate_embedding(content)
     knowledge = KnowledgeBase(
         title=title,
         content=content,
@@ -159,6 +401,8 @@ def add_knowledge(
     db.add(knowledge)
     db.commit()
     db.refresh(knowledge)
+    # Replays this insert (and anything else logged since) and advances the watermark
+    _sync_knowledge_index(db)
     return knowledge
 
 
@@ -167,20 +411,38 @@ def search_knowledge(
     query: str,
     category: Optional[str] = None,
     limit: int = 10,
+    mode: str = "semantic",
 ) -> Tuple[List[KnowledgeBase], int]:
-    q = db.query(KnowledgeBase)
-    if category:
-        q = q.filter(KnowledgeBase.category == category)
-    search_term = f"%{query}%"
-    q = q.filter(
-        or_(
-            KnowledgeBase.title.ilike(search_term),
-            KnowledgeBase.content.ilike(search_term),
+    if mode == "keyword":
+        q = db.query(KnowledgeBase)
+        if category:
+            q = q.filter(KnowledgeBase.category == category)
+        search_term = f"%{query}%"
+        q = q.filter(
+            or_(
+                KnowledgeBase.title.ilike(search_term),
+                KnowledgeBase.content.ilike(search_term),
+            )
         )
+        total = q.count()
+        results = q.order_by(KnowledgeBase.created_at.desc()).limit(limit).all()
+        return results, total
+    if mode != "semantic":
+        raise ValueError(f"Unsupported search mode: {mode}")
+
+    index = _sync_knowledge_index(db)
+    # Over-fetch slightly so ids whose rows were removed out-of-band do not shrink the page
+    hits = index.search(
+        generate_embedding(query), limit * 2, label=category, all_partitions=category is None
     )
-    total = q.count()
-    results = q.order_by(KnowledgeBase.created_at.desc()).limit(limit).all()
-    return results, total
+    hits = [(knowledge_id, score) for knowledge_id, score in hits if score > 0.0]
+    if not hits:
+        return [], 0
+    by_id = {
+        k.id: k for k in db.query(KnowledgeBase).filter(KnowledgeBase.id.in_([i for i, _ in hits])).all()
+    }
+    results = [by_id[i] for i, _ in hits if i in by_id][:limit]
+    return results, len(results)
 
 
 def get_memory_stats(db: Session, agent_id: Optional[uuid.UUID]) -> Dict[str, Any]:
@@ -7,6 +7,7 @@ import asyncio
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from app.services.admission_service import Priority
 from app.services.execution_service import execution_service
 
 logger = logging.getLogger(__name__)
@@ -103,6 +104,7 @@ class MetaAgentService:
                 agent_config=agent_config,
                 input_data=case["input"],
                 user_id="meta-agent-evaluator",
+                priority=Priority.BACKGROUND,
             )
 
             output_text = ""
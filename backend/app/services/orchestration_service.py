@@ -8,6 +8,7 @@ from app.models.workflow import (
 )
 from app.schemas.workflow import WorkflowCreate, WorkflowUpdate
 from app.services.utils import generate_slug
+from app.services.pagination import paginate
 
 
 def create_workflow(db: Session, workflow_data: WorkflowCreate, owner_id: uuid.UUID) -> Workflow:
@@ -19,6 +20,7 @@ def create_workflow(db: Session, workflow_data: WorkflowCreate, owner_id: uuid.U
         variables=workflow_data.variables,
         is_template=workflow_data.is_template,
         is_public=workflow_data.is_public,
+        is_background=workflow_data.is_background,
         status=WorkflowStatus.DRAFT.value,
     )
     db.add(workflow)
@@ -56,7 +58,9 @@ def list_workflows(
     is_public: Optional[bool] = None,
     page: int = 1,
     page_size: int = 20,
-) -> Tuple[List[Workflow], int]:
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+) -> Tuple[List[Workflow], Optional[int]]:
     query = db.query(Workflow)
 
     if owner_id:
@@ -66,8 +70,8 @@ def list_workflows(
     if is_public is not None:
         query = query.filter(Workflow.is_public == is_public)
 
-    total = query.count()
-    workflows = query.order_by(Workflow.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    total = query.count() if with_total else None
+    workflows = paginate(query, Workflow.created_at, Workflow.id, page, page_size, cursor)
 
     return workflows, total
 
@@ -0,0 +1,60 @@
+"""
+Keyset pagination - opaque cursors over a (timestamp, id) sort key, newest first.
+A cursor encodes the sort key of the last row on a page, so the next page is an
+index range scan instead of an OFFSET that has to walk every earlier row.
+"""
+import json
+import uuid
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(sort_value: datetime, row_id: uuid.UUID) -> str:
+    payload = json.dumps([sort_value.isoformat(), str(row_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Raises ValueError for cursors this module did not produce."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(sort_value), uuid.UUID(row_id)
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def paginate(
+    query: Query,
+    sort_column: Any,
+    id_column: Any,
+    page: int = 1,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+) -> List[Any]:
+    """Return one page ordered by (sort_column, id_column) descending.
+
+    With a cursor the page starts strictly after the cursor's row and ``page`` is
+    ignored; otherwise falls back to OFFSET paging.
+    """
+    query = query.order_by(sort_column.desc(), id_column.desc())
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < row_id))
+        )
+    else:
+        query = query.offset((page - 1) * page_size)
+    return query.limit(page_size).all()
+
+
+def next_cursor(items: List[Any], page_size: int, sort_attr: str = "created_at") -> Optional[str]:
+    """Cursor for the page after ``items``, or None when this page was not full."""
+    if len(items) < page_size or not items:
+        return None
+    last = items[-1]
+    return encode_cursor(getattr(last, sort_attr), last.id)
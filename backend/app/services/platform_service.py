@@ -1,8 +1,20 @@
+"""
+Platform service - platform-wide statistics and their periodic snapshots.
+
+Stats are materialized in memory by ``PlatformStatsMaterializer``. Inserts and
+deletes of the counted models are applied as deltas once their session
+commits, and the whole set is recomputed in a single round trip whenever it is
+older than ``platform_stats_max_age_seconds``. That refresh corrects anything
+events cannot see (credit balances moved by Core updates, rolling execution
+windows, bulk statements, other workers).
+"""
 import uuid
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import desc, event, func, select
+from app.config import settings
 from app.models.platform_stats import PlatformSnapshot
 from app.models.user import User
 from app.models.agent import Agent
@@ -10,58 +22,154 @@ from app.models.workflow import Workflow, WorkflowExecution
 from app.models.economy import CreditAccount
 from app.models.federation import FederationNode, FederatedAgent
 
+# Counters maintained from ORM inserts/deletes, by model
+_COUNTED = {
+    Agent: "total_agents",
+    FederatedAgent: "total_federated_agents",
+    User: "total_users",
+    Workflow: "total_workflows",
+    FederationNode: "federation_nodes_count",
+}
+_EXECUTION_WINDOWS = (("executions_today", 0), ("executions_week", 7), ("executions_month", 30))
+_DELTAS_KEY = "platform_stats_deltas"
+
+
+def _counters_for(obj: Any) -> Tuple[str, ...]:
+    if isinstance(obj, WorkflowExecution):
+        started_at = obj.started_at or datetime.utcnow()
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        return tuple(
+            name for name, days in _EXECUTION_WINDOWS
+            if started_at >= today_start - timedelta(days=days)
+        )
+    name = _COUNTED.get(type(obj))
+    return (name,) if name else ()
 
-def get_platform_stats(db: Session) -> dict:
-    total_agents = db.query(func.count(Agent.id)).scalar() or 0
-    total_federated_agents = db.query(func.count(FederatedAgent.id)).scalar() or 0
-    total_users = db.query(func.count(User.id)).scalar() or 0
-    total_workflows = db.query(func.count(Workflow.id)).scalar() or 0
 
+def _compute_stats(db: Session) -> Dict[str, Any]:
     now = datetime.utcnow()
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=7)
-    month_start = today_start - timedelta(days=30)
-
-    executions_today = (
-        db.query(func.count(WorkflowExecution.id))
-        .filter(WorkflowExecution.started_at >= today_start)
-        .scalar() or 0
-    )
-    executions_week = (
-        db.query(func.count(WorkflowExecution.id))
-        .filter(WorkflowExecution.started_at >= week_start)
-        .scalar() or 0
-    )
-    executions_month = (
-        db.query(func.count(WorkflowExecution.id))
-        .filter(WorkflowExecution.started_at >= month_start)
-        .scalar() or 0
-    )
-
-    total_credits_supply = db.query(func.sum(CreditAccount.balance)).scalar() or 0.0
-    credits_velocity = db.query(func.sum(CreditAccount.total_spent)).scalar() or 0.0
-    federation_nodes_count = db.query(func.count(FederationNode.id)).scalar() or 0
 
+    def count(column, *criteria):
+        return select(func.count(column)).where(*criteria).scalar_subquery()
+
+    def total(column):
+        return select(func.coalesce(func.sum(column), 0.0)).scalar_subquery()
+
+    started = WorkflowExecution.started_at
+    row = db.execute(select(
+        count(Agent.id).label("total_agents"),
+        count(FederatedAgent.id).label("total_federated_agents"),
+        count(User.id).label("total_users"),
+        count(Workflow.id).label("total_workflows"),
+        *[
+            count(WorkflowExecution.id, started >= today_start - timedelta(days=days)).label(name)
+            for name, days in _EXECUTION_WINDOWS
+        ],
+        total(CreditAccount.balance).label("total_credits_supply"),
+        total(CreditAccount.total_spent).label("credits_velocity"),
+        count(FederationNode.id).label("federation_nodes_count"),
+    )).one()
     return {
-        "total_agents": total_agents,
-        "total_federated_agents": total_federated_agents,
-        "total_users": total_users,
-        "total_workflows": total_workflows,
-        "executions_today": executions_today,
-        "executions_week": executions_week,
-        "executions_month": executions_month,
-        "total_credits_supply": total_credits_supply,
-        "credits_velocity": credits_velocity,
-        "federation_nodes_count": federation_nodes_count,
+        **row._asdict(),
         "top_models": [],
         "top_agents": [],
         "benchmark_trends": [],
     }
 
 
+class PlatformStatsMaterializer:
+    """In-memory platform stats kept current by commit deltas and periodic refresh."""
+
+    def __init__(self, max_age_seconds: float = 60.0):
+        self.max_age_seconds = max_age_seconds
+        self._stats: Optional[Dict[str, Any]] = None
+        self._refreshed_at: Optional[datetime] = None
+        self._updated_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        return (
+            self._refreshed_at is None
+            or (datetime.utcnow() - self._refreshed_at).total_seconds() >= self.max_age_seconds
+        )
+
+    def get(self, db: Session) -> Dict[str, Any]:
+        """Current stats plus ``refreshed_at`` (last full recount) and ``updated_at``."""
+        if self._is_stale():
+            with self._refresh_lock:
+                if self._is_stale():
+                    self.refresh(db)
+        with self._lock:
+            return {
+                **self._stats,
+                "refreshed_at": self._refreshed_at,
+                "updated_at": self._updated_at,
+            }
+
+    def refresh(self, db: Session) -> None:
+        stats = _compute_stats(db)
+        now = datetime.utcnow()
+        with self._lock:
+            self._stats = stats
+            self._refreshed_at = self._updated_at = now
+
+    def apply(self, deltas: Dict[str, int]) -> None:
+        with self._lock:
+            if self._stats is None:
+                return
+            for name, delta in deltas.items():
+                self._stats[name] = max(0, self._stats[name] + delta)
+            self._updated_at = datetime.utcnow()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._stats = None
+            self._refreshed_at = self._updated_at = None
+
+
+# Singleton instance
+platform_stats = PlatformStatsMaterializer(settings.platform_stats_max_age_seconds)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stat_deltas(session: Session, flush_context: Any) -> None:
+    deltas = None
+    for objects, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            names = _counters_for(obj)
+            if names:
+                deltas = deltas if deltas is not None else session.info.setdefault(_DELTAS_KEY, {})
+                for name in names:
+                    deltas[name] = deltas.get(name, 0) + sign
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_stat_deltas(session: Session) -> None:
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        platform_stats.apply(deltas)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_stat_deltas(session: Session, transaction: Any) -> None:
+    # Runs after after_commit, so anything left here was rolled back
+    if transaction.parent is None:
+        session.info.pop(_DELTAS_KEY, None)
+
+
+def get_platform_stats(db: Session) -> dict:
+    return platform_stats.get(db)
+
+
 def create_snapshot(db: Session) -> PlatformSnapshot:
-    stats = get_platform_stats(db)
-    snapshot = PlatformSnapshot(**stats)
+    stats = platform_stats.get(db)
+    snapshot = PlatformSnapshot(**{
+        column: stats[column]
+        for column in PlatformSnapshot.__table__.columns.keys()
+        if column in stats
+    })
     db.add(snapshot)
     db.commit()
     db.refresh(snapshot)
@@ -3,66 +3,18 @@ Recursive agent service - enables agents to spawn sub-agents, feed back results,
 and self-modify workflows with depth and circuit-breaker safety controls.
 """
 import uuid
-import time
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List
 from datetime import datetime
 
 from app.services.execution_service import execution_service, ExecutionResult
+from app.services.resilience import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
 MAX_RECURSION_DEPTH = 5
 
 
-class CircuitBreaker:
-    """Prevents infinite loops by tracking failure rates and tripping open."""
-
-    CLOSED = "closed"
-    OPEN = "open"
-    HALF_OPEN = "half_open"
-
-    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0):
-        self.failure_threshold = failure_threshold
-        self.recovery_timeout = recovery_timeout
-        self.state = self.CLOSED
-        self.failure_count = 0
-        self.last_failure_time: Optional[float] = None
-        self.success_count = 0
-
-    def record_success(self) -> None:
-        self.failure_count = 0
-        self.success_count += 1
-        if self.state == self.HALF_OPEN:
-            self.state = self.CLOSED
-
-    def record_failure(self) -> None:
-        self.failure_count += 1
-        self.last_failure_time = time.time()
-        if self.failure_count >= self.failure_threshold:
-            self.state = self.OPEN
-
-    def can_execute(self) -> bool:
-        if self.state == self.CLOSED:
-            return True
-        if self.state == self.OPEN:
-            if (
-                self.last_failure_time
-                and (time.time() - self.last_failure_time) >= self.recovery_timeout
-            ):
-                self.state = self.HALF_OPEN
-                return True
-            return False
-        # HALF_OPEN: allow one request to test recovery
-        return True
-
-    def reset(self) -> None:
-        self.state = self.CLOSED
-        self.failure_count = 0
-        self.success_count = 0
-        self.last_failure_time = None
-
-
 class RecursiveAgentService:
     """Handles recursive agent patterns: sub-agent spawning, feedback loops, and
     self-modifying workflows with safety limits."""
@@ -73,7 +25,9 @@ class RecursiveAgentService:
 
     def _get_circuit_breaker(self, key: str) -> CircuitBreaker:
         if key not in self.circuit_breakers:
-            self.circuit_breakers[key] = CircuitBreaker()
+            # Not every path reports an outcome after can_execute, so a half-open
+            # breaker admits every call rather than one probe that may never report
+            self.circuit_breakers[key] = CircuitBreaker(single_probe=False)
         return self.circuit_breakers[key]
 
     def _get_depth(self, agent_id: str) -> int:
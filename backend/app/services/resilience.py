@@ -0,0 +1,140 @@
+"""
+Resilience primitives - circuit breakers, jittered retry backoff and hedged
+calls, shared by the execution and recursive agent services.
+"""
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Trips open after ``failure_threshold`` consecutive failures.
+
+    While open every call is refused. Once ``recovery_timeout`` has passed the
+    breaker goes half-open and admits a single probe: success closes it again,
+    failure re-opens it. A probe that never reports back is replaced after
+    another ``recovery_timeout``. With ``single_probe=False`` a half-open
+    breaker admits every call until one of them reports back.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0, single_probe: bool = True):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.single_probe = single_probe
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.last_failure_time: Optional[float] = None
+        self.success_count = 0
+        self._probe_started: Optional[float] = None
+
+    def record_success(self) -> None:
+        self.failure_count = 0
+        self.success_count += 1
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failure_count += 1
+        self.last_failure_time = time.time()
+        if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+            self.state = self.OPEN
+            self._probe_started = None
+
+    def available(self) -> bool:
+        """Whether ``can_execute`` would admit a call, without claiming the probe."""
+        now = time.time()
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return bool(self.last_failure_time) and (now - self.last_failure_time) >= self.recovery_timeout
+        return (
+            not self.single_probe
+            or self._probe_started is None
+            or (now - self._probe_started) >= self.recovery_timeout
+        )
+
+    def can_execute(self) -> bool:
+        if not self.available():
+            return False
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # One probe at a time unless single_probe is off
+            self._probe_started = time.time()
+        return True
+
+    def release_probe(self) -> None:
+        """Free the half-open probe slot for a call that ended without an outcome.
+
+        Used when the probe was cancelled or failed in a way that says nothing
+        about the dependency's health, so the next call can probe straight away
+        instead of waiting out ``recovery_timeout``.
+        """
+        if self.state == self.HALF_OPEN:
+            self._probe_started = None
+
+    def reset(self) -> None:
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.success_count = 0
+        self.last_failure_time = None
+        self._probe_started = None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transport errors, timeouts, 429 and 5xx are worth retrying; other errors are not."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, (httpx.TransportError, CircuitOpenError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[Any]],
+    backup: Optional[Callable[[], Awaitable[Any]]],
+    delay: float,
+) -> Any:
+    """Run ``primary``; if it has not finished after ``delay`` seconds, also run
+    ``backup`` and return whichever succeeds first, cancelling the other.
+
+    A primary that fails before the delay raises straight away, and the error
+    of the last call to fail is raised when both fail.
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    try:
+        if backup is None:
+            return await tasks[0]
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        tasks.append(asyncio.ensure_future(backup()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
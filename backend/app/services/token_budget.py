@@ -0,0 +1,125 @@
+"""
+Token budgeting - fast local estimates of prompt size per provider family, used
+to fit prompts into the model's context window and to price a call before it
+is sent.
+
+No tokenizer vocabularies are loaded. Text is split into word and punctuation
+pieces, and the estimate is the larger of the piece count and characters
+divided by the provider tokenizer's average characters per token. This errs
+slightly high for prose and code, which is the safe side for rejecting or
+trimming.
+"""
+import math
+import re
+from typing import Dict, List, NamedTuple
+
+# Average characters per token for each provider's tokenizer family
+CHARS_PER_TOKEN: Dict[str, float] = {
+    "openai": 4.0,      # cl100k BPE
+    "anthropic": 3.5,
+    "mistral": 3.5,     # SentencePiece, 32k vocabulary
+    "groq": 4.0,        # Llama 3 BPE
+    "ollama": 4.0,
+}
+
+# Chat formatting adds a few tokens per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude-3-opus-20240229": 200000,
+    "claude-3-sonnet-20240229": 200000,
+    "claude-3-haiku-20240307": 200000,
+    "mistral-large-latest": 32768,
+    "mistral-medium-latest": 32768,
+    "mistral-small-latest": 32768,
+    "llama-3.1-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "mixtral-8x7b-32768": 32768,
+}
+
+# Unknown models: Ollama serves a 4k context unless num_ctx is raised
+DEFAULT_CONTEXT_WINDOWS: Dict[str, int] = {"ollama": 4096}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+TRUNCATION_MARKER = "\n\n[... input truncated to fit the model's context window ...]\n\n"
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+class PromptBudget(NamedTuple):
+    messages: List[Dict[str, str]]
+    input_tokens: int
+    max_tokens: int
+    truncated: bool
+
+
+class PromptBudgetError(ValueError):
+    """The prompt cannot be sent: too large for the model window or over the cost limit."""
+
+
+def estimate_tokens(text: str, provider: str) -> int:
+    if not text:
+        return 0
+    chars_per_token = CHARS_PER_TOKEN.get(provider, 4.0)
+    return max(len(_PIECE.findall(text)), math.ceil(len(text) / chars_per_token))
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]], provider: str) -> int:
+    return sum(MESSAGE_OVERHEAD_TOKENS + estimate_tokens(m["content"], provider) for m in messages)
+
+
+def context_window(provider: str, model: str) -> int:
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOWS.get(provider, DEFAULT_CONTEXT_WINDOW))
+
+
+def _truncate(text: str, provider: str, budget: int) -> str:
+    """Keep the head and tail of ``text`` within ``budget`` tokens, marking the cut."""
+    marker_tokens = estimate_tokens(TRUNCATION_MARKER, provider)
+    chars = int((budget - marker_tokens) * CHARS_PER_TOKEN.get(provider, 4.0))
+    while chars > 0:
+        head = chars // 2
+        trimmed = text[:head] + TRUNCATION_MARKER + text[len(text) - (chars - head):]
+        if estimate_tokens(trimmed, provider) <= budget:
+            return trimmed
+        chars = int(chars * 0.9)
+    return ""
+
+
+def fit_messages(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    truncate: bool = True,
+) -> PromptBudget:
+    """Fit ``messages`` and a completion of up to ``max_tokens`` into the model's window.
+
+    ``max_tokens`` is a ceiling: it is lowered to the room the prompt leaves,
+    but the completion always keeps at least a quarter of the window (or all of
+    ``max_tokens`` if smaller). To make that room the last message (the user
+    input) is trimmed, keeping its beginning and end. Raises PromptBudgetError
+    when the prompt does not fit and cannot be trimmed.
+    """
+    window = context_window(provider, model)
+    reserve = min(max_tokens, window // 4)
+    input_tokens = estimate_message_tokens(messages, provider)
+    if input_tokens + reserve <= window:
+        return PromptBudget(messages, input_tokens, min(max_tokens, window - input_tokens), False)
+
+    overflow = (
+        f"Prompt of ~{input_tokens} tokens plus {reserve} completion tokens "
+        f"exceeds the {window}-token context window of {model}"
+    )
+    if not truncate or not messages:
+        raise PromptBudgetError(overflow)
+    *context, last = messages
+    budget = window - reserve - estimate_message_tokens(context, provider) - MESSAGE_OVERHEAD_TOKENS
+    trimmed = _truncate(last["content"], provider, budget) if budget > 0 else ""
+    if not trimmed:
+        raise PromptBudgetError(overflow)
+    fitted = context + [{**last, "content": trimmed}]
+    input_tokens = estimate_message_tokens(fitted, provider)
+    return PromptBudget(fitted, input_tokens, min(max_tokens, window - input_tokens), True)
@@ -0,0 +1,270 @@
+"""
+Usage counter service - O(1) rolling-window request counters for API keys and
+write-behind batching of per-key usage bookkeeping.
+
+Counters live in sharded in-process ring buffers by default, or in Redis (an
+approximate sliding window over two fixed windows) so every worker enforces one
+shared limit. Usage counts and last-used timestamps are accumulated in memory
+and written to ``api_keys`` in a single batched UPDATE every flush interval.
+"""
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Uuid, bindparam, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.session import SessionLocal
+from app.models.billing import ApiKey
+
+logger = logging.getLogger(__name__)
+
+
+class _Ring:
+    __slots__ = ("counts", "epoch", "total")
+
+    def __init__(self, buckets: int, epoch: int):
+        self.counts = [0] * buckets
+        self.epoch = epoch
+        self.total = 0
+
+
+class RollingWindowCounter:
+    """Per-key request counts over a rolling window, split into ``buckets`` slots.
+
+    Keys are spread over ``shards`` independently locked dicts so threadpool
+    workers rarely contend. Advancing a ring clears at most ``buckets`` slots,
+    so each hit is amortised O(1). Rings idle for a whole window are dropped by
+    ``sweep()``, which hits trigger every quarter window to keep memory bounded.
+    """
+
+    def __init__(self, window_seconds: float = 3600.0, buckets: int = 60, shards: int = 16):
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self._shards: List[Dict[str, _Ring]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._next_sweep = time.time() + window_seconds / 4
+
+    def _shard(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+
+    def _advance(self, ring: _Ring, epoch: int) -> None:
+        steps = min(epoch - ring.epoch, self.buckets)
+        for offset in range(1, steps + 1):
+            slot = (ring.epoch + offset) % self.buckets
+            ring.total -= ring.counts[slot]
+            ring.counts[slot] = 0
+        ring.epoch = max(ring.epoch, epoch)
+
+    def hit(self, key: str, limit: int) -> Tuple[bool, int]:
+        """Count one request unless ``limit`` is already reached; returns (allowed, count)."""
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.window_seconds / 4
+            self.sweep()
+        epoch = int(now // self.bucket_seconds)
+        shard = self._shard(key)
+        with self._locks[shard]:
+            ring = self._shards[shard].get(key)
+            if ring is None:
+                ring = self._shards[shard][key] = _Ring(self.buckets, epoch)
+            else:
+                self._advance(ring, epoch)
+            if ring.total >= limit:
+                return False, ring.total
+            ring.counts[epoch % self.buckets] += 1
+            ring.total += 1
+            return True, ring.total
+
+    def count(self, key: str) -> int:
+        epoch = int(time.time() // self.bucket_seconds)
+        shard = self._shard(key)
+        with self._locks[shard]:
+            ring = self._shards[shard].get(key)
+            if ring is None:
+                return 0
+            self._advance(ring, epoch)
+            return ring.total
+
+    def sweep(self) -> int:
+        """Drop rings with no hits inside the window; returns how many were dropped."""
+        cutoff = int(time.time() // self.bucket_seconds) - self.buckets
+        dropped = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                for key in [k for k, ring in shard.items() if ring.epoch <= cutoff]:
+                    del shard[key]
+                    dropped += 1
+        return dropped
+
+    def reset(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+# Sliding-window estimate from the current and previous fixed windows, weighted by
+# how far into the current window we are. O(1) keys and commands per hit.
+RATE_COUNTER_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.replicate_commands()
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local index = math.floor(now / window)
+local current_key = KEYS[1] .. ':' .. index
+local previous = tonumber(redis.call('GET', KEYS[1] .. ':' .. (index - 1)) or '0')
+local current = tonumber(redis.call('GET', current_key) or '0')
+local weight = 1 - (now - index * window) / window
+local estimate = math.floor(previous * weight + current)
+if estimate >= limit then
+    return {0, estimate}
+end
+redis.call('INCR', current_key)
+redis.call('EXPIRE', current_key, math.ceil(window * 2))
+return {1, estimate + 1}
+"""
+
+
+class RedisWindowCounter:
+    """Rolling-window counter shared across workers and nodes through Redis.
+
+    Falls back to an in-process counter for a few seconds whenever Redis errors.
+    """
+
+    KEY_PREFIX = "apikey-rate:"
+    RETRY_SECONDS = 5.0
+
+    def __init__(self, redis_url: str, window_seconds: float = 3600.0, client: Any = None):
+        self.redis_url = redis_url
+        self.window_seconds = window_seconds
+        self.fallback = RollingWindowCounter(window_seconds)
+        self._redis: Any = client
+        self._script: Any = None
+        self._retry_at = 0.0
+
+    def _get_script(self) -> Any:
+        if self._script is None:
+            if self._redis is None:
+                import redis as redis_lib
+
+                self._redis = redis_lib.from_url(self.redis_url, socket_connect_timeout=2)
+            self._script = self._redis.register_script(RATE_COUNTER_SCRIPT)
+        return self._script
+
+    def hit(self, key: str, limit: int) -> Tuple[bool, int]:
+        if time.monotonic() < self._retry_at:
+            return self.fallback.hit(key, limit)
+        try:
+            allowed, count = self._get_script()(
+                keys=[self.KEY_PREFIX + key], args=[limit, int(self.window_seconds)],
+            )
+        except Exception as exc:
+            logger.warning("Redis usage counter unavailable, using local counts: %s", exc)
+            self._retry_at = time.monotonic() + self.RETRY_SECONDS
+            return self.fallback.hit(key, limit)
+        return bool(allowed), int(count)
+
+    def sweep(self) -> int:
+        return self.fallback.sweep()
+
+    def reset(self) -> None:
+        self.fallback.reset()
+
+
+class UsageBatcher:
+    """Accumulates per-key usage in memory and writes it in one batched UPDATE.
+
+    ``record()`` is O(1). ``flush_if_due()`` writes at most once per
+    ``flush_seconds`` through its own session from ``session_factory``, so the
+    caller's transaction is never committed or rolled back; on failure the
+    pending deltas are merged back so nothing is lost.
+    """
+
+    def __init__(self, flush_seconds: float = 5.0, session_factory: Callable[[], Session] = SessionLocal):
+        self.flush_seconds = flush_seconds
+        self.session_factory = session_factory
+        self._pending: Dict[uuid.UUID, Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, key_id: uuid.UUID, used_at: Optional[datetime] = None) -> None:
+        used_at = used_at or datetime.utcnow()
+        with self._lock:
+            uses, _ = self._pending.get(key_id, (0, used_at))
+            self._pending[key_id] = (uses + 1, used_at)
+
+    def pending(self, key_id: uuid.UUID) -> int:
+        with self._lock:
+            return self._pending.get(key_id, (0, None))[0]
+
+    def flush(self, db: Session) -> int:
+        """Write all pending usage; returns the number of keys updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        table = ApiKey.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("key_id", type_=Uuid))
+            .values(
+                usage_count=table.c.usage_count + bindparam("uses"),
+                last_used_at=bindparam("used_at"),
+            )
+        )
+        try:
+            db.execute(statement, [
+                {"key_id": key_id, "uses": uses, "used_at": used_at}
+                for key_id, (uses, used_at) in pending.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for key_id, (uses, used_at) in pending.items():
+                    current_uses, current_used_at = self._pending.get(key_id, (0, used_at))
+                    self._pending[key_id] = (current_uses + uses, max(used_at, current_used_at))
+            raise
+        return len(pending)
+
+    def flush_if_due(self) -> int:
+        if time.monotonic() - self._last_flush < self.flush_seconds:
+            return 0
+        try:
+            return self.flush_with()
+        except Exception as exc:
+            logger.warning("Failed to flush API key usage: %s", exc)
+            return 0
+
+    def flush_with(self, session_factory: Optional[Callable[[], Session]] = None) -> int:
+        """Flush through a fresh session (``session_factory`` by default), e.g. on shutdown."""
+        with self._lock:
+            if not self._pending:
+                self._last_flush = time.monotonic()
+                return 0
+        db = (session_factory or self.session_factory)()
+        try:
+            return self.flush(db)
+        finally:
+            db.close()
+
+
+def build_rate_counter():
+    if settings.api_key_counter_backend == "redis":
+        return RedisWindowCounter(settings.redis_url, settings.api_key_rate_window_seconds)
+    return RollingWindowCounter(settings.api_key_rate_window_seconds)
+
+
+# Singleton instances
+api_key_rate_counter = build_rate_counter()
+api_key_usage = UsageBatcher(flush_seconds=settings.api_key_usage_flush_seconds)
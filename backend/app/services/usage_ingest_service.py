@@ -0,0 +1,280 @@
+"""
+Usage ingest service - write-behind queue for UsageRecord and ModelUsage rows.
+
+Producers enqueue plain column dicts; a background task started in the app
+lifespan writes them with one bulk INSERT per table every ``flush_interval_ms``
+or as soon as ``batch_size`` rows are waiting. When ``max_pending`` rows are
+queued (the database is not keeping up) async producers await ``put()`` until
+the flusher makes room; sync producers, and ``put()`` after ``max_wait_seconds``,
+drop the row and count it in ``rows_dropped``. Producers never write on the
+event loop. Without a running flusher (scripts, unit tests) every enqueue is
+written through.
+
+Flush hooks registered per table run in the same transaction as the insert,
+which is how derived tables such as usage rollups stay in step with ingest.
+A batch that fails on its data (constraint or type errors) is split in halves
+until the offending rows are isolated; those are retried on later flushes and
+moved to ``usage_dead_letters`` after ``max_attempts``. Connection failures
+re-queue the whole batch.
+"""
+import asyncio
+import logging
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+
+from app.config import settings
+from app.models.billing import UsageDeadLetter
+
+logger = logging.getLogger(__name__)
+
+FlushHook = Callable[[Any, List[Dict[str, Any]]], None]
+
+
+def _row_error(exc: BaseException) -> bool:
+    """True when ``exc`` is caused by the rows themselves rather than the database being unavailable."""
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    return isinstance(exc, StatementError) and not isinstance(exc, DBAPIError)
+
+
+def _jsonable(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value.isoformat() if isinstance(value, datetime)
+        else str(value) if isinstance(value, uuid.UUID) else value
+        for key, value in values.items()
+    }
+
+
+class UsageIngestor:
+    """Buffers usage rows per (engine, table) and bulk-inserts them off the request path."""
+
+    def __init__(
+        self,
+        flush_interval_ms: int = 250,
+        batch_size: int = 500,
+        max_pending: int = 10000,
+        max_attempts: int = 3,
+        max_wait_seconds: float = 5.0,
+    ):
+        self.flush_interval_ms = flush_interval_ms
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.max_wait_seconds = max_wait_seconds
+        self._buffers: Dict[Tuple[Engine, Any], List[Dict[str, Any]]] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._hooks: Dict[Any, List[FlushHook]] = {}
+        # Failed write attempts per queued row, keyed by id() of its values dict
+        self._attempts: Dict[int, int] = {}
+        self.rows_written = 0
+        self.flushes = 0
+        self.rows_dropped = 0
+        self.rows_dead_lettered = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def add_flush_hook(self, table: Any, hook: FlushHook) -> None:
+        """Call ``hook(connection, rows)`` inside the transaction of every bulk insert into ``table``."""
+        self._hooks.setdefault(table, []).append(hook)
+
+    def enqueue(self, bind: Engine, model: Any, values: Dict[str, Any]) -> bool:
+        """Queue one row; returns False if it was dropped because the queue is full."""
+        with self._lock:
+            if self.running and self._pending >= self.max_pending:
+                self.rows_dropped += 1
+                logger.warning("Usage ingest queue full (%d rows), dropping a %s row", self._pending, model.__tablename__)
+                return False
+            self._buffers.setdefault((bind, model.__table__), []).append(values)
+            self._pending += 1
+            pending = self._pending
+
+        if not self.running:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return True
+
+    async def put(self, bind: Engine, model: Any, values: Dict[str, Any]) -> bool:
+        """Queue one row, waiting up to ``max_wait_seconds`` for room when the queue is full."""
+        if self.running and asyncio.get_running_loop() is self._loop:
+            deadline = self._loop.time() + self.max_wait_seconds
+            while self.running and self._pending >= self.max_pending:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                self._drained.clear()
+                self._wake.set()
+                try:
+                    await asyncio.wait_for(self._drained.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+        return self.enqueue(bind, model, values)
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of rows written.
+
+        Rows that fail on their data are isolated and re-queued (or dead-lettered
+        after ``max_attempts``); a connection failure re-queues the remaining
+        batches and is raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                buffers, self._buffers = self._buffers, {}
+                self._pending = 0
+            written = 0
+            items = list(buffers.items())
+            for index, ((bind, table), rows) in enumerate(items):
+                done: List[Dict[str, Any]] = []
+                failed: List[Tuple[Dict[str, Any], BaseException]] = []
+                try:
+                    self._write_isolating(bind, table, rows, done, failed)
+                except Exception:
+                    # Keep what a partial bisection already committed out of the retry
+                    settled = {id(row) for row in done}
+                    remaining = [row for row in rows if id(row) not in settled]
+                    self._requeue([((bind, table), remaining)] + items[index + 1:])
+                    self._count_written(written + len(done))
+                    raise
+                written += len(done)
+                self._retry_or_dead_letter(bind, table, failed)
+            self._count_written(written)
+            return written
+
+    def _count_written(self, written: int) -> None:
+        if written:
+            self.rows_written += written
+            self.flushes += 1
+
+    def _write(self, bind: Engine, table: Any, rows: List[Dict[str, Any]]) -> None:
+        with bind.begin() as connection:
+            connection.execute(insert(table), rows)
+            for hook in self._hooks.get(table, []):
+                hook(connection, rows)
+
+    def _write_isolating(
+        self,
+        bind: Engine,
+        table: Any,
+        rows: List[Dict[str, Any]],
+        done: List[Dict[str, Any]],
+        failed: List[Tuple[Dict[str, Any], BaseException]],
+    ) -> None:
+        """Write ``rows``, bisecting on data errors; collects written rows in ``done``
+        and (row, error) pairs that fail on their own in ``failed``."""
+        try:
+            self._write(bind, table, rows)
+        except Exception as exc:
+            if not _row_error(exc):
+                raise
+            if len(rows) == 1:
+                failed.append((rows[0], exc))
+                return
+            middle = len(rows) // 2
+            self._write_isolating(bind, table, rows[:middle], done, failed)
+            self._write_isolating(bind, table, rows[middle:], done, failed)
+            return
+        for row in rows:
+            self._attempts.pop(id(row), None)
+        done.extend(rows)
+
+    def _retry_or_dead_letter(
+        self, bind: Engine, table: Any, failed: List[Tuple[Dict[str, Any], BaseException]]
+    ) -> None:
+        retry = []
+        for row, exc in failed:
+            attempts = self._attempts.pop(id(row), 0) + 1
+            if attempts < self.max_attempts:
+                self._attempts[id(row)] = attempts
+                retry.append(row)
+                continue
+            self.rows_dead_lettered += 1
+            payload = _jsonable(row)
+            logger.error("Dead-lettering %s row after %d attempts: %s", table.name, attempts, exc)
+            try:
+                with bind.begin() as connection:
+                    connection.execute(insert(UsageDeadLetter.__table__), {
+                        "id": uuid.uuid4(),
+                        "table_name": table.name,
+                        "payload": payload,
+                        "error": str(exc)[:2000],
+                        "attempts": attempts,
+                        "created_at": datetime.utcnow(),
+                    })
+            except Exception as dead_letter_exc:
+                logger.error("Could not store dead-lettered %s row %s: %s", table.name, payload, dead_letter_exc)
+        if retry:
+            self._requeue([((bind, table), retry)])
+
+    def _requeue(self, items: List[Tuple[Tuple[Engine, Any], List[Dict[str, Any]]]]) -> None:
+        with self._lock:
+            for key, rows in items:
+                self._buffers[key] = rows + self._buffers.get(key, [])
+                self._pending += len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._pending:
+                self._drained.set()
+                continue
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as exc:
+                logger.warning("Usage ingest flush failed, will retry: %s", exc)
+            self._drained.set()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flusher and drain the queue."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._pending:
+            await asyncio.to_thread(self.flush)
+
+
+def build_usage_ingestor() -> UsageIngestor:
+    return UsageIngestor(
+        flush_interval_ms=settings.usage_ingest_flush_interval_ms,
+        batch_size=settings.usage_ingest_batch_size,
+        max_pending=settings.usage_ingest_max_pending,
+        max_attempts=settings.usage_ingest_max_attempts,
+        max_wait_seconds=settings.usage_ingest_max_wait_seconds,
+    )
+
+
+# Singleton instance
+usage_ingestor = build_usage_ingestor()
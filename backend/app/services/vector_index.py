@@ -0,0 +1,547 @@
+"""
+Vector helpers for embedding storage and similarity search.
+Embeddings are packed as contiguous little-endian float32 blobs so a whole
+candidate set can be scored with one NumPy matrix-vector product. IVFIndex adds
+an inverted-file approximate nearest-neighbour index for large collections,
+optionally persisted to memory-mapped files. Several workers may share one
+index directory: appends and removals take an exclusive file lock, and ids are
+de-duplicated both when written and when loaded.
+"""
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: single-writer only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def pack_embedding(embedding: Sequence[float]) -> bytes:
+    return np.asarray(embedding, dtype=VECTOR_DTYPE).tobytes()
+
+
+def unpack_embedding(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=VECTOR_DTYPE)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return matrix / norms
+
+
+def top_k_cosine(
+    matrix: np.ndarray, query: np.ndarray, k: int, live: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (row indices, scores) of the k rows most similar to ``query``.
+
+    ``matrix`` rows must already be L2-normalised. Rows where the optional
+    boolean mask ``live`` is False are never returned.
+    """
+    if matrix.shape[0] == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=VECTOR_DTYPE)
+    norm = float(np.linalg.norm(query))
+    if norm == 0.0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=VECTOR_DTYPE)
+    scores = matrix @ (query.astype(VECTOR_DTYPE) / norm)
+    if live is not None:
+        scores[~live] = -np.inf
+        k = min(k, int(np.count_nonzero(live)))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=VECTOR_DTYPE)
+    k = min(k, scores.shape[0])
+    # argpartition is O(n); only the k winners get fully sorted
+    top = np.argpartition(-scores, k - 1)[:k]
+    order = top[np.argsort(-scores[top], kind="stable")]
+    return order, scores[order]
+
+
+def _contains(sorted_ids: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Membership of ``keys`` in the sorted id array ``sorted_ids``."""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+    return sorted_ids[positions] == keys
+
+
+def _first_occurrences(keys: np.ndarray) -> np.ndarray:
+    """Mask keeping only the first occurrence of each id in ``keys``."""
+    keep = np.zeros(len(keys), dtype=bool)
+    keep[np.unique(keys, return_index=True)[1]] = True
+    return keep
+
+
+class EmbeddingMatrix:
+    """A packed, normalised embedding matrix with the row keys and labels it was built from."""
+
+    def __init__(self, keys: List[Any], labels: List[Any], vectors: List[np.ndarray], dim: int):
+        self.keys = keys
+        self.labels = np.asarray(labels, dtype=object)
+        if vectors:
+            self.matrix = normalize_rows(np.vstack(vectors).astype(VECTOR_DTYPE, copy=False))
+        else:
+            self.matrix = np.empty((0, dim), dtype=VECTOR_DTYPE)
+
+    def search(
+        self, query: Sequence[float], k: int, label: Optional[Any] = None
+    ) -> List[Tuple[Any, float]]:
+        matrix = self.matrix
+        keys = self.keys
+        if label is not None:
+            mask = self.labels == label
+            matrix = matrix[mask]
+            keys = [key for key, keep in zip(keys, mask) if keep]
+        rows, scores = top_k_cosine(matrix, np.asarray(query, dtype=VECTOR_DTYPE), k)
+        return [(keys[i], float(s)) for i, s in zip(rows, scores)]
+
+
+class EmbeddingMatrixCache:
+    """Process-local cache of EmbeddingMatrix objects keyed by partition.
+
+    Each entry carries a caller-supplied signature (e.g. row count and last
+    update time); a changed signature means the matrix is rebuilt, so writes
+    from other workers are picked up on the next query.
+    """
+
+    def __init__(self, max_partitions: int = 256):
+        self.max_partitions = max_partitions
+        self._entries: Dict[Hashable, Tuple[Hashable, EmbeddingMatrix]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, partition: Hashable, signature: Hashable) -> Optional[EmbeddingMatrix]:
+        with self._lock:
+            entry = self._entries.get(partition)
+        if entry is None or entry[0] != signature:
+            return None
+        return entry[1]
+
+    def put(self, partition: Hashable, signature: Hashable, matrix: EmbeddingMatrix) -> None:
+        with self._lock:
+            if partition not in self._entries and len(self._entries) >= self.max_partitions:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[partition] = (signature, matrix)
+
+    def invalidate(self, partition: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(partition, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class _VectorStore:
+    """Append-only (id, vector) storage: growable arrays in memory, or raw files mapped with np.memmap."""
+
+    def __init__(self, dim: int, prefix: Optional[str] = None):
+        self.dim = dim
+        self.prefix = prefix
+        self.count = 0
+        self.ids = np.empty((0,), dtype="V16")
+        self.vectors = np.empty((0, dim), dtype=VECTOR_DTYPE)
+        if prefix is None:
+            self._ids_buf = np.empty((1024,), dtype="V16")
+            self._vec_buf = np.empty((1024, dim), dtype=VECTOR_DTYPE)
+        else:
+            self.refresh()
+
+    def _path(self, suffix: str) -> str:
+        return f"{self.prefix}.{suffix}"
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive lock across processes sharing the files (a no-op in memory)."""
+        if self.prefix is None or fcntl is None:
+            yield
+            return
+        with open(self._path("lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_removed(self, offset: int) -> Tuple[np.ndarray, int]:
+        """Ids tombstoned since byte ``offset`` of the removals file, and the new offset."""
+        if self.prefix is None or not os.path.exists(self._path("removed")):
+            return np.empty((0,), dtype="V16"), offset
+        with open(self._path("removed"), "rb") as removed_file:
+            removed_file.seek(offset)
+            data = removed_file.read()
+        data = data[: len(data) // 16 * 16]
+        return np.frombuffer(data, dtype="V16"), offset + len(data)
+
+    def write_removed(self, ids: np.ndarray) -> None:
+        if self.prefix is not None:
+            with open(self._path("removed"), "ab") as removed_file:
+                removed_file.write(ids.tobytes())
+
+    def refresh(self) -> bool:
+        """Remap the backing files if another writer has appended to them. Returns True if grown."""
+        if self.prefix is None or not os.path.exists(self._path("vec")):
+            return False
+        count = min(
+            os.path.getsize(self._path("vec")) // (self.dim * VECTOR_DTYPE.itemsize),
+            os.path.getsize(self._path("ids")) // 16,
+        )
+        if count == self.count:
+            return False
+        self.count = count
+        if count:
+            self.vectors = np.memmap(self._path("vec"), dtype=VECTOR_DTYPE, mode="r", shape=(count, self.dim))
+            self.ids = np.memmap(self._path("ids"), dtype="V16", mode="r", shape=(count,))
+        return True
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        if self.prefix is not None:
+            with open(self._path("vec"), "ab") as vec_file, open(self._path("ids"), "ab") as ids_file:
+                vec_file.write(np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE).tobytes())
+                ids_file.write(ids.tobytes())
+            self.refresh()
+            return
+
+        needed = self.count + len(ids)
+        if needed > len(self._ids_buf):
+            capacity = max(needed, len(self._ids_buf) * 2)
+            self._ids_buf = np.resize(self._ids_buf, (capacity,))
+            grown = np.empty((capacity, self.dim), dtype=VECTOR_DTYPE)
+            grown[: self.count] = self._vec_buf[: self.count]
+            self._vec_buf = grown
+        self._ids_buf[self.count:needed] = ids
+        self._vec_buf[self.count:needed] = vectors
+        self.count = needed
+        self.ids = self._ids_buf[:needed]
+        self.vectors = self._vec_buf[:needed]
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalised vectors (cosine similarity).
+
+    Until ``train_threshold`` vectors are present the index searches exhaustively.
+    Past that it clusters the vectors with spherical k-means into ~sqrt(n) lists
+    and each query only scores the ``nprobe`` closest lists. Vectors added after
+    the lists were built are kept in a small tail that is always scanned, and the
+    lists are rebuilt (and the centroids retrained once the index has doubled)
+    as the tail grows.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        prefix: Optional[str] = None,
+        train_threshold: int = 20000,
+        nprobe: int = 8,
+        seed: int = 0,
+    ):
+        self.dim = dim
+        self.prefix = prefix
+        self.train_threshold = train_threshold
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+        self.store = _VectorStore(dim, prefix)
+        # Rows hidden from search: duplicates of an earlier row, or removed ids
+        self._live = np.zeros((0,), dtype=bool)
+        self._live_ids = np.empty((0,), dtype="V16")  # sorted
+        self._removed = np.empty((0,), dtype="V16")  # sorted
+        self._removed_offset = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty((0,), dtype=np.int32)
+        self.trained_at = 0
+        self._order = np.empty((0,), dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._listed = 0
+        self._saved_assignments = 0
+        self._centroids_mtime: Optional[float] = None
+        self._load_centroids()
+        self._sync_rows()
+
+    def __len__(self) -> int:
+        return len(self._live_ids)
+
+    def _sync_rows(self) -> None:
+        """Bring the live mask up to date with rows and removals written so far."""
+        removed, self._removed_offset = self.store.read_removed(self._removed_offset)
+        if len(removed):
+            self._apply_removals(removed)
+        checked = len(self._live)
+        count = self.store.count
+        if count <= checked:
+            return
+        new_ids = np.asarray(self.store.ids[checked:count])
+        live = _first_occurrences(new_ids) & ~_contains(self._live_ids, new_ids) & ~_contains(self._removed, new_ids)
+        self._live = np.concatenate([self._live, live])
+        added = np.sort(new_ids[live])
+        self._live_ids = np.insert(self._live_ids, np.searchsorted(self._live_ids, added), added)
+
+    def _apply_removals(self, ids: np.ndarray) -> None:
+        self._removed = np.union1d(self._removed, ids)
+        gone = _contains(self._removed, self._live_ids)
+        if gone.any():
+            self._live_ids = self._live_ids[~gone]
+            rows = np.flatnonzero(self._live)
+            self._live[rows[_contains(self._removed, np.asarray(self.store.ids[rows]))]] = False
+
+    # -- persistence ---------------------------------------------------------
+
+    def _centroids_path(self) -> Optional[str]:
+        return f"{self.prefix}.ivf.npz" if self.prefix else None
+
+    def _load_centroids(self) -> None:
+        path = self._centroids_path()
+        if path is None or not os.path.exists(path):
+            return
+        mtime = os.path.getmtime(path)
+        if mtime == self._centroids_mtime:
+            return
+        with np.load(path) as data:
+            self.centroids = data["centroids"].astype(VECTOR_DTYPE)
+            self.assignments = data["assignments"].astype(np.int32)
+            self.trained_at = int(data["trained_at"])
+        self._saved_assignments = len(self.assignments)
+        self._centroids_mtime = mtime
+        self._listed = 0
+
+    def _save_centroids(self) -> None:
+        path = self._centroids_path()
+        if path is None:
+            return
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            assignments=self.assignments,
+            trained_at=np.int64(self.trained_at),
+        )
+        os.replace(tmp_path, path)
+        self._saved_assignments = len(self.assignments)
+        self._centroids_mtime = os.path.getmtime(path)
+
+    def refresh(self) -> None:
+        """Pick up vectors, removals and centroids written by other processes."""
+        with self._lock:
+            self._load_centroids()
+            self.store.refresh()
+            self._sync_rows()
+
+    # -- maintenance ---------------------------------------------------------
+
+    def add(self, ids: Sequence[uuid.UUID], vectors: np.ndarray) -> None:
+        vectors = normalize_rows(np.asarray(vectors, dtype=VECTOR_DTYPE).reshape(-1, self.dim))
+        packed = np.array([i.bytes for i in ids], dtype="V16")
+        with self._lock:
+            with self.store.locked():
+                self.store.refresh()
+                self._sync_rows()
+                # Skip ids another writer (or an earlier backfill) already indexed
+                keep = _first_occurrences(packed) & ~_contains(self._live_ids, packed) & ~_contains(self._removed, packed)
+                if keep.any():
+                    self.store.append(packed[keep], vectors[keep])
+                self._sync_rows()
+            count = self.store.count
+            if self.centroids is None:
+                if count >= self.train_threshold:
+                    self.train()
+            elif count >= 2 * self.trained_at:
+                self.train()
+
+    def remove(self, ids: Sequence[uuid.UUID]) -> None:
+        """Hide ``ids`` from search, here and in every process sharing the files."""
+        packed = np.array([i.bytes for i in ids], dtype="V16")
+        if not len(packed):
+            return
+        with self._lock:
+            with self.store.locked():
+                self.store.refresh()
+                self._sync_rows()
+                self.store.write_removed(packed)
+                self._sync_rows()
+            if self.prefix is None:
+                self._apply_removals(packed)
+
+    def _kmeans(self, sample: np.ndarray, nlist: int, iterations: int = 8) -> np.ndarray:
+        centroids = sample[self._rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=nlist)
+            order = np.argsort(labels, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            empty = ~filled
+            if empty.any():
+                sums[empty] = sample[self._rng.choice(len(sample), int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+        return centroids.astype(VECTOR_DTYPE)
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = np.asarray(vectors[start:start + chunk])
+            out[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def train(self) -> None:
+        with self._lock:
+            count = self.store.count
+            nlist = int(min(4096, max(16, np.sqrt(count))))
+            sample_size = min(count, nlist * 40)
+            sample_rows = np.sort(self._rng.choice(count, sample_size, replace=False))
+            self.centroids = self._kmeans(np.asarray(self.store.vectors[sample_rows]), nlist)
+            self.assignments = self._assign(self.store.vectors)
+            self.trained_at = count
+            self._listed = 0
+            self._save_centroids()
+            logger.info("Trained IVF index %s: %d vectors, %d lists", self.prefix or "<memory>", count, nlist)
+
+    def _ensure_lists(self) -> None:
+        count = self.store.count
+        if len(self.assignments) < count:
+            tail = self._assign(self.store.vectors[len(self.assignments):count])
+            self.assignments = np.concatenate([self.assignments, tail])
+        # Rebuild the sorted inverted lists once the unlisted tail gets large
+        if self._listed == 0 or count - self._listed > max(4096, count // 20):
+            listed = self.assignments[:count]
+            self._order = np.argsort(listed, kind="stable")
+            self._offsets = np.concatenate(
+                [[0], np.cumsum(np.bincount(listed, minlength=len(self.centroids)))]
+            )
+            self._listed = count
+            # Persist tail assignments so warm starts do not have to recompute them
+            if count - self._saved_assignments > max(4096, count // 20):
+                self._save_centroids()
+
+    # -- queries -------------------------------------------------------------
+
+    def search(self, query: Sequence[float], k: int, nprobe: Optional[int] = None) -> List[Tuple[uuid.UUID, float]]:
+        query_vec = np.asarray(query, dtype=VECTOR_DTYPE)
+        with self._lock:
+            if len(self._live) < self.store.count:
+                self._sync_rows()
+            count = self.store.count
+            if count == 0:
+                return []
+            vectors = self.store.vectors
+            live = self._live[:count]
+            if self.centroids is None:
+                rows, scores = top_k_cosine(vectors, query_vec, k, live=None if live.all() else live)
+            else:
+                self._ensure_lists()
+                norm = float(np.linalg.norm(query_vec))
+                if norm == 0.0:
+                    return []
+                query_vec = query_vec / norm
+                probes = min(nprobe or self.nprobe, len(self.centroids))
+                nearest = np.argpartition(-(self.centroids @ query_vec), probes - 1)[:probes]
+                candidates = np.concatenate(
+                    [self._order[self._offsets[c]:self._offsets[c + 1]] for c in nearest]
+                    + [np.arange(self._listed, count)]
+                )
+                candidates.sort()
+                candidates = candidates[live[candidates]]
+                local, scores = top_k_cosine(vectors[candidates], query_vec, k)
+                rows = candidates[local]
+            ids = self.store.ids
+            return [(uuid.UUID(bytes=bytes(ids[r])), float(s)) for r, s in zip(rows, scores)]
+
+    def ids(self) -> List[uuid.UUID]:
+        """Ids currently visible to search."""
+        with self._lock:
+            return [uuid.UUID(bytes=bytes(i)) for i in self._live_ids]
+
+
+class PartitionedIVFIndex:
+    """One IVFIndex per partition label (e.g. knowledge category), optionally under ``directory``."""
+
+    DEFAULT_PARTITION = "_default"
+
+    def __init__(self, dim: int, directory: Optional[str] = None, **index_options: Any):
+        self.dim = dim
+        self.directory = directory
+        self.index_options = index_options
+        self.partitions: Dict[str, IVFIndex] = {}
+        self._lock = threading.Lock()
+        self._seen_files: set = set()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._discover()
+
+    def _prefix(self, name: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"partition-{digest}")
+
+    def _discover(self) -> None:
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".meta.json") and filename not in self._seen_files:
+                self._seen_files.add(filename)
+                with open(os.path.join(self.directory, filename)) as meta_file:
+                    name = json.load(meta_file)["partition"]
+                self.partition(name)
+
+    def partition(self, label: Optional[str]) -> IVFIndex:
+        name = label or self.DEFAULT_PARTITION
+        with self._lock:
+            index = self.partitions.get(name)
+            if index is None:
+                prefix = self._prefix(name)
+                if prefix is not None:
+                    with open(f"{prefix}.meta.json", "w") as meta_file:
+                        json.dump({"partition": name, "dim": self.dim}, meta_file)
+                index = IVFIndex(self.dim, prefix=prefix, **self.index_options)
+                self.partitions[name] = index
+            return index
+
+    def add(self, label: Optional[str], ids: Sequence[uuid.UUID], vectors: np.ndarray) -> None:
+        self.partition(label).add(ids, vectors)
+
+    def remove(self, ids: Sequence[uuid.UUID]) -> None:
+        for index in list(self.partitions.values()):
+            index.remove(ids)
+
+    def refresh(self) -> None:
+        """Pick up partitions, vectors and removals written by other processes."""
+        if self.directory:
+            self._discover()
+        for index in list(self.partitions.values()):
+            index.refresh()
+
+    def ids(self) -> List[uuid.UUID]:
+        return [i for index in list(self.partitions.values()) for i in index.ids()]
+
+    def search(
+        self, query: Sequence[float], k: int, label: Optional[str] = None, all_partitions: bool = False
+    ) -> List[Tuple[uuid.UUID, float]]:
+        if self.directory:
+            self._discover()
+        if all_partitions:
+            indexes = list(self.partitions.values())
+        else:
+            indexes = [self.partition(label)]
+        results: List[Tuple[uuid.UUID, float]] = []
+        for index in indexes:
+            index.refresh()
+            results.extend(index.search(query, k))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self.partitions.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self.partitions.clear()
@@ -0,0 +1,550 @@
+"""
+Workflow engine service - runs workflow executions step by step in the background.
+Walks WorkflowSteps via next_step_id / on_failure_step_id (falling back to position
+order), dispatches AGENT steps through the execution service and persists progress
+on the WorkflowExecution row after every step. Workflows containing a PARALLEL step
+are scheduled as a dependency graph so independent steps run concurrently.
+"""
+import re
+import uuid
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Set
+from datetime import datetime
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.agent import Agent
+from app.models.workflow import (
+    Workflow, WorkflowStep, WorkflowExecution,
+    ExecutionStatus, StepType,
+)
+from app.config import settings
+from app.services.admission_service import Priority
+from app.services.execution_service import execution_service
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on step visits per execution so on_failure/next_step cycles terminate
+MAX_STEP_VISITS = 100
+MAX_DELAY_SECONDS = 300.0
+
+TEMPLATE_PATTERN = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+
+def session_factory_for(db: Session) -> Callable[[], Session]:
+    """Return a factory for new sessions bound to the same engine as ``db``."""
+    return sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+
+
+def resolve_reference(path: str, context: Dict[str, Any]) -> Any:
+    """Resolve a dotted path such as ``steps.Research.result`` against the context."""
+    current: Any = context
+    for part in path.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        else:
+            return None
+    return current
+
+
+def _stringify(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def render_value(value: Any, context: Dict[str, Any]) -> Any:
+    """Substitute ``{{path}}`` references in strings, recursing into dicts and lists."""
+    if isinstance(value, str):
+        whole = TEMPLATE_PATTERN.fullmatch(value.strip())
+        if whole:
+            return resolve_reference(whole.group(1), context)
+        return TEMPLATE_PATTERN.sub(lambda m: _stringify(resolve_reference(m.group(1), context)), value)
+    if isinstance(value, dict):
+        return {k: render_value(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_value(v, context) for v in value]
+    return value
+
+
+def evaluate_condition(condition: Optional[Dict[str, Any]], context: Dict[str, Any]) -> bool:
+    """Evaluate a step condition of the form {"left", "operator", "right"}."""
+    if not condition:
+        return True
+    left = render_value(condition.get("left"), context)
+    right = render_value(condition.get("right"), context)
+    operator = condition.get("operator", "equals")
+
+    if operator == "exists":
+        return left not in (None, "", [], {})
+    if operator == "equals":
+        return left == right
+    if operator == "not_equals":
+        return left != right
+    if operator == "contains":
+        return left is not None and str(right) in str(left)
+    if operator in ("gt", "lt"):
+        try:
+            lhs, rhs = float(left), float(right)
+        except (TypeError, ValueError):
+            return False
+        return lhs > rhs if operator == "gt" else lhs < rhs
+    raise ValueError(f"Unsupported condition operator: {operator}")
+
+
+def _template_paths(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [m.group(1) for m in TEMPLATE_PATTERN.finditer(value)]
+    if isinstance(value, dict):
+        return [p for v in value.values() for p in _template_paths(v)]
+    if isinstance(value, list):
+        return [p for v in value for p in _template_paths(v)]
+    return []
+
+
+def build_dependency_graph(steps: List[WorkflowStep]) -> Dict[uuid.UUID, Set[uuid.UUID]]:
+    """Map each step id to the ids of the steps it must wait for.
+
+    Edges come from ``next_step_id`` connections and from ``{{steps.<id or name>...}}``
+    references in ``input_mapping`` and ``condition``. Raises ValueError on cycles.
+    """
+    by_key: Dict[str, uuid.UUID] = {}
+    for step in steps:
+        by_key[str(step.id)] = step.id
+        by_key[step.name] = step.id
+
+    deps: Dict[uuid.UUID, Set[uuid.UUID]] = {step.id: set() for step in steps}
+    for step in steps:
+        if step.next_step_id in deps:
+            deps[step.next_step_id].add(step.id)
+        for path in _template_paths([step.input_mapping, step.condition]):
+            if not path.startswith("steps."):
+                continue
+            ref = path[len("steps."):]
+            for key, step_id in by_key.items():
+                if step_id != step.id and (ref == key or ref.startswith(key + ".")):
+                    deps[step.id].add(step_id)
+
+    # Kahn's algorithm: anything left unvisited sits on a cycle
+    remaining = {k: set(v) for k, v in deps.items()}
+    frontier = [k for k, v in remaining.items() if not v]
+    visited = 0
+    while frontier:
+        current = frontier.pop()
+        visited += 1
+        for step_id, waiting_on in remaining.items():
+            if current in waiting_on:
+                waiting_on.discard(current)
+                if not waiting_on:
+                    frontier.append(step_id)
+    if visited != len(deps):
+        raise ValueError("Workflow steps contain a dependency cycle")
+    return deps
+
+
+class StepOutcome:
+    def __init__(
+        self,
+        status: str,
+        output: Optional[Dict[str, Any]] = None,
+        tokens_used: int = 0,
+        cost: float = 0.0,
+        error: Optional[str] = None,
+        branch: Optional[bool] = None,
+    ):
+        self.status = status
+        self.output = output or {}
+        self.tokens_used = tokens_used
+        self.cost = cost
+        self.error = error
+        self.branch = branch
+
+
+class WorkflowEngineService:
+    """Executes workflow runs off the request path and records their progress."""
+
+    def __init__(self):
+        self.max_step_visits = MAX_STEP_VISITS
+        self.max_concurrency = settings.workflow_max_concurrency
+
+    def _build_context(self, workflow: Workflow, execution: WorkflowExecution) -> Dict[str, Any]:
+        return {
+            "input": dict(execution.input_data or {}),
+            "variables": dict(workflow.variables or {}),
+            "steps": {},
+        }
+
+    def _step_input(
+        self,
+        step: WorkflowStep,
+        context: Dict[str, Any],
+        previous_output: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        if step.input_mapping:
+            return render_value(dict(step.input_mapping), context)
+        if previous_output and "result" in previous_output:
+            return {"query": str(previous_output["result"])}
+        return dict(context["input"])
+
+    def _agent_config(self, db: Session, step: WorkflowStep) -> Dict[str, Any]:
+        config: Dict[str, Any] = {}
+        if step.agent_id:
+            agent = db.query(Agent).filter(Agent.id == step.agent_id).first()
+            if agent is None:
+                raise ValueError(f"Agent {step.agent_id} not found")
+            config = {
+                "agent_id": str(agent.id),
+                "system_prompt": agent.system_prompt,
+                "model_provider": agent.model_provider,
+                "model_name": agent.model_name,
+                "category": agent.category,
+                "tools": agent.tools,
+                "parameters": agent.parameters,
+            }
+        config.update(step.config or {})
+        return config
+
+    async def _run_step(
+        self,
+        db: Session,
+        step: WorkflowStep,
+        step_input: Dict[str, Any],
+        context: Dict[str, Any],
+        user_id: str,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> StepOutcome:
+        step_type = step.step_type
+
+        if step_type == StepType.AGENT.value:
+            result = await execution_service.execute_agent(
+                agent_config=self._agent_config(db, step),
+                input_data=step_input,
+                user_id=user_id,
+                db=db,
+                priority=priority,
+            )
+            return StepOutcome(
+                status=result.status,
+                output=result.output,
+                tokens_used=result.tokens_used,
+                cost=result.cost,
+                error=result.error,
+            )
+
+        if step_type == StepType.CONDITION.value:
+            branch = evaluate_condition(step.condition, context)
+            return StepOutcome(status="completed", output={"result": branch}, branch=branch)
+
+        if step_type == StepType.TRANSFORM.value:
+            return StepOutcome(status="completed", output=step_input)
+
+        if step_type == StepType.DELAY.value:
+            seconds = min(float((step.config or {}).get("seconds", 0)), MAX_DELAY_SECONDS)
+            await asyncio.sleep(max(seconds, 0.0))
+            return StepOutcome(status="completed", output=step_input)
+
+        if step_type == StepType.HUMAN_REVIEW.value:
+            return StepOutcome(status=ExecutionStatus.PAUSED.value, output=step_input)
+
+        if step_type == StepType.PARALLEL.value:
+            return StepOutcome(status="completed", output=step_input)
+
+        raise ValueError(f"Unsupported step type: {step_type}")
+
+    def _next_step(
+        self,
+        step: WorkflowStep,
+        outcome: StepOutcome,
+        ordered: List[WorkflowStep],
+        by_id: Dict[uuid.UUID, WorkflowStep],
+    ) -> Optional[WorkflowStep]:
+        failed = outcome.status != "completed" or outcome.branch is False
+        if failed:
+            return by_id.get(step.on_failure_step_id) if step.on_failure_step_id else None
+        if step.next_step_id:
+            return by_id.get(step.next_step_id)
+        index = ordered.index(step)
+        return ordered[index + 1] if index + 1 < len(ordered) else None
+
+    def _record_step(
+        self,
+        db: Session,
+        execution: WorkflowExecution,
+        step: WorkflowStep,
+        outcome: StepOutcome,
+        duration_ms: int,
+    ) -> None:
+        step_result = {
+            "step_id": str(step.id),
+            "name": step.name,
+            "step_type": step.step_type,
+            "status": outcome.status,
+            "output": outcome.output,
+            "tokens_used": outcome.tokens_used,
+            "cost": outcome.cost,
+            "duration_ms": duration_ms,
+            "error": outcome.error,
+        }
+        execution.step_results = list(execution.step_results or []) + [step_result]
+        execution.current_step = len(execution.step_results)
+        execution.total_tokens = (execution.total_tokens or 0) + outcome.tokens_used
+        execution.total_cost = (execution.total_cost or 0.0) + outcome.cost
+        db.commit()
+
+    def _finish(
+        self,
+        db: Session,
+        workflow: Optional[Workflow],
+        execution: WorkflowExecution,
+        status: str,
+        output_data: Optional[Dict[str, Any]] = None,
+        error_message: Optional[str] = None,
+    ) -> None:
+        execution.status = status
+        if output_data is not None:
+            execution.output_data = output_data
+        if error_message:
+            execution.error_message = error_message
+        if status in (ExecutionStatus.COMPLETED.value, ExecutionStatus.FAILED.value):
+            execution.completed_at = datetime.utcnow()
+            if workflow is not None and execution.started_at:
+                duration = (execution.completed_at - execution.started_at).total_seconds()
+                runs = workflow.total_runs or 0
+                workflow.average_duration = (
+                    (workflow.average_duration or 0.0) * runs + duration
+                ) / (runs + 1)
+                workflow.total_runs = runs + 1
+        db.commit()
+
+    async def run_execution(
+        self,
+        execution_id: uuid.UUID,
+        session_factory: Callable[[], Session],
+    ) -> None:
+        """Run a pending execution to completion, pause or failure in its own session."""
+        db = session_factory()
+        try:
+            await self._run(db, execution_id)
+        except Exception as exc:
+            logger.error("Workflow execution %s crashed: %s", execution_id, exc)
+            db.rollback()
+            execution = db.query(WorkflowExecution).filter(WorkflowExecution.id == execution_id).first()
+            if execution is not None:
+                self._finish(db, None, execution, ExecutionStatus.FAILED.value, error_message=str(exc))
+        finally:
+            db.close()
+
+    async def _run(self, db: Session, execution_id: uuid.UUID) -> None:
+        execution = db.query(WorkflowExecution).filter(WorkflowExecution.id == execution_id).first()
+        if execution is None:
+            logger.warning("Workflow execution %s not found", execution_id)
+            return
+        if execution.status != ExecutionStatus.PENDING.value:
+            return
+
+        workflow = db.query(Workflow).filter(Workflow.id == execution.workflow_id).first()
+        if workflow is None:
+            self._finish(db, None, execution, ExecutionStatus.FAILED.value, error_message="Workflow not found")
+            return
+
+        execution.status = ExecutionStatus.RUNNING.value
+        execution.started_at = execution.started_at or datetime.utcnow()
+        db.commit()
+
+        ordered = sorted(workflow.steps, key=lambda s: s.position)
+        context = self._build_context(workflow, execution)
+        # Runs are user-triggered, so agent calls queue as interactive unless the
+        # workflow is explicitly marked as background work
+        priority = Priority.BATCH if workflow.is_background else Priority.INTERACTIVE
+        if any(s.step_type == StepType.PARALLEL.value for s in ordered):
+            await self._run_dag(db, workflow, execution, ordered, context, priority)
+        else:
+            await self._run_sequential(db, workflow, execution, ordered, context, priority)
+
+    async def _execute_step(
+        self,
+        db: Session,
+        execution: WorkflowExecution,
+        step: WorkflowStep,
+        step_input: Dict[str, Any],
+        context: Dict[str, Any],
+        priority: Priority,
+        step_db: Optional[Session] = None,
+    ) -> StepOutcome:
+        """Run one step and record its result on ``db``.
+
+        ``step_db`` is the session the step itself works in (agent lookup and the
+        agent execution); it defaults to ``db`` for sequential runs.
+        """
+        started = time.time()
+        try:
+            outcome = await self._run_step(
+                step_db or db, step, step_input, context, str(execution.triggered_by), priority,
+            )
+        except Exception as exc:
+            logger.error("Workflow step %s failed: %s", step.id, exc)
+            outcome = StepOutcome(status="error", error=str(exc))
+        duration_ms = int((time.time() - started) * 1000)
+
+        self._record_step(db, execution, step, outcome, duration_ms)
+        context["steps"][str(step.id)] = outcome.output
+        context["steps"][step.name] = outcome.output
+        return outcome
+
+    async def _run_sequential(
+        self,
+        db: Session,
+        workflow: Workflow,
+        execution: WorkflowExecution,
+        ordered: List[WorkflowStep],
+        context: Dict[str, Any],
+        priority: Priority,
+    ) -> None:
+        by_id = {s.id: s for s in ordered}
+        step = ordered[0] if ordered else None
+        previous_output: Optional[Dict[str, Any]] = None
+        visits = 0
+
+        while step is not None:
+            visits += 1
+            if visits > self.max_step_visits:
+                self._finish(
+                    db, workflow, execution, ExecutionStatus.FAILED.value,
+                    error_message=f"Exceeded maximum of {self.max_step_visits} step visits",
+                )
+                return
+
+            step_input = self._step_input(step, context, previous_output)
+            outcome = await self._execute_step(db, execution, step, step_input, context, priority)
+
+            if outcome.status == ExecutionStatus.PAUSED.value:
+                self._finish(db, workflow, execution, ExecutionStatus.PAUSED.value, output_data=outcome.output)
+                return
+
+            next_step = self._next_step(step, outcome, ordered, by_id)
+            if outcome.status != "completed" and next_step is None:
+                self._finish(
+                    db, workflow, execution, ExecutionStatus.FAILED.value,
+                    error_message=outcome.error or f"Step '{step.name}' failed",
+                )
+                return
+
+            previous_output = outcome.output
+            step = next_step
+
+        self._finish(db, workflow, execution, ExecutionStatus.COMPLETED.value, output_data=previous_output or {})
+
+    def _concurrency_limit(self, ordered: List[WorkflowStep]) -> int:
+        limits = [
+            int((s.config or {})["max_concurrency"])
+            for s in ordered
+            if s.step_type == StepType.PARALLEL.value and (s.config or {}).get("max_concurrency")
+        ]
+        return max(1, min(limits)) if limits else self.max_concurrency
+
+    async def _run_dag(
+        self,
+        db: Session,
+        workflow: Workflow,
+        execution: WorkflowExecution,
+        ordered: List[WorkflowStep],
+        context: Dict[str, Any],
+        priority: Priority,
+    ) -> None:
+        """Run every step as soon as its dependencies have completed, with bounded concurrency.
+
+        A failed step with an on_failure handler is recovered by the handler: if
+        the handler completes, its output stands in for the failed step and the
+        step's dependents run on it. Steps left behind by a condition's false
+        branch are recorded as ``skipped``. Concurrent steps each work in their own
+        session; results are recorded on ``db`` from the event loop, one at a time.
+        """
+        try:
+            deps = build_dependency_graph(ordered)
+        except ValueError as exc:
+            self._finish(db, workflow, execution, ExecutionStatus.FAILED.value, error_message=str(exc))
+            return
+
+        by_id = {s.id: s for s in ordered}
+        # Failure handlers only run when the step pointing at them fails
+        pending = {s.id for s in ordered} - {s.on_failure_step_id for s in ordered if s.on_failure_step_id}
+        succeeded: Set[uuid.UUID] = set()
+        # Failure handler -> the failed step whose output it stands in for
+        stands_in: Dict[uuid.UUID, uuid.UUID] = {}
+        running: Dict[asyncio.Task, WorkflowStep] = {}
+        semaphore = asyncio.Semaphore(self._concurrency_limit(ordered))
+        session_factory = session_factory_for(db)
+        error_message: Optional[str] = None
+        paused_output: Optional[Dict[str, Any]] = None
+
+        async def run_bounded(step: WorkflowStep, step_input: Dict[str, Any]) -> StepOutcome:
+            async with semaphore:
+                step_db = session_factory()
+                try:
+                    return await self._execute_step(
+                        db, execution, step, step_input, context, priority, step_db=step_db,
+                    )
+                finally:
+                    step_db.close()
+
+        while True:
+            if error_message is None and paused_output is None:
+                ready = [by_id[i] for i in pending if deps[i] <= succeeded]
+                for step in sorted(ready, key=lambda s: s.position):
+                    pending.discard(step.id)
+                    upstream = [context["steps"].get(str(d)) for d in deps[step.id]]
+                    previous_output = upstream[0] if len(upstream) == 1 else None
+                    step_input = self._step_input(step, context, previous_output)
+                    running[asyncio.create_task(run_bounded(step, step_input))] = step
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step = running.pop(task)
+                outcome = task.result()
+                if outcome.status == ExecutionStatus.PAUSED.value:
+                    paused_output = outcome.output
+                elif outcome.status == "completed" and outcome.branch is not False:
+                    succeeded.add(step.id)
+                    failed_id = stands_in.get(step.id)
+                    if failed_id is not None:
+                        context["steps"][str(failed_id)] = outcome.output
+                        context["steps"][by_id[failed_id].name] = outcome.output
+                        succeeded.add(failed_id)
+                elif step.on_failure_step_id in by_id:
+                    handler = step.on_failure_step_id
+                    if outcome.status != "completed":
+                        stands_in[handler] = step.id
+                    deps[handler] = set()
+                    pending.add(handler)
+                elif outcome.status != "completed":
+                    error_message = outcome.error or f"Step '{step.name}' failed"
+
+        if error_message is not None:
+            self._finish(db, workflow, execution, ExecutionStatus.FAILED.value, error_message=error_message)
+            return
+        if paused_output is not None:
+            self._finish(db, workflow, execution, ExecutionStatus.PAUSED.value, output_data=paused_output)
+            return
+
+        for step in sorted((by_id[i] for i in pending), key=lambda s: s.position):
+            self._record_step(db, execution, step, StepOutcome(status="skipped"), 0)
+
+        # Output is whatever the completed sink steps produced; PARALLEL markers only fan out
+        upstream_ids = set().union(*deps.values()) if deps else set()
+        sinks = [
+            s for s in ordered
+            if s.id in succeeded and s.id not in upstream_ids and s.id not in stands_in
+            and s.step_type != StepType.PARALLEL.value
+        ]
+        if len(sinks) == 1:
+            output_data = context["steps"][str(sinks[0].id)]
+        else:
+            output_data = {s.name: context["steps"][str(s.id)] for s in sinks}
+        self._finish(db, workflow, execution, ExecutionStatus.COMPLETED.value, output_data=output_data)
+
+
+# Singleton instance
+workflow_engine_service = WorkflowEngineService()
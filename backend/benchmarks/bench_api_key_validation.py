@@ -0,0 +1,75 @@
+"""
+Load test for billing_service.validate_api_key against a file-backed SQLite
+stand-in: no key_hash index and no cache (the previous behaviour), with the
+index, and with the index plus the validated-key cache.
+
+    cd backend && python -m benchmarks.bench_api_key_validation --keys 10000 --requests 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database.session import Base
+from app.services import billing_service
+from app.services.usage_counter_service import api_key_rate_counter
+from benchmarks.common import report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--hot-keys", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        raw_keys = []
+        for i in range(args.keys):
+            api_key, raw_key = billing_service.create_api_key(db, uuid.uuid4(), f"key-{i}", tier="enterprise")
+            raw_keys.append(raw_key)
+        db.execute(text("UPDATE api_keys SET rate_limit = 1000000000"))
+        db.commit()
+
+        rng = random.Random(0)
+        # Most traffic comes from a small set of hot keys
+        workload = [
+            raw_keys[rng.randrange(args.hot_keys)] if rng.random() < 0.9 else rng.choice(raw_keys)
+            for _ in range(args.requests)
+        ]
+
+        def run(label: str, cache_enabled: bool) -> None:
+            settings.api_key_cache_enabled = cache_enabled
+            billing_service.api_key_cache.clear()
+            api_key_rate_counter.reset()
+            samples = []
+            started = time.perf_counter()
+            for raw_key in workload:
+                t0 = time.perf_counter()
+                assert billing_service.validate_api_key(db, raw_key) is not None
+                samples.append((time.perf_counter() - t0) * 1000)
+            elapsed = time.perf_counter() - started
+            report(label, samples)
+            print(f"{'':<28} {len(workload) / elapsed:.0f} validations/s")
+
+        db.execute(text("DROP INDEX ix_api_keys_key_hash"))
+        run("no index, no cache", cache_enabled=False)
+        db.execute(text("CREATE INDEX ix_api_keys_key_hash ON api_keys (key_hash)"))
+        run("index, no cache", cache_enabled=False)
+        run("index + cache", cache_enabled=True)
+        print(f"cache hit rate: {billing_service.api_key_cache.hits / len(workload):.1%}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Top-k latency and recall of the knowledge-base IVF index against an exhaustive
+scan, over synthetic clustered embeddings persisted to a memory-mapped directory.
+
+    cd backend && python -m benchmarks.bench_knowledge_index --entries 1000000 --queries 200
+"""
+import argparse
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.services.memory_service import EMBEDDING_DIM
+from app.services.vector_index import PartitionedIVFIndex, normalize_rows, top_k_cosine
+from benchmarks.common import report
+
+
+def synthetic_batches(entries: int, dim: int, batch: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((1000, dim)).astype(np.float32)
+    for start in range(0, entries, batch):
+        size = min(batch, entries - start)
+        vectors = centers[rng.integers(0, len(centers), size)]
+        vectors = vectors + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+        yield [uuid.uuid4() for _ in range(size)], normalize_rows(vectors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = PartitionedIVFIndex(EMBEDDING_DIM, directory=directory, nprobe=args.nprobe)
+        started = time.perf_counter()
+        for ids, vectors in synthetic_batches(args.entries, EMBEDDING_DIM, 50_000):
+            index.add("bench", ids, vectors)
+        print(f"built {len(index)} entries in {time.perf_counter() - started:.1f}s")
+
+        # Warm start from the files, as a freshly booted worker would
+        started = time.perf_counter()
+        warm = PartitionedIVFIndex(EMBEDDING_DIM, directory=directory, nprobe=args.nprobe)
+        partition = warm.partition("bench")
+        warm.search(partition.store.vectors[0], args.k, label="bench")
+        print(f"warm start in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        rng = np.random.default_rng(1)
+        rows = rng.choice(len(partition), args.queries, replace=False)
+        queries = normalize_rows(
+            np.asarray(partition.store.vectors[rows])
+            + 0.1 * rng.standard_normal((args.queries, EMBEDDING_DIM)).astype(np.float32)
+        )
+
+        ann_ms, exact_ms, recall = [], [], []
+        ids = partition.store.ids
+        for query in queries:
+            t0 = time.perf_counter()
+            found = warm.search(query, args.k, label="bench")
+            ann_ms.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            exact_rows, _ = top_k_cosine(partition.store.vectors, query, args.k)
+            exact_ms.append((time.perf_counter() - t0) * 1000)
+            exact = {uuid.UUID(bytes=bytes(ids[r])) for r in exact_rows}
+            recall.append(len(exact & {i for i, _ in found}) / args.k)
+
+        report(f"ivf top-{args.k} (nprobe={args.nprobe})", ann_ms)
+        report(f"exhaustive top-{args.k}", exact_ms)
+        print(f"recall@{args.k}: {np.mean(recall):.3f}")
+
+
+if __name__ == "__main__":
+    main()
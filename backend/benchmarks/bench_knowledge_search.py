@@ -0,0 +1,94 @@
+"""
+End-to-end latency of memory_service.search_knowledge against a file-backed
+SQLite stand-in: the one-off reconcile on a worker's first search, steady-state
+searches, and searches right after a row is added by this worker or another.
+
+    cd backend && python -m benchmarks.bench_knowledge_search --entries 50000 --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database.session import Base
+from app.models.memory import KnowledgeBase
+from app.services import memory_service
+from benchmarks.common import report
+
+WORDS = (
+    "index query plan cache latency replica shard vector embedding token model agent "
+    "workflow batch stream queue partition cluster memory search ranking recall"
+).split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--categories", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        settings.knowledge_index_path = os.path.join(directory, "index")
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        sessions = sessionmaker(bind=engine)
+        db = sessions()
+
+        # Pre-existing rows written in bulk, as a deployment would have before the change log
+        for start in range(0, args.entries, 5000):
+            rows = []
+            for _ in range(min(5000, args.entries - start)):
+                content = " ".join(rng.choice(WORDS, 12))
+                rows.append({
+                    "id": uuid.uuid4(), "title": content[:40], "content": content,
+                    "category": f"c{rng.integers(args.categories)}",
+                    "embedding": memory_service.generate_embedding(content),
+                    "tags": [], "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+                })
+            db.execute(insert(KnowledgeBase), rows)
+            db.commit()
+
+        queries = [" ".join(rng.choice(WORDS, 4)) for _ in range(args.queries)]
+
+        started = time.perf_counter()
+        memory_service.search_knowledge(db, queries[0])
+        print(f"first search (reconcile {args.entries} rows) in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        def run(label: str, before=None) -> None:
+            samples = []
+            for i, query in enumerate(queries):
+                if before is not None:
+                    before(i)
+                t0 = time.perf_counter()
+                memory_service.search_knowledge(db, query, category=f"c{i % args.categories}")
+                samples.append((time.perf_counter() - t0) * 1000)
+            report(label, samples)
+
+        run("steady state")
+        run("after own add_knowledge", lambda i: memory_service.add_knowledge(
+            db, f"own {i}", queries[i], category=f"c{i % args.categories}",
+        ))
+
+        other = sessions()
+
+        def insert_elsewhere(i: int) -> None:
+            other.add(KnowledgeBase(
+                title=f"other {i}", content=queries[i], category=f"c{i % args.categories}",
+                embedding=memory_service.generate_embedding(queries[i]),
+            ))
+            other.commit()
+
+        run("after other worker insert", insert_elsewhere)
+
+
+if __name__ == "__main__":
+    main()
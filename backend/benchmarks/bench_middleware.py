@@ -0,0 +1,146 @@
+"""
+Requests/sec through the middleware stack (rate limiting, metrics, request ID)
+on /health and /api/v1/agents: the previous BaseHTTPMiddleware style against
+the pure-ASGI middlewares in app.middleware. Agents are served from SQLite.
+
+    cd backend && python -m benchmarks.bench_middleware --requests 3000
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+from app.api.routes import agents
+from app.api.routes.metrics import (
+    increment_request_metrics, decrement_active_requests, record_latency,
+)
+from app.database.session import Base, get_db
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.rate_limiter import RateLimiterMiddleware, TokenBucketLimiter
+from app.middleware.request_id import RequestIDMiddleware
+from app.models.agent import Agent
+from benchmarks.common import BackgroundServer
+
+LIMIT = 10_000_000
+
+
+class LegacyRateLimiter(BaseHTTPMiddleware):
+    """The previous implementation: per-IP timestamp lists rebuilt on every request."""
+
+    def __init__(self, app, max_requests: int, window_seconds: int):
+        super().__init__(app)
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self._requests: dict = {}
+
+    async def dispatch(self, request, call_next):
+        client_ip = request.client.host if request.client else "unknown"
+        now = time.time()
+        timestamps = [t for t in self._requests.get(client_ip, []) if t > now - self.window_seconds]
+        if len(timestamps) >= self.max_requests:
+            return JSONResponse(status_code=429, content={"detail": "Too many requests."})
+        timestamps.append(now)
+        self._requests[client_ip] = timestamps
+        return await call_next(request)
+
+
+class LegacyMetrics(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        increment_request_metrics()
+        started = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            record_latency(time.perf_counter() - started)
+            decrement_active_requests()
+
+
+class LegacyRequestID(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        response = await call_next(request)
+        response.headers["x-request-id"] = request_id
+        return response
+
+
+def build_app(session_factory, legacy: bool) -> FastAPI:
+    app = FastAPI()
+    app.include_router(agents.router, prefix="/api/v1")
+    app.get("/health")(lambda: {"status": "healthy"})
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    if legacy:
+        app.add_middleware(LegacyRateLimiter, max_requests=LIMIT, window_seconds=60)
+        app.add_middleware(LegacyMetrics)
+        app.add_middleware(LegacyRequestID)
+    else:
+        app.add_middleware(RateLimiterMiddleware, limiter=TokenBucketLimiter(LIMIT, 60))
+        app.add_middleware(MetricsMiddleware)
+        app.add_middleware(RequestIDMiddleware)
+    return app
+
+
+def seed(session_factory, count: int) -> None:
+    db = session_factory()
+    for i in range(count):
+        db.add(Agent(
+            name=f"Bench Agent {i}", slug=f"bench-agent-{i}", description="Benchmark agent.",
+            category="research", publisher_id=uuid.uuid4(), status="published", tags=["bench"],
+        ))
+    db.commit()
+    db.close()
+
+
+async def drive(url: str, requests: int, concurrency: int) -> float:
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(url)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    os.environ.pop("TESTING", None)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    seed(session_factory, 20)
+
+    for path in ["/health", "/api/v1/agents"]:
+        for label, legacy in [("BaseHTTPMiddleware", True), ("pure ASGI", False)]:
+            with BackgroundServer(build_app(session_factory, legacy)) as server:
+                url = server.url + path
+                asyncio.run(drive(url, 200, args.concurrency))  # warm up
+                rps = asyncio.run(drive(url, args.requests, args.concurrency))
+            print(f"{path:<16} {label:<20} {rps:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Completion throughput (tokens/sec) for workflow-style fan-outs of tiny prompts
+to one local model: every call sent at once, against calls held by the
+admission gate at ``ollama_max_parallel``. The fake Ollama server decodes
+``--slots`` sequences side by side (like OLLAMA_NUM_PARALLEL) and queues the rest.
+
+    cd backend && python -m benchmarks.bench_ollama_admission --fanout 48 --rounds 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.config import settings
+from app.services.admission_service import AdmissionController
+from app.services.execution_service import AgentExecutionService
+from benchmarks.common import BackgroundServer
+
+PROMPT_TOKENS = 24
+
+
+def fake_ollama(slots: int, step_ms: float, prompt_ms: float):
+    state = {"slots": None, "connections": set()}
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        state["connections"].add(scope.get("client"))
+        if state["slots"] is None:
+            state["slots"] = asyncio.Semaphore(slots)
+        tokens = json.loads(body)["options"]["num_predict"]
+        async with state["slots"]:
+            await asyncio.sleep((prompt_ms + tokens * step_ms) / 1000)
+        payload = json.dumps({
+            "message": {"role": "assistant", "content": "ok " * tokens},
+            "prompt_eval_count": PROMPT_TOKENS,
+            "eval_count": tokens,
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    return app, state
+
+
+async def run_fanouts(base_url: str, gated: bool, fanout: int, rounds: int, max_tokens: int):
+    service = AgentExecutionService()
+    service.provider_base_urls["ollama"] = base_url
+    if not gated:
+        service.admission = AdmissionController({"ollama": {"max_concurrency": 1_000_000}})
+    tokens = 0
+    started = time.perf_counter()
+    try:
+        for round_index in range(rounds):
+            results = await asyncio.gather(*(
+                service._call_guarded(
+                    "ollama", "llama3", [{"role": "user", "content": f"step {round_index}.{i}"}], max_tokens,
+                )
+                for i in range(fanout)
+            ))
+            tokens += sum(r["tokens_input"] + r["tokens_output"] for r in results)
+    finally:
+        await service.close_clients()
+    return tokens, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fanout", type=int, default=48)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=8)
+    parser.add_argument("--slots", type=int, default=settings.ollama_max_parallel)
+    parser.add_argument("--step-ms", type=float, default=0.5)
+    parser.add_argument("--prompt-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    settings.llm_http2 = False  # Ollama speaks HTTP/1.1
+    for label, gated in (("all calls at once", False), ("admission-gated", True)):
+        app, state = fake_ollama(args.slots, args.step_ms, args.prompt_ms)
+        with BackgroundServer(app) as server:
+            asyncio.run(run_fanouts(server.url, gated, 4, 2, args.max_tokens))  # warm up
+            state["connections"].clear()
+            tokens, elapsed = asyncio.run(
+                run_fanouts(server.url, gated, args.fanout, args.rounds, args.max_tokens)
+            )
+        calls = args.fanout * args.rounds
+        print(
+            f"{label:<22} calls={calls:<6} {tokens / elapsed:>10.0f} tokens/s  "
+            f"{calls / elapsed:>8.1f} calls/s  connections={len(state['connections'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
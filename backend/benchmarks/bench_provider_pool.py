@@ -0,0 +1,86 @@
+"""
+Compare per-call httpx clients against the pooled provider clients owned by
+AgentExecutionService, using a local OpenAI-compatible stub server.
+
+    cd backend && python -m benchmarks.bench_provider_pool --requests 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+from app.config import settings
+from app.services.execution_service import AgentExecutionService
+from benchmarks.common import BackgroundServer, report
+
+COMPLETION = json.dumps({
+    "choices": [{"message": {"content": "stub completion"}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 3},
+}).encode()
+
+
+async def stub_openai(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    while True:
+        message = await receive()
+        if not message.get("more_body"):
+            break
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": COMPLETION})
+
+
+async def per_call_clients(base_url: str, requests: int) -> List[float]:
+    """The previous behaviour: a fresh AsyncClient (and connection) per provider call."""
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=120.0) as client:
+            response = await client.post(
+                f"{base_url}/chat/completions",
+                headers={"Authorization": "Bearer bench"},
+                json={"model": "gpt-3.5-turbo", "messages": [], "max_tokens": 16},
+            )
+            response.raise_for_status()
+            response.json()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+async def pooled_clients(base_url: str, requests: int) -> List[float]:
+    service = AgentExecutionService()
+    service.provider_base_urls["openai"] = base_url
+    messages = [{"role": "user", "content": "ping"}]
+    samples = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            await service._execute_openai("gpt-3.5-turbo", messages, 16)
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        await service.close_clients()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    settings.openai_api_key = "bench"
+    with BackgroundServer(stub_openai) as server:
+        base_url = server.url
+        asyncio.run(per_call_clients(base_url, 20))  # warm up the stub
+        report("per-call AsyncClient", asyncio.run(per_call_clients(base_url, args.requests)))
+        report("pooled provider client", asyncio.run(pooled_clients(base_url, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Shared helpers for the local benchmark scripts."""
+import socket
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """Runs an ASGI app under uvicorn in a daemon thread for the duration of a benchmark."""
+
+    def __init__(self, app: Any, port: int = 0, **config: Any):
+        self.port = port or free_port()
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", **config)
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "BackgroundServer":
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("benchmark server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "p50": pick(0.50),
+        "p99": pick(0.99),
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def report(label: str, samples_ms: List[float]) -> None:
+    stats = percentiles(samples_ms)
+    print(f"{label:<28} n={len(samples_ms):<6} p50={stats['p50']:.2f}ms  p99={stats['p99']:.2f}ms  mean={stats['mean']:.2f}ms")
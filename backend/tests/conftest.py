@@ -6,6 +6,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 from app.database.session import Base, get_db
 from app.main import app
+from app.services.usage_counter_service import api_key_usage
 
 
 # Use in-memory SQLite for tests
@@ -17,6 +18,7 @@ engine = create_engine(
     poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+api_key_usage.session_factory = TestingSessionLocal
 
 
 @pytest.fixture(scope="function")
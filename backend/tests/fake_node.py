@@ -0,0 +1,86 @@
+"""Fake federation nodes for sync tests.
+
+One ASGI app plays any number of remote nodes, picking the catalog by request
+host, and serves ``/api/v1/agents`` with the same cursor paging as the real API.
+Mount it with ``httpx.ASGITransport`` or run it under ``benchmarks.common.BackgroundServer``.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query
+
+from app.services.pagination import decode_cursor, encode_cursor
+
+
+class FakeNodes:
+    def __init__(self, api_key: str = "test-api-key-12345", latency: float = 0.0, legacy_paging: bool = False):
+        self.api_key = api_key
+        self.latency = latency
+        self.legacy_paging = legacy_paging
+        self.catalogs: Dict[str, List[Dict[str, Any]]] = {}
+        self.failing: set = set()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = self._build_app()
+
+    def add_node(self, host: str, agent_count: int) -> List[Dict[str, Any]]:
+        base = datetime(2024, 1, 1)
+        self.catalogs[host] = [
+            {
+                "id": str(uuid.uuid4()),
+                "name": f"{host} agent {i}",
+                "description": f"Remote agent {i}",
+                "category": "other",
+                "average_rating": 4.0,
+                "created_at": (base + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(agent_count)
+        ]
+        return self.catalogs[host]
+
+    def _page(self, catalog: List[Dict[str, Any]], page: int, page_size: int, cursor: Optional[str]) -> Dict[str, Any]:
+        ordered = sorted(catalog, key=lambda a: (a["created_at"], a["id"]), reverse=True)
+        if self.legacy_paging:
+            start = (page - 1) * page_size
+            return {"agents": ordered[start:start + page_size], "page": page, "page_size": page_size}
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            key = (created_at.isoformat(), str(row_id))
+            ordered = [a for a in ordered if (a["created_at"], a["id"]) < key]
+        agents = ordered[:page_size]
+        next_cursor = None
+        if len(agents) == page_size:
+            last = agents[-1]
+            next_cursor = encode_cursor(datetime.fromisoformat(last["created_at"]), uuid.UUID(last["id"]))
+        return {"agents": agents, "page": page, "page_size": page_size, "next_cursor": next_cursor}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/api/v1/agents")
+        async def list_agents(
+            host: str = Header(...),
+            authorization: str = Header(""),
+            page: int = Query(1, ge=1),
+            page_size: int = Query(20, ge=1, le=100),
+            cursor: Optional[str] = None,
+        ):
+            self.requests += 1
+            if authorization != f"Bearer {self.api_key}":
+                raise HTTPException(status_code=401)
+            hostname = host.split(":")[0]
+            if hostname in self.failing or hostname not in self.catalogs:
+                raise HTTPException(status_code=503)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                return self._page(self.catalogs[hostname], page, page_size, cursor)
+            finally:
+                self.in_flight -= 1
+
+        return app
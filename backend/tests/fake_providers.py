@@ -0,0 +1,54 @@
+"""Fault-injecting stub LLM providers for resilience tests.
+
+Each stub answers in its provider's wire format through ``httpx.MockTransport``
+and follows a script of faults, one entry per call: an HTTP status to fail
+with, a number of seconds to stall before answering, or None to answer at once.
+Once the script runs out every call succeeds.
+"""
+import asyncio
+from typing import Any, List, Optional, Union
+
+import httpx
+
+Fault = Optional[Union[int, float]]
+
+
+class StubProvider:
+    def __init__(self, provider: str, faults: Optional[List[Fault]] = None, content: str = ""):
+        self.provider = provider
+        self.faults = list(faults or [])
+        self.content = content or f"answer from {provider}"
+        self.calls = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    def _body(self) -> Any:
+        if self.provider == "anthropic":
+            return {
+                "content": [{"type": "text", "text": self.content}],
+                "usage": {"input_tokens": 5, "output_tokens": 7},
+            }
+        return {
+            "choices": [{"message": {"content": self.content}}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 7},
+        }
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        fault = self.faults.pop(0) if self.faults else None
+        if isinstance(fault, int):
+            return httpx.Response(fault, json={"error": "injected"})
+        if isinstance(fault, float):
+            try:
+                await asyncio.sleep(fault)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        self.completed += 1
+        return httpx.Response(200, json=self._body())
+
+    def install(self, service: Any) -> "StubProvider":
+        service._clients[self.provider] = httpx.AsyncClient(
+            base_url=service._base_url(self.provider), transport=httpx.MockTransport(self.handler),
+        )
+        return self
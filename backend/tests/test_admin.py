@@ -155,3 +155,21 @@ def test_get_audit_log_pagination(client):
     data = response.json()
     assert data["page"] == 1
     assert data["page_size"] == 10
+
+
+def test_get_audit_log_cursor_pagination(client):
+    for _ in range(3):
+        client.post("/api/v1/admin/kill-switch", json={
+            "target_type": "agent",
+            "target_id": str(uuid.uuid4()),
+            "reason": "test",
+            "admin_id": _admin_id(),
+        })
+    first = client.get("/api/v1/admin/audit-log?page_size=2").json()
+    assert first["total"] == 3
+    assert first["next_cursor"]
+
+    second = client.get(f"/api/v1/admin/audit-log?page_size=2&cursor={first['next_cursor']}").json()
+    assert len(second["logs"]) == 1
+    assert second["next_cursor"] is None
+    assert {log["id"] for log in first["logs"]}.isdisjoint(log["id"] for log in second["logs"])
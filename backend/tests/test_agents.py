@@ -143,6 +143,31 @@ def test_search_agents(client, sample_agent_data):
     assert response.json()["total"] == 0
 
 
+
+def test_search_agents_full_text_ranking(client, sample_agent_data):
+    def publish(**overrides):
+        agent_id = client.post("/api/v1/agents", json={**sample_agent_data, **overrides}).json()["id"]
+        client.post(f"/api/v1/agents/{agent_id}/publish")
+        return agent_id
+
+    in_description = publish(name="Helper", description="Summarises invoices for accountants.")
+    in_name = publish(name="Invoice Parser", description="Extracts line items.")
+    in_tags = publish(name="Ledger Bot", description="Bookkeeping helper.", tags=["invoicing"])
+    in_long = publish(name="Tax Agent", description="Tax filing.", long_description="Reads scanned invoices.")
+
+    response = client.get("/api/v1/agents?search=invoice")
+    ids = [a["id"] for a in response.json()["agents"]]
+    assert response.json()["total"] == 4
+    assert ids[0] == in_name
+    assert set(ids) == {in_description, in_name, in_tags, in_long}
+
+    assert client.get("/api/v1/agents?search=invoice parser").json()["total"] == 1
+
+    client.put(f"/api/v1/agents/{in_name}", json={"name": "Receipt Parser"})
+    client.delete(f"/api/v1/agents/{in_tags}")
+    ids = {a["id"] for a in client.get("/api/v1/agents?search=invoice").json()["agents"]}
+    assert ids == {in_description, in_long}
+
 def test_filter_agents_by_category(client, sample_agent_data):
     # Create and publish
     create_resp = client.post("/api/v1/agents", json=sample_agent_data)
@@ -157,3 +182,54 @@ def test_filter_agents_by_category(client, sample_agent_data):
     response = client.get("/api/v1/agents?category=coding")
     assert response.status_code == 200
     assert response.json()["total"] == 0
+
+
+def test_stream_execute_agent(client, sample_agent_data):
+    create_resp = client.post("/api/v1/agents", json=sample_agent_data)
+    agent_id = create_resp.json()["id"]
+
+    response = client.post(f"/api/v1/agents/{agent_id}/execute/stream", json={
+        "input": {"query": "test query"},
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        line[len("event: "):]
+        for line in response.text.splitlines()
+        if line.startswith("event: ")
+    ]
+    assert events[0] == "start"
+    assert "token" in events
+    assert events[-1] == "done"
+
+
+def test_stream_execute_agent_not_found(client):
+    response = client.post(
+        "/api/v1/agents/00000000-0000-0000-0000-000000000000/execute/stream",
+        json={"input": {"query": "x"}},
+    )
+    assert response.status_code == 404
+
+
+def test_list_agents_cursor_pagination(client, sample_agent_data):
+    created = []
+    for i in range(5):
+        agent_id = client.post("/api/v1/agents", json={**sample_agent_data, "name": f"Agent {i}"}).json()["id"]
+        client.post(f"/api/v1/agents/{agent_id}/publish")
+        created.append(agent_id)
+
+    seen, cursor = [], None
+    while True:
+        params = {"page_size": 2, "include_total": False}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/api/v1/agents", params=params).json()
+        assert data["total"] is None
+        seen.extend(a["id"] for a in data["agents"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(reversed(created))
+
+    response = client.get("/api/v1/agents", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
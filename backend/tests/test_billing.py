@@ -107,3 +107,137 @@ def test_get_usage_with_period(client):
         assert response.status_code == 200
         data = response.json()
         assert data["user_id"] == uid
+
+
+def test_validate_api_key_enforces_rate_limit_and_batches_usage(db_session, monkeypatch):
+    from app.models.billing import ApiKey
+    from app.services import billing_service
+    from app.services.usage_counter_service import api_key_usage
+
+    monkeypatch.setattr(api_key_usage, "flush_seconds", 3600.0)
+    api_key_usage.flush(db_session)
+
+    api_key, raw_key = billing_service.create_api_key(db_session, uuid.uuid4(), "limited")
+    api_key.rate_limit = 3
+    db_session.commit()
+
+    results = [billing_service.validate_api_key(db_session, raw_key) for _ in range(4)]
+    assert [r is not None for r in results] == [True, True, True, False]
+    assert billing_service.validate_api_key(db_session, "not-a-key") is None
+
+    assert api_key_usage.pending(api_key.id) == 3
+    api_key_usage.flush(db_session)
+    db_session.expire_all()
+    stored = db_session.query(ApiKey).filter(ApiKey.id == api_key.id).one()
+    assert stored.usage_count == 3
+    assert stored.last_used_at is not None
+    assert api_key_usage.pending(api_key.id) == 0
+
+
+def test_usage_flush_uses_its_own_session(db_session, monkeypatch):
+    from app.models.billing import ApiKey
+    from app.services import billing_service
+    from app.services.usage_counter_service import api_key_usage
+
+    api_key, raw_key = billing_service.create_api_key(db_session, uuid.uuid4(), "own-session")
+    monkeypatch.setattr(api_key_usage, "flush_seconds", 0.0)
+    api_key.name = "renamed but not committed"
+
+    assert billing_service.validate_api_key(db_session, raw_key) is not None
+    assert api_key_usage.pending(api_key.id) == 0
+    assert db_session.is_modified(api_key)
+    db_session.rollback()
+    stored = db_session.query(ApiKey).filter(ApiKey.id == api_key.id).one()
+    assert stored.name == "own-session"
+    assert stored.usage_count == 1
+
+
+def test_validate_api_key_is_cached_until_revoked(db_session):
+    from sqlalchemy import event
+    from app.services import billing_service
+
+    api_key, raw_key = billing_service.create_api_key(db_session, uuid.uuid4(), "cached", tier="pro")
+    assert billing_service.validate_api_key(db_session, raw_key).id == api_key.id
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        cached = billing_service.validate_api_key(db_session, raw_key)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert cached.id == api_key.id and cached.tier == "pro"
+    assert not any("api_keys" in sql and "key_hash" in sql for sql in statements)
+
+    billing_service.revoke_api_key(db_session, api_key.id)
+    assert billing_service.validate_api_key(db_session, raw_key) is None
+
+
+def test_api_key_cache_drops_entries_on_broadcast():
+    from app.services.cache_service import ApiKeyCache
+
+    cache = ApiKeyCache(max_entries=10, ttl_seconds=60)
+    cache.set("hash-a", {"id": "a"})
+    cache._on_message({"type": "message", "data": b"hash-a"})
+    assert cache.get("hash-a") is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_usage_totals_come_from_rollups(db_session):
+    from app.models.billing import UsageRollup
+    from app.services import billing_service
+
+    user_id = uuid.uuid4()
+    for tokens in (10, 20, 30):
+        billing_service.record_usage(db_session, user_id, uuid.uuid4(), "/chat", "POST", tokens, 0.5)
+
+    buckets = db_session.query(UsageRollup).filter(UsageRollup.user_id == user_id).all()
+    assert sorted(b.granularity for b in buckets) == ["day", "hour"]
+    assert all(b.requests == 3 and b.tokens_used == 60 for b in buckets)
+
+    usage = billing_service.get_usage(db_session, user_id, "day")
+    assert (usage["total_requests"], usage["total_tokens"], usage["total_cost"]) == (3, 60, 1.5)
+    assert usage["records"] == [] and usage["next_cursor"] is None
+
+    first = billing_service.get_usage(db_session, user_id, "day", include_records=True, page_size=2)
+    assert len(first["records"]) == 2 and first["next_cursor"]
+    rest = billing_service.get_usage(
+        db_session, user_id, "day", include_records=True, page_size=2, cursor=first["next_cursor"],
+    )
+    assert len(rest["records"]) == 1 and rest["next_cursor"] is None
+
+    assert billing_service.rebuild_usage_rollups(db_session, user_id) == 3
+    assert billing_service.get_usage(db_session, user_id, "month")["total_tokens"] == 60
+
+
+def test_usage_totals_include_records_from_before_rollups(db_session, monkeypatch):
+    from datetime import datetime, timedelta
+    from app.models.billing import UsageRecord, UsageRollupCoverage
+    from app.services import billing_service
+
+    monkeypatch.setattr(billing_service, "_rollup_coverage_marked", False)
+    user_id = uuid.uuid4()
+    earlier = datetime.utcnow() - timedelta(hours=3)
+    for tokens in (5, 7):
+        db_session.add(UsageRecord(
+            user_id=user_id, api_key_id=uuid.uuid4(), endpoint="/chat", method="POST",
+            tokens_used=tokens, cost=0.25, created_at=earlier,
+        ))
+    db_session.commit()
+
+    usage = billing_service.get_usage(db_session, user_id, "day")
+    assert (usage["total_requests"], usage["total_tokens"], usage["total_cost"]) == (2, 12, 0.5)
+
+    billing_service.record_usage(db_session, user_id, uuid.uuid4(), "/chat", "POST", 10, 0.5)
+    assert db_session.get(UsageRollupCoverage, 1) is not None
+    usage = billing_service.get_usage(db_session, user_id, "day")
+    assert (usage["total_requests"], usage["total_tokens"], usage["total_cost"]) == (3, 22, 1.0)
+
+    assert billing_service.rebuild_usage_rollups(db_session) == 3
+    assert billing_service.get_usage(db_session, user_id, "day")["total_tokens"] == 22
+
+
+def test_get_usage_rejects_invalid_cursor(client):
+    response = client.get(f"/api/v1/billing/usage/{_user_id()}?include_records=true&cursor=bogus")
+    assert response.status_code == 400
@@ -157,3 +157,82 @@ def test_add_credits_refund_type(client):
     })
     assert response.status_code == 201
     assert response.json()["transaction_type"] == "refund"
+
+
+def test_spend_with_reference_is_idempotent(client):
+    uid = _user_id()
+    payload = {"user_id": uid, "amount": 40.0, "reference_id": "order-1"}
+    first = client.post("/api/v1/economy/credits/spend", json=payload)
+    replay = client.post("/api/v1/economy/credits/spend", json=payload)
+    assert first.status_code == replay.status_code == 200
+    assert first.json()["id"] == replay.json()["id"]
+    assert client.get(f"/api/v1/economy/balance/{uid}").json()["balance"] == 60.0
+
+
+def test_transfer_batch_is_all_or_nothing(client):
+    alice, bob, carol = _user_id(), _user_id(), _user_id()
+    response = client.post("/api/v1/economy/credits/transfer", json={
+        "transfers": [
+            {"from_user_id": alice, "to_user_id": bob, "amount": 30.0},
+            {"from_user_id": alice, "to_user_id": carol, "amount": 80.0},
+        ],
+    })
+    assert response.status_code == 400
+    assert client.get(f"/api/v1/economy/balance/{alice}").json()["balance"] == 100.0
+    assert client.get(f"/api/v1/economy/balance/{bob}").json()["balance"] == 100.0
+
+    body = {
+        "transfers": [
+            {"from_user_id": alice, "to_user_id": bob, "amount": 30.0},
+            {"from_user_id": alice, "to_user_id": carol, "amount": 20.0},
+        ],
+        "reference_id": "payout-7",
+    }
+    response = client.post("/api/v1/economy/credits/transfer", json=body)
+    assert response.status_code == 201
+    assert [t["transaction_type"] for t in response.json()["transactions"]] == [
+        "transfer_out", "transfer_in", "transfer_out", "transfer_in",
+    ]
+    replay = client.post("/api/v1/economy/credits/transfer", json=body)
+    assert [t["id"] for t in replay.json()["transactions"]] == [
+        t["id"] for t in response.json()["transactions"]
+    ]
+    balances = [client.get(f"/api/v1/economy/balance/{u}").json() for u in (alice, bob, carol)]
+    assert [b["balance"] for b in balances] == [50.0, 130.0, 120.0]
+    assert balances[0]["total_spent"] == 50.0
+
+
+def test_concurrent_spends_never_overdraw(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.database.session import Base
+    from app.models.economy import CreditAccount, CreditTransaction
+    from app.services import economy_service
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'ledger.db'}", connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    user_id = uuid.uuid4()
+    with Session() as db:
+        economy_service.get_or_create_account(db, user_id)
+
+    def spend(attempt):
+        with Session() as db:
+            reference = f"retry-{attempt % 5}" if attempt % 2 else None
+            return economy_service.spend_credits(db, user_id, 7.0, reference_id=reference) is not None
+
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(spend, range(200)))
+        with Session() as db:
+            account = db.query(CreditAccount).filter(CreditAccount.user_id == user_id).one()
+            spent = db.query(CreditTransaction).filter(CreditTransaction.account_id == account.id).count()
+            assert account.balance >= 0
+            assert spent == 14 and account.balance == 100.0 - 14 * 7.0
+            assert account.total_spent == 14 * 7.0
+            assert sum(results) >= spent
+    finally:
+        engine.dispose()
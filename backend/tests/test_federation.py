@@ -85,3 +85,202 @@ def test_sync_agents(client):
     response = client.post(f"/api/v1/federation/nodes/{node_id}/sync")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+
+def _fake_client(nodes):
+    import httpx
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=nodes.app))
+
+
+def _register(db_session, host):
+    from app.schemas.federation import FederationNodeCreate
+    from app.services import federation_service
+
+    return federation_service.register_node(db_session, FederationNodeCreate(
+        name=host, url=f"http://{host}", api_key="test-api-key-12345",
+    ))
+
+
+def test_sync_agents_pages_and_upserts(db_session):
+    import asyncio
+    from app.models.federation import FederatedAgent
+    from app.services import federation_service
+    from tests.fake_node import FakeNodes
+
+    nodes = FakeNodes()
+    catalog = nodes.add_node("node-a.test", 45)
+    node = _register(db_session, "node-a.test")
+
+    async def scenario():
+        async with _fake_client(nodes) as client:
+            first = await federation_service.sync_agents(db_session, node.id, client=client, page_size=10)
+            catalog[0]["name"] = "Renamed"
+            second = await federation_service.sync_agents(db_session, node.id, client=client, page_size=10)
+            return first, second
+
+    first, second = asyncio.get_event_loop().run_until_complete(scenario())
+    assert len(first) == len(second) == 45
+    assert nodes.requests == 10
+    assert db_session.query(FederatedAgent).count() == 45
+    renamed = db_session.query(FederatedAgent).filter(FederatedAgent.remote_agent_id == catalog[0]["id"]).one()
+    assert renamed.name == "Renamed"
+    db_session.refresh(node)
+    assert node.agent_count == 45
+
+
+def test_sync_agents_follows_page_numbers_for_legacy_nodes(db_session):
+    import asyncio
+    from app.services import federation_service
+    from tests.fake_node import FakeNodes
+
+    nodes = FakeNodes(legacy_paging=True)
+    nodes.add_node("legacy.test", 25)
+    node = _register(db_session, "legacy.test")
+
+    async def scenario():
+        async with _fake_client(nodes) as client:
+            return await federation_service.sync_agents(db_session, node.id, client=client, page_size=10)
+
+    assert len(asyncio.get_event_loop().run_until_complete(scenario())) == 25
+
+
+def test_sync_agents_applies_pages_off_the_event_loop(db_session, monkeypatch):
+    import asyncio
+    import time
+    from app.services import federation_service
+    from tests.fake_node import FakeNodes
+
+    nodes = FakeNodes(legacy_paging=True)
+    nodes.add_node("slow-db.test", 25)
+    node = _register(db_session, "slow-db.test")
+    upsert = federation_service._upsert_agents
+
+    def slow_upsert(db, rows):
+        time.sleep(0.1)
+        upsert(db, rows)
+
+    monkeypatch.setattr(federation_service, "_upsert_agents", slow_upsert)
+
+    async def scenario():
+        gaps = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.ensure_future(ticker())
+        async with _fake_client(nodes) as client:
+            synced = await federation_service.sync_agents(db_session, node.id, client=client, page_size=10)
+        ticking.cancel()
+        return synced, max(gaps)
+
+    synced, longest_gap = asyncio.get_event_loop().run_until_complete(scenario())
+    assert len(synced) == 25
+    assert longest_gap < 0.08
+
+
+def test_sync_all_nodes_is_concurrent_and_bounded(tmp_path):
+    import asyncio
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.database.session import Base
+    from app.services import federation_service
+    from tests.fake_node import FakeNodes
+
+    # Node syncs write from worker threads at the same time, so each needs its own connection
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'federation.db'}", connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    nodes = FakeNodes(latency=0.02)
+    hosts = [f"node-{i}.test" for i in range(6)]
+    with Session() as db:
+        for i, host in enumerate(hosts):
+            nodes.add_node(host, 5 + i)
+            _register(db, host)
+    nodes.failing.add("node-5.test")
+
+    async def scenario():
+        async with _fake_client(nodes) as client:
+            return await federation_service.sync_all_nodes(Session, concurrency=3, client=client)
+
+    counts = asyncio.get_event_loop().run_until_complete(scenario())
+    assert sorted(counts.values()) == [0, 5, 6, 7, 8, 9]
+    assert 1 < nodes.max_in_flight <= 3
+
+
+def test_delta_sync_transfers_only_changes(db_session, monkeypatch):
+    import asyncio
+    import httpx
+    from fastapi import FastAPI
+    from sqlalchemy.orm import sessionmaker
+    from app.api.routes import federation as federation_routes
+    from app.config import settings
+    from app.database.session import get_db
+    from app.models.agent import Agent
+    from app.models.federation import FederatedAgent
+    from app.services import federation_service
+
+    monkeypatch.setattr(settings, "federation_changes_settle_seconds", 0.0)
+    publisher = uuid.uuid4()
+    agents = [
+        Agent(name=f"Agent {i}", slug=f"agent-{i}", description="A federated test agent",
+              publisher_id=publisher, status="published" if i < 5 else "draft")
+        for i in range(6)
+    ]
+    db_session.add_all(agents)
+    db_session.commit()
+    node = _register(db_session, "origin.test")
+
+    # The origin node serves its change feed from its own sessions
+    origin = FastAPI()
+    origin.include_router(federation_routes.router, prefix="/api/v1")
+    OriginSession = sessionmaker(bind=db_session.get_bind())
+
+    def origin_db():
+        with OriginSession() as db:
+            yield db
+
+    origin.dependency_overrides[get_db] = origin_db
+    served = []
+
+    async def record(response):
+        served.append(response.request.url.params)
+
+    async def sync(**kwargs):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=origin), event_hooks={"response": [record]},
+        ) as client:
+            return await federation_service.sync_agents(db_session, node.id, client=client, **kwargs)
+
+    run = asyncio.get_event_loop().run_until_complete
+    assert len(run(sync(page_size=2))) == 5
+    assert len(served) == 3 and node.sync_watermark
+
+    agents[0].name = "Agent zero renamed"
+    agents[2].status = "draft"
+    db_session.delete(agents[1])
+    db_session.commit()
+
+    served.clear()
+    changed = run(sync())
+    assert [a.name for a in changed] == ["Agent zero renamed"]
+    assert len(served) == 1
+    remaining = {a.remote_agent_id for a in db_session.query(FederatedAgent)}
+    assert remaining == {str(a.id) for a in (agents[0], agents[3], agents[4])}
+    db_session.refresh(node)
+    assert node.agent_count == 3
+
+    assert run(sync()) == []
+    assert len(run(sync(full=True))) == 3
+
+
+def test_agent_changes_rejects_bad_watermark(client):
+    response = client.get("/api/v1/federation/changes?since=not-a-watermark")
+    assert response.status_code == 400
@@ -171,3 +171,151 @@ def test_memory_stats(client):
     assert data["total_memories"] >= 2
     assert "by_type" in data
     assert "by_namespace" in data
+
+
+def test_search_memories_semantic_ranks_by_similarity(client):
+    aid = _agent_id()
+    _store_memory(client, agent_id=aid, key="ml", content="machine learning research on neural networks")
+    _store_memory(client, agent_id=aid, key="cook", content="recipe for tomato soup with basil")
+    _store_memory(client, agent_id=aid, key="ml2", content="deep learning for machine translation research")
+
+    response = client.get(f"/api/v1/memory/{aid}/search?query=machine learning research&mode=semantic&limit=2")
+    assert response.status_code == 200
+    keys = [m["key"] for m in response.json()]
+    assert sorted(keys) == ["ml", "ml2"]
+
+
+def test_search_memories_hybrid_and_namespace(client):
+    aid = _agent_id()
+    _store_memory(client, agent_id=aid, namespace="facts", key="a", content="the sky is blue")
+    _store_memory(client, agent_id=aid, namespace="notes", key="b", content="the sky is blue today")
+
+    response = client.get(f"/api/v1/memory/{aid}/search?query=sky&mode=hybrid&namespace=notes")
+    assert response.status_code == 200
+    assert [m["key"] for m in response.json()] == ["b"]
+
+
+def test_search_memories_rejects_unknown_mode(client):
+    response = client.get(f"/api/v1/memory/{_agent_id()}/search?query=x&mode=fuzzy")
+    assert response.status_code == 422
+
+
+def test_semantic_search_sees_updates_and_deletes(client):
+    aid = _agent_id()
+    first = _store_memory(client, agent_id=aid, key="pet", content="my dog likes long walks").json()
+    _store_memory(client, agent_id=aid, key="car", content="the car needs new tyres")
+
+    url = f"/api/v1/memory/{aid}/search?query=car engine oil&mode=semantic"
+    assert client.get(f"{url}&limit=1").json()[0]["key"] == "car"
+
+    client.put(f"/api/v1/memory/{first['id']}", json={"content": "the car engine needs oil"})
+    assert client.get(f"{url}&limit=1").json()[0]["key"] == "pet"
+
+    client.delete(f"/api/v1/memory/{first['id']}")
+    assert [m["key"] for m in client.get(f"{url}&limit=5").json()] == ["car"]
+
+
+def test_search_knowledge_semantic_and_keyword_modes(client):
+    for title, content in [
+        ("Gardening", "Watering tomato plants in the summer garden."),
+        ("Databases", "Index tuning for relational database queries."),
+    ]:
+        client.post("/api/v1/memory/knowledge", json={"title": title, "content": content, "category": "howto"})
+
+    semantic = client.get("/api/v1/memory/knowledge/search?query=database index tuning&category=howto").json()
+    assert semantic["results"][0]["title"] == "Databases"
+
+    keyword = client.get("/api/v1/memory/knowledge/search?query=tomato&mode=keyword").json()
+    assert [r["title"] for r in keyword["results"]] == ["Gardening"]
+
+    response = client.get("/api/v1/memory/knowledge/search?query=x&mode=fuzzy")
+    assert response.status_code == 422
+
+
+def test_search_knowledge_picks_up_rows_written_elsewhere(client, db_session):
+    from app.models.memory import KnowledgeBase
+    from app.services.memory_service import generate_embedding
+
+    created = client.post("/api/v1/memory/knowledge", json={
+        "title": "Databases", "content": "Index tuning for relational database queries.", "category": "howto",
+    }).json()
+    url = "/api/v1/memory/knowledge/search?query=database index tuning&category=howto"
+    assert [r["title"] for r in client.get(url).json()["results"]] == ["Databases"]
+
+    # Another worker inserts a row and deletes the first one behind this process's back
+    content = "Database index tuning and query plans."
+    db_session.add(KnowledgeBase(
+        title="Query plans", content=content, category="howto", embedding=generate_embedding(content),
+    ))
+    db_session.query(KnowledgeBase).filter(KnowledgeBase.id == uuid.UUID(created["id"])).delete()
+    db_session.commit()
+
+    assert [r["title"] for r in client.get(url).json()["results"]] == ["Query plans"]
+
+
+def test_knowledge_index_replays_only_logged_changes(db_session, monkeypatch):
+    from app.models.memory import KnowledgeBase
+    from app.services import memory_service
+
+    first = memory_service.add_knowledge(db_session, "Databases", "Index tuning for relational databases.", category="howto")
+    memory_service.search_knowledge(db_session, "database index tuning", category="howto")
+
+    def full_scan(*args):
+        raise AssertionError("steady-state sync must not rescan knowledge_base")
+
+    monkeypatch.setattr(memory_service, "_reconcile_knowledge_index", full_scan)
+    second = memory_service.add_knowledge(db_session, "Query plans", "Database index tuning and query plans.", category="howto")
+    assert memory_service._knowledge_index_watermark[1] == second.id
+    db_session.query(KnowledgeBase).filter(KnowledgeBase.id == first.id).delete()
+    db_session.commit()
+
+    results, _ = memory_service.search_knowledge(db_session, "database index tuning", category="howto")
+    assert [k.title for k in results] == ["Query plans"]
+    assert first.id not in memory_service.get_knowledge_index().ids()
+
+
+def test_retrieve_reuses_cached_matrix_across_access_bumps(db_session, monkeypatch):
+    from app.services import memory_service
+
+    builds = []
+    matrix_class = memory_service.EmbeddingMatrix
+
+    def counting_matrix(*args, **kwargs):
+        builds.append(1)
+        return matrix_class(*args, **kwargs)
+
+    monkeypatch.setattr(memory_service, "EmbeddingMatrix", counting_matrix)
+    agent_id = uuid.uuid4()
+    memory = memory_service.store_memory(db_session, agent_id, "facts", "pet", "my dog is called Rex")
+    updated_at = memory.updated_at
+
+    for _ in range(5):
+        found = memory_service.retrieve_memories(db_session, agent_id, "dog name")
+    assert len(builds) == 1
+    assert found[0].access_count == 5 and found[0].updated_at == updated_at
+
+    memory_service.store_memory(db_session, agent_id, "facts", "car", "the car is red")
+    assert len(memory_service.retrieve_memories(db_session, agent_id, "car colour")) == 2
+    assert len(builds) == 2
+
+
+def test_semantic_search_embeds_legacy_rows_without_writing(db_session):
+    from sqlalchemy import update
+    from app.models.memory import AgentMemory
+    from app.services import memory_service
+
+    agent_id = uuid.uuid4()
+    memory = memory_service.store_memory(db_session, agent_id, "facts", "pet", "my dog is called Rex")
+    db_session.execute(update(AgentMemory).where(AgentMemory.id == memory.id).values(embedding_vector=None))
+    db_session.commit()
+
+    pending = AgentMemory(agent_id=agent_id, namespace="facts", key="draft", content="not saved yet")
+    db_session.add(pending)
+    found = memory_service.search_memories(db_session, agent_id, "dog name", mode="semantic")
+    assert [m.id for m in found][:1] == [memory.id]
+    assert pending in db_session.new
+    db_session.rollback()
+
+    stored = db_session.query(AgentMemory).filter(AgentMemory.agent_id == agent_id).all()
+    assert [m.key for m in stored] == ["pet"]
+    assert stored[0].embedding_vector is None
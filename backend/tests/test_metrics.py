@@ -33,3 +33,47 @@ def test_metrics_counter_values(client):
         assert len(parts) == 2, f"Unexpected metric line format: {line}"
         # Value should be numeric
         float(parts[1])
+
+
+def test_metrics_cache_counters(client):
+    text = client.get("/metrics").text
+    assert "completion_cache_hits_total" in text
+    assert "semantic_cache_hits_total" in text
+    assert "semantic_cache_misses_total" in text
+
+
+def test_metrics_admission_queues(client):
+    from app.services.execution_service import execution_service
+
+    execution_service.admission.gate("openai")
+    text = client.get("/metrics").text
+    assert 'llm_queue_depth{provider="openai",priority="background"} 0' in text
+    assert 'llm_in_flight{provider="openai"} 0' in text
+    assert "# TYPE llm_admission_wait_seconds_sum counter" in text
+
+
+def _metric(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    raise AssertionError(f"metric {name} missing")
+
+
+def test_metrics_middleware_counts_requests(client):
+    before = _metric(client.get("/metrics").text, "total_requests")
+    client.get("/health")
+    after = _metric(client.get("/metrics").text, "total_requests")
+    # /health plus the second /metrics scrape
+    assert after - before == 2
+    assert _metric(client.get("/metrics").text, "request_latency_seconds_count") > 0
+
+
+def test_request_id_is_echoed_or_generated(client):
+    response = client.get("/health", headers={"X-Request-ID": "abc-123"})
+    assert response.headers["x-request-id"] == "abc-123"
+
+    generated = client.get("/health").headers["x-request-id"]
+    assert len(generated) == 32
+
+    response = client.get("/health", headers={"X-Request-ID": "bad id\twith spaces"})
+    assert response.headers["x-request-id"] != "bad id\twith spaces"
@@ -47,3 +47,31 @@ def test_get_snapshot_history_empty(client):
     assert response.status_code == 200
     data = response.json()
     assert data["total"] >= 0
+
+
+def test_platform_stats_are_materialized(db_session, monkeypatch):
+    from app.models.user import User
+    from app.services import platform_service
+
+    stats = platform_service.PlatformStatsMaterializer(max_age_seconds=3600)
+    monkeypatch.setattr(platform_service, "platform_stats", stats)
+
+    first = platform_service.get_platform_stats(db_session)
+    assert first["total_users"] == 0 and first["refreshed_at"] is not None
+
+    db_session.add(User(email="a@example.com", username="a", hashed_password="x"))
+    db_session.commit()
+    db_session.add(User(email="b@example.com", username="b", hashed_password="x"))
+    db_session.flush()
+    db_session.rollback()
+
+    current = platform_service.get_platform_stats(db_session)
+    assert current["total_users"] == 1
+    assert current["refreshed_at"] == first["refreshed_at"]
+    assert current["updated_at"] > first["refreshed_at"]
+
+    snapshot = platform_service.create_snapshot(db_session)
+    assert snapshot.total_users == 1
+
+    stats.invalidate()
+    assert platform_service.get_platform_stats(db_session)["total_users"] == 1
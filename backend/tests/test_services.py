@@ -1,4 +1,5 @@
 import pytest
+import uuid
 import asyncio
 from app.services.execution_service import AgentExecutionService
 
@@ -42,3 +43,995 @@ def test_execution_service_rate_limit_exceeded():
     )
     assert result.status == "error"
     assert "Rate limit" in result.error
+
+
+def test_execution_service_reuses_pooled_client():
+    service = AgentExecutionService()
+
+    async def scenario():
+        first = service._get_client("openai")
+        assert service._get_client("openai") is first
+        assert str(first.base_url).startswith("https://api.openai.com/v1")
+        await service.close_clients()
+        assert first.is_closed
+        assert service._get_client("openai") is not first
+        await service.close_clients()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+
+
+def test_execution_service_calls_provider_through_pool(monkeypatch):
+    import httpx
+    from app.config import settings
+
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "pooled"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+        })
+
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "anthropic_api_key", None)
+    service = AgentExecutionService()
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url="https://api.openai.com/v1", transport=httpx.MockTransport(handler)
+    )
+
+    async def scenario():
+        results = [
+            await service.execute_agent(
+                agent_config={"model_name": "gpt-4", "model_provider": "openai"},
+                input_data={"query": f"hi {i}"},
+                user_id="pool-user",
+            )
+            for i in range(3)
+        ]
+        await service.close_clients()
+        return results
+
+    results = asyncio.get_event_loop().run_until_complete(scenario())
+    assert [r.output["result"] for r in results] == ["pooled"] * 3
+    assert results[0].tokens_used == 5
+    assert seen == ["https://api.openai.com/v1/chat/completions"] * 3
+
+
+def _collect_stream(service, provider, model):
+    async def scenario():
+        events = []
+        async for event in service.stream_agent(
+            agent_config={"model_provider": provider, "model_name": model},
+            input_data={"query": "hi"},
+            user_id="00000000-0000-0000-0000-000000000001",
+        ):
+            events.append(event)
+        await service.close_clients()
+        return events
+
+    return asyncio.get_event_loop().run_until_complete(scenario())
+
+
+def _streaming_service(monkeypatch, provider, base_url, body, key_setting):
+    import httpx
+    from app.config import settings
+
+    for name in ("openai_api_key", "anthropic_api_key", "mistral_api_key", "groq_api_key", "ollama_base_url"):
+        monkeypatch.setattr(settings, name, None)
+    monkeypatch.setattr(settings, key_setting, "test-key")
+
+    service = AgentExecutionService()
+    service._clients[provider] = httpx.AsyncClient(
+        base_url=base_url,
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)),
+    )
+    return service
+
+
+def test_stream_openai_sse(monkeypatch):
+    body = (
+        b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\n'
+        b'data: {"choices":[{"delta":{"content":"lo"}}]}\n\n'
+        b'data: {"choices":[],"usage":{"prompt_tokens":7,"completion_tokens":2}}\n\n'
+        b"data: [DONE]\n\n"
+    )
+    service = _streaming_service(monkeypatch, "openai", "https://api.openai.com/v1", body, "openai_api_key")
+    events = _collect_stream(service, "openai", "gpt-4")
+
+    assert [e["type"] for e in events] == ["start", "token", "token", "done"]
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "Hello"
+    assert events[-1]["tokens_used"] == 9
+    assert events[-1]["cost"] > 0
+
+
+def test_stream_anthropic_events(monkeypatch):
+    body = (
+        b'event: message_start\ndata: {"type":"message_start","message":{"usage":{"input_tokens":5}}}\n\n'
+        b'event: content_block_delta\ndata: {"type":"content_block_delta","delta":{"type":"text_delta","text":"Hi"}}\n\n'
+        b'event: message_delta\ndata: {"type":"message_delta","usage":{"output_tokens":1}}\n\n'
+        b'event: message_stop\ndata: {"type":"message_stop"}\n\n'
+    )
+    service = _streaming_service(
+        monkeypatch, "anthropic", "https://api.anthropic.com/v1", body, "anthropic_api_key"
+    )
+    events = _collect_stream(service, "anthropic", "claude-3-haiku-20240307")
+
+    assert [e["type"] for e in events] == ["start", "token", "done"]
+    assert events[-1]["tokens_used"] == 6
+
+
+def test_stream_ollama_ndjson(monkeypatch):
+    body = (
+        b'{"message":{"content":"Local"},"done":false}\n'
+        b'{"message":{"content":" model"},"done":false}\n'
+        b'{"message":{"content":""},"done":true,"prompt_eval_count":4,"eval_count":2}\n'
+    )
+    service = _streaming_service(monkeypatch, "ollama", "http://localhost:11434", body, "ollama_base_url")
+    events = _collect_stream(service, "ollama", "llama3")
+
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "Local model"
+    assert events[-1]["type"] == "done"
+    assert events[-1]["tokens_used"] == 6
+
+
+def test_stream_records_usage_when_stream_ends(monkeypatch, db_session):
+    from app.models.model_usage import ModelUsage
+
+    body = (
+        b'data: {"choices":[{"delta":{"content":"ok"}}],"x_groq":{"usage":{"prompt_tokens":3,"completion_tokens":1}}}\n\n'
+        b"data: [DONE]\n\n"
+    )
+    service = _streaming_service(monkeypatch, "groq", "https://api.groq.com/openai/v1", body, "groq_api_key")
+
+    async def scenario():
+        async for _ in service.stream_agent(
+            agent_config={"model_provider": "groq", "model_name": "llama-3.1-8b-instant"},
+            input_data={"query": "hi"},
+            user_id="00000000-0000-0000-0000-000000000001",
+            db=db_session,
+        ):
+            pass
+        await service.close_clients()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+    usage = db_session.query(ModelUsage).one()
+    assert usage.model_provider == "groq"
+    assert usage.tokens_input == 3
+    assert usage.tokens_output == 1
+    assert usage.status == "completed"
+
+
+def test_stream_records_partial_usage_when_client_disconnects(monkeypatch, db_session):
+    from app.models.model_usage import ModelUsage
+
+    body = b"".join(
+        b'data: {"choices":[{"delta":{"content":"chunk of text "}}]}\n\n' for _ in range(5)
+    ) + b"data: [DONE]\n\n"
+    service = _streaming_service(monkeypatch, "openai", "https://api.openai.com/v1", body, "openai_api_key")
+
+    async def scenario():
+        stream = service.stream_agent(
+            agent_config={"model_provider": "openai", "model_name": "gpt-4"},
+            input_data={"query": "hi"},
+            user_id="00000000-0000-0000-0000-000000000001",
+            db=db_session,
+        )
+        async for event in stream:
+            if event["type"] == "token":
+                break
+        await stream.aclose()
+        await service.close_clients()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+    usage = db_session.query(ModelUsage).one()
+    assert usage.status == "cancelled"
+    assert usage.tokens_input > 0
+    assert usage.tokens_output == 3
+    assert usage.cost > 0
+
+
+def test_completion_cache_serves_repeat_calls(monkeypatch):
+    import httpx
+    from app.config import settings
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "cached answer"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        })
+
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "anthropic_api_key", None)
+    service = AgentExecutionService()
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url="https://api.openai.com/v1", transport=httpx.MockTransport(handler)
+    )
+    config = {
+        "model_name": "gpt-4", "model_provider": "openai", "system_prompt": "Be brief.",
+        "parameters": {"temperature": 0},
+    }
+
+    async def scenario():
+        first = await service.execute_agent(config, {"query": "same"}, "cache-user")
+        second = await service.execute_agent(config, {"query": "same"}, "cache-user")
+        other = await service.execute_agent(config, {"query": "different"}, "cache-user")
+        opted_out = await service.execute_agent(
+            {**config, "parameters": {"temperature": 0, "cache": False}}, {"query": "same"}, "cache-user"
+        )
+        return first, second, other, opted_out
+
+    async def sampled():
+        sampled_config = {**config, "parameters": {"temperature": 0.7}}
+        runs = [await service.execute_agent(sampled_config, {"query": "sampled"}, "cache-user") for _ in range(2)]
+        opted_in = {**sampled_config, "parameters": {"temperature": 0.7, "cache": True}}
+        runs += [await service.execute_agent(opted_in, {"query": "opted in"}, "cache-user") for _ in range(2)]
+        await service.close_clients()
+        return runs
+
+    monkeypatch.setattr(settings, "completion_cache_enabled", True)
+    first, second, other, opted_out = asyncio.get_event_loop().run_until_complete(scenario())
+    assert not first.cached and first.cost > 0
+    assert second.cached and second.cost == 0.0
+    assert second.output["result"] == "cached answer"
+    assert not other.cached
+    assert not opted_out.cached
+    assert len(calls) == 3
+
+    monkeypatch.setattr(settings, "completion_cache_enabled", False)
+    sampled_first, sampled_second, opted_first, opted_second = (
+        asyncio.get_event_loop().run_until_complete(sampled())
+    )
+    assert not sampled_first.cached and not sampled_second.cached
+    assert not opted_first.cached and opted_second.cached
+    assert len(calls) == 6
+
+
+def test_lru_cache_evicts_and_expires(monkeypatch):
+    from app.services import cache_service
+    from app.services.cache_service import LRUCache
+
+    cache = LRUCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now = cache_service.time.monotonic()
+    monkeypatch.setattr(cache_service.time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_semantic_cache_serves_near_duplicates(monkeypatch):
+    import httpx
+    from app.config import settings
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "Use the reset link on the login page."}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 8},
+        })
+
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "anthropic_api_key", None)
+    service = AgentExecutionService()
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url="https://api.openai.com/v1", transport=httpx.MockTransport(handler)
+    )
+    config = {
+        "agent_id": "support-agent",
+        "model_name": "gpt-3.5-turbo",
+        "model_provider": "openai",
+        "system_prompt": "You are a support agent.",
+        "parameters": {"semantic_cache": True, "semantic_cache_threshold": 0.9},
+    }
+
+    async def scenario():
+        first = await service.execute_agent(config, {"query": "How do I reset my password?"}, "u1")
+        near = await service.execute_agent(config, {"query": "how do i reset my password"}, "u1")
+        unrelated = await service.execute_agent(config, {"query": "What is your refund policy?"}, "u1")
+        other_agent = await service.execute_agent(
+            {**config, "agent_id": "sales-agent"}, {"query": "how do I reset my password"}, "u1"
+        )
+        await service.close_clients()
+        return first, near, unrelated, other_agent
+
+    first, near, unrelated, other_agent = asyncio.get_event_loop().run_until_complete(scenario())
+    assert not first.cached
+    assert near.cached and near.cost == 0.0
+    assert not unrelated.cached
+    assert not other_agent.cached
+    assert len(calls) == 3
+    assert service.semantic_cache.hits == 1
+
+
+def test_semantic_cache_matches_within_scope():
+    from app.services.cache_service import SemanticCache
+
+    cache = SemanticCache(threshold=0.9)
+    cache.store("agent", "scope", "reset my password", {"content": "a"})
+    assert cache.lookup("agent", "scope", "Reset my password!")[0] == {"content": "a"}
+    assert cache.lookup("agent", "other-scope", "reset my password") is None
+    assert cache.lookup("agent", "scope", "cancel my subscription") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_top_k_cosine_matches_brute_force():
+    import numpy as np
+    from app.services.vector_index import normalize_rows, top_k_cosine
+
+    rng = np.random.default_rng(0)
+    matrix = normalize_rows(rng.standard_normal((500, 16)).astype(np.float32))
+    query = rng.standard_normal(16).astype(np.float32)
+
+    rows, scores = top_k_cosine(matrix, query, 5)
+    expected = np.argsort(-(matrix @ (query / np.linalg.norm(query))))[:5]
+    assert list(rows) == list(expected)
+    assert all(scores[i] >= scores[i + 1] for i in range(4))
+
+
+def test_ivf_index_recall_and_warm_reload(tmp_path):
+    import uuid
+    import numpy as np
+    from app.services.vector_index import PartitionedIVFIndex, normalize_rows
+
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((20, 32))
+    vectors = normalize_rows(
+        (centers[rng.integers(0, 20, 3000)] + 0.3 * rng.standard_normal((3000, 32))).astype(np.float32)
+    )
+    ids = [uuid.uuid4() for _ in range(len(vectors))]
+
+    index = PartitionedIVFIndex(32, directory=str(tmp_path), train_threshold=1000, nprobe=8)
+    index.add("docs", ids[:2500], vectors[:2500])
+    index.add("other", ids[2500:], vectors[2500:])
+    assert index.partition("docs").centroids is not None
+
+    query = vectors[7]
+    expected = {ids[i] for i in np.argsort(-(vectors[:2500] @ query))[:10]}
+    found = {i for i, _ in index.search(query, 10, label="docs")}
+    assert len(found & expected) >= 9
+    assert index.search(query, 1, all_partitions=True)[0][0] == ids[7]
+
+    reloaded = PartitionedIVFIndex(32, directory=str(tmp_path), train_threshold=1000, nprobe=8)
+    assert len(reloaded) == 3000
+    assert {i for i, _ in reloaded.search(query, 10, label="docs")} == found
+
+
+def test_ivf_index_shared_directory_dedupes_and_removes(tmp_path):
+    import uuid
+    import numpy as np
+    from app.services.vector_index import PartitionedIVFIndex, normalize_rows
+
+    rng = np.random.default_rng(2)
+    vectors = normalize_rows(rng.standard_normal((50, 16)).astype(np.float32))
+    ids = [uuid.uuid4() for _ in range(50)]
+
+    # Two workers backfilling the same rows into one directory
+    first = PartitionedIVFIndex(16, directory=str(tmp_path))
+    second = PartitionedIVFIndex(16, directory=str(tmp_path))
+    first.add("docs", ids[:30], vectors[:30])
+    second.add("docs", ids, vectors)
+    first.refresh()
+    assert len(first.partition("docs").store.ids) == 50 and len(first) == 50
+
+    # Older files may already hold duplicates; they are hidden on load
+    store = first.partition("docs").store
+    with store.locked():
+        store.append(np.array([ids[0].bytes], dtype="V16"), vectors[:1])
+    results = PartitionedIVFIndex(16, directory=str(tmp_path)).search(vectors[0], 3, label="docs")
+    assert [i for i, _ in results].count(ids[0]) == 1
+
+    second.remove([ids[0]])
+    assert ids[0] not in {i for i, _ in first.search(vectors[0], 5, label="docs")}
+    reloaded = PartitionedIVFIndex(16, directory=str(tmp_path))
+    assert len(reloaded) == 49 and ids[0] not in set(reloaded.ids())
+
+    memory = PartitionedIVFIndex(16)
+    memory.add(None, ids[:3], vectors[:3])
+    memory.add(None, ids[:3], vectors[:3])
+    memory.remove([ids[1]])
+    assert [i for i, _ in memory.search(vectors[1], 5)] and len(memory) == 2
+    assert ids[1] not in {i for i, _ in memory.search(vectors[1], 5)}
+
+
+def test_token_bucket_limiter_refills_and_bounds_keys(monkeypatch):
+    from app.middleware import rate_limiter
+    from app.middleware.rate_limiter import TokenBucketLimiter
+
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: clock[0])
+    limiter = TokenBucketLimiter(max_requests=3, window_seconds=3.0, max_keys=2)
+    run = asyncio.get_event_loop().run_until_complete
+
+    assert [run(limiter.hit("a")).allowed for _ in range(4)] == [True, True, True, False]
+    assert run(limiter.hit("a")).retry_after == pytest.approx(1.0)
+    clock[0] += 1.0
+    assert run(limiter.hit("a")).allowed is True
+
+    run(limiter.hit("b"))
+    run(limiter.hit("c"))
+    assert len(limiter) == 2
+
+
+def test_redis_rate_limiter_uses_script_and_falls_back():
+    from app.middleware.rate_limiter import RedisSlidingWindowLimiter
+
+    calls = []
+
+    class FakeRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                calls.append((keys, args))
+                return [1, 4, 0] if len(calls) == 1 else [0, 0, 1500]
+            return run
+
+    limiter = RedisSlidingWindowLimiter("redis://unused", max_requests=5, window_seconds=60, client=FakeRedis())
+    run = asyncio.get_event_loop().run_until_complete
+    assert run(limiter.hit("1.2.3.4")) == (True, 4, 0.0)
+    assert run(limiter.hit("1.2.3.4")) == (False, 0, 1.5)
+    assert calls[0][0] == ["ratelimit:1.2.3.4"]
+    assert calls[0][1][:2] == [5, 60000]
+
+    class BrokenRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                raise ConnectionError("down")
+            return run
+
+    limiter = RedisSlidingWindowLimiter("redis://unused", max_requests=1, window_seconds=60, client=BrokenRedis())
+    assert run(limiter.hit("ip")).allowed is True
+    assert run(limiter.hit("ip")).allowed is False
+
+
+def test_redis_rate_limiter_aclose_closes_client():
+    from app.middleware.rate_limiter import RedisSlidingWindowLimiter
+
+    class FakeRedis:
+        closed = 0
+
+        def register_script(self, script):
+            async def run(keys, args):
+                return [1, 0, 0]
+            return run
+
+        async def aclose(self):
+            self.closed += 1
+
+    client = FakeRedis()
+    limiter = RedisSlidingWindowLimiter("redis://unused", max_requests=1, window_seconds=60, client=client)
+    run = asyncio.get_event_loop().run_until_complete
+    run(limiter.hit("ip"))
+    run(limiter.aclose())
+    run(limiter.aclose())
+    assert client.closed == 1
+
+
+def test_rate_limiter_middleware_rejects_over_limit(monkeypatch):
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    from app.middleware.rate_limiter import RateLimiterMiddleware, TokenBucketLimiter
+
+    monkeypatch.delenv("TESTING", raising=False)
+    inner = Starlette(routes=[Route("/", lambda request: PlainTextResponse("ok"))])
+    app = RateLimiterMiddleware(inner, limiter=TokenBucketLimiter(max_requests=2, window_seconds=60))
+    with TestClient(app) as c:
+        assert [c.get("/").status_code for _ in range(3)] == [200, 200, 429]
+        response = c.get("/")
+        assert response.json()["retry_after"] == int(response.headers["Retry-After"]) >= 1
+
+
+def test_rolling_window_counter_expires_old_buckets(monkeypatch):
+    from app.services import usage_counter_service
+    from app.services.usage_counter_service import RollingWindowCounter
+
+    clock = [10_000.0]
+    monkeypatch.setattr(usage_counter_service.time, "time", lambda: clock[0])
+    counter = RollingWindowCounter(window_seconds=60, buckets=6, shards=4)
+
+    assert [counter.hit("k", 3)[0] for _ in range(4)] == [True, True, True, False]
+    clock[0] += 30
+    assert counter.hit("k", 3)[0] is False
+    clock[0] += 31
+    assert counter.hit("k", 3) == (True, 1)
+    assert counter.count("other") == 0
+
+    clock[0] += 61
+    assert counter.sweep() == 1
+    assert len(counter) == 0
+
+
+def test_usage_ingestor_batches_and_drains_on_stop(db_session):
+    import uuid
+    from app.models.model_usage import ModelUsage
+    from app.services.usage_ingest_service import UsageIngestor
+
+    engine = db_session.get_bind()
+    ingestor = UsageIngestor(flush_interval_ms=60_000, batch_size=3, max_pending=5)
+
+    def row():
+        return {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "model_provider": "openai", "model_name": "gpt-4"}
+
+    def stored():
+        db_session.expire_all()
+        return db_session.query(ModelUsage).count()
+
+    async def scenario():
+        await ingestor.start()
+        ingestor.enqueue(engine, ModelUsage, row())
+        ingestor.enqueue(engine, ModelUsage, row())
+        await asyncio.sleep(0.05)
+        assert stored() == 0 and ingestor.pending == 2
+
+        ingestor.enqueue(engine, ModelUsage, row())  # reaches batch_size, wakes the flusher
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if ingestor.pending == 0:
+                break
+        assert stored() == 3
+
+        ingestor.enqueue(engine, ModelUsage, row())
+        await ingestor.stop()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+    assert stored() == 4
+    assert ingestor.rows_written == 4
+
+    # Not running: writes go straight through
+    ingestor.enqueue(engine, ModelUsage, row())
+    assert stored() == 5
+
+
+def test_usage_ingestor_isolates_bad_rows_and_dead_letters(db_session):
+    import uuid
+    from app.models.billing import UsageDeadLetter
+    from app.models.model_usage import ModelUsage
+    from app.services.usage_ingest_service import UsageIngestor
+
+    engine = db_session.get_bind()
+    ingestor = UsageIngestor(max_attempts=2)
+    good = [
+        {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "model_provider": "openai", "model_name": "gpt-4"}
+        for _ in range(6)
+    ]
+    bad = {"id": uuid.uuid4(), "user_id": None, "model_provider": "openai", "model_name": "gpt-4"}
+    with ingestor._lock:
+        ingestor._buffers[(engine, ModelUsage.__table__)] = good[:3] + [bad] + good[3:]
+        ingestor._pending = 7
+
+    assert ingestor.flush() == 6
+    assert ingestor.pending == 1 and ingestor.rows_dead_lettered == 0
+    assert ingestor.flush() == 0
+    assert ingestor.pending == 0 and ingestor.rows_dead_lettered == 1
+
+    db_session.expire_all()
+    assert db_session.query(ModelUsage).count() == 6
+    letter = db_session.query(UsageDeadLetter).one()
+    assert letter.table_name == "model_usage" and letter.attempts == 2
+    assert letter.payload["id"] == str(bad["id"])
+
+
+def test_usage_ingestor_requeues_on_connection_failure(db_session, monkeypatch):
+    import uuid
+    from sqlalchemy.exc import OperationalError
+    from app.models.model_usage import ModelUsage
+    from app.services.usage_ingest_service import UsageIngestor
+
+    ingestor = UsageIngestor()
+    monkeypatch.setattr(ingestor, "_write", lambda *a: (_ for _ in ()).throw(OperationalError("x", {}, None)))
+    row = {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "model_provider": "openai", "model_name": "gpt-4"}
+    with pytest.raises(OperationalError):
+        ingestor.enqueue(db_session.get_bind(), ModelUsage, row)
+    assert ingestor.pending == 1 and ingestor.rows_dead_lettered == 0
+
+
+def test_usage_ingestor_backpressure_waits_then_drops(db_session, monkeypatch):
+    import uuid
+    from app.models.model_usage import ModelUsage
+    from app.services.usage_ingest_service import UsageIngestor
+
+    engine = db_session.get_bind()
+    ingestor = UsageIngestor(flush_interval_ms=60_000, batch_size=100, max_pending=2, max_wait_seconds=0.05)
+
+    def row():
+        return {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "model_provider": "openai", "model_name": "gpt-4"}
+
+    async def scenario():
+        await ingestor.start()
+        assert ingestor.enqueue(engine, ModelUsage, row()) and ingestor.enqueue(engine, ModelUsage, row())
+        assert ingestor.enqueue(engine, ModelUsage, row()) is False  # sync producers never flush inline
+        assert await ingestor.put(engine, ModelUsage, row())  # waits for the flusher to make room
+
+        monkeypatch.setattr(ingestor, "flush", lambda: 0)  # flusher stuck
+        ingestor.enqueue(engine, ModelUsage, row())
+        assert await ingestor.put(engine, ModelUsage, row()) is False
+        monkeypatch.undo()
+        await ingestor.stop()
+
+    asyncio.get_event_loop().run_until_complete(scenario())
+    assert ingestor.rows_dropped == 2
+    db_session.expire_all()
+    assert db_session.query(ModelUsage).count() == 4
+
+
+def _router_with_keys(monkeypatch, **kwargs):
+    from app.config import settings
+    from app.services.execution_service import ModelRouter
+
+    for provider in ("openai", "anthropic", "mistral", "groq"):
+        monkeypatch.setattr(settings, f"{provider}_api_key", "test-key")
+    return ModelRouter(**kwargs)
+
+
+def test_model_router_routes_speed_by_observed_latency(monkeypatch):
+    router = _router_with_keys(monkeypatch)
+    assert router.select_model(optimize_for="speed")["model"] == "llama-3.1-8b-instant"
+
+    for _ in range(5):
+        router.record("groq", "llama-3.1-8b-instant", 900.0, ok=True, tokens_output=100)
+        router.record("mistral", "mistral-small-latest", 120.0, ok=True, tokens_output=100)
+    assert router.select_model(optimize_for="speed")["model"] == "mistral-small-latest"
+
+    stats = router.stats("mistral", "mistral-small-latest")
+    assert stats.ewma_latency_ms == pytest.approx(120.0)
+    assert stats.p95_ms == 120.0
+    assert stats.tokens_per_second == pytest.approx(100 / 0.12)
+
+
+def test_model_router_demotes_failing_provider_and_reprobes(monkeypatch):
+    import time
+
+    router = _router_with_keys(monkeypatch, min_samples=3, cooldown_seconds=30.0)
+    for _ in range(3):
+        router.record("openai", "gpt-4", 50.0, ok=False)
+    assert router.snapshot()["openai"]["demoted"] is True
+
+    choice = router.select_model(preferred_provider="openai", preferred_model="gpt-4")
+    assert choice["provider"] != "openai"
+
+    # Cooldown over: exactly one request re-probes the provider
+    for key in (("openai", None), ("openai", "gpt-4")):
+        router._stats[key].demoted_until = time.monotonic() - 1
+    assert router.select_model(preferred_provider="openai", preferred_model="gpt-4")["provider"] == "openai"
+    assert router.select_model(preferred_provider="openai", preferred_model="gpt-4")["provider"] != "openai"
+
+    router.record("openai", "gpt-4", 50.0, ok=True)
+    assert router.select_model(preferred_provider="openai", preferred_model="gpt-4")["provider"] == "openai"
+    assert router.stats("openai").demoted_until == 0
+
+
+def test_model_router_seeds_from_usage_history(monkeypatch, db_session):
+    import uuid
+    from app.models.model_usage import ModelUsage
+
+    db_session.add_all([
+        ModelUsage(user_id=uuid.uuid4(), model_provider="groq", model_name="llama-3.1-8b-instant",
+                   latency_ms=40, status="completed", tokens_output=20)
+        for _ in range(3)
+    ])
+    db_session.commit()
+
+    router = _router_with_keys(monkeypatch)
+    assert router.load_history(db_session) == 3
+    assert router.history_loaded
+    assert router.stats("groq", "llama-3.1-8b-instant").ewma_latency_ms == pytest.approx(40.0)
+
+
+def _resilient_service(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "anthropic_api_key", "test-key")
+    monkeypatch.setattr(settings, "mistral_api_key", None)
+    monkeypatch.setattr(settings, "groq_api_key", None)
+    monkeypatch.setattr(settings, "llm_retry_base_delay_seconds", 0.0)
+    monkeypatch.setattr(settings, "completion_cache_enabled", False)
+    return AgentExecutionService()
+
+
+def _execute(service, query="hello"):
+    config = {"model_provider": "openai", "model_name": "gpt-4", "system_prompt": "Be brief."}
+    return asyncio.get_event_loop().run_until_complete(
+        service.execute_agent(config, {"query": query}, user_id="resilience-user")
+    )
+
+
+def test_execute_agent_retries_transient_provider_errors(monkeypatch):
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    monkeypatch.setattr(service.model_router, "equivalents", lambda provider, model: [])
+    openai = StubProvider("openai", faults=[503, 429]).install(service)
+
+    result = _execute(service)
+    assert result.status == "completed"
+    assert result.output["provider"] == "openai"
+    assert openai.calls == 3
+
+
+def test_execute_agent_does_not_retry_client_errors(monkeypatch):
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    openai = StubProvider("openai", faults=[400]).install(service)
+    anthropic = StubProvider("anthropic").install(service)
+
+    result = _execute(service)
+    assert result.status == "error"
+    assert (openai.calls, anthropic.calls) == (1, 0)
+    assert service._get_circuit_breaker("openai").failure_count == 0
+
+
+def test_execute_agent_fails_over_and_trips_breaker(monkeypatch):
+    from app.config import settings
+    from app.services.resilience import CircuitBreaker
+    from tests.fake_providers import StubProvider
+
+    monkeypatch.setattr(settings, "llm_breaker_failure_threshold", 2)
+    service = _resilient_service(monkeypatch)
+    openai = StubProvider("openai", faults=[503] * 10).install(service)
+    anthropic = StubProvider("anthropic").install(service)
+
+    first = _execute(service, "one")
+    assert first.status == "completed"
+    assert first.output["provider"] == "anthropic"
+    assert first.output["model"] == "claude-3-opus-20240229"
+
+    _execute(service, "two")
+    assert service._get_circuit_breaker("openai").state == CircuitBreaker.OPEN
+    calls = openai.calls
+    assert _execute(service, "three").output["provider"] == "anthropic"
+    assert openai.calls == calls
+
+
+def test_execute_agent_hedges_slow_primary(monkeypatch):
+    import time
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    monkeypatch.setattr(service.model_router, "hedge_delay_ms", lambda provider, model: 20.0)
+    openai = StubProvider("openai", faults=[2.0]).install(service)
+    anthropic = StubProvider("anthropic").install(service)
+
+    started = time.perf_counter()
+    result = _execute(service)
+    assert time.perf_counter() - started < 1.0
+    assert result.output["provider"] == "anthropic"
+    assert anthropic.completed == 1
+    assert openai.completed == 0 and openai.cancelled == 1
+
+
+def test_circuit_breaker_half_open_admits_one_probe(monkeypatch):
+    import time
+    from app.services.resilience import CircuitBreaker
+
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10.0)
+    breaker.record_failure()
+    assert not breaker.can_execute()
+    breaker.last_failure_time = time.time() - 11
+    assert breaker.can_execute() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.can_execute()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.can_execute()
+
+    shared = CircuitBreaker(failure_threshold=1, recovery_timeout=10.0, single_probe=False)
+    shared.record_failure()
+    shared.last_failure_time = time.time() - 11
+    assert shared.can_execute() and shared.can_execute()
+    shared.record_failure()
+    assert shared.state == CircuitBreaker.OPEN and not shared.available()
+
+
+def test_half_open_probe_is_released_when_hedge_cancels_it(monkeypatch):
+    import time
+    from app.services.resilience import CircuitBreaker
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    monkeypatch.setattr(service.model_router, "hedge_delay_ms", lambda provider, model: 20.0)
+    openai = StubProvider("openai", faults=[2.0, 400]).install(service)
+    StubProvider("anthropic").install(service)
+    breaker = service._get_circuit_breaker("openai")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.last_failure_time = time.time() - breaker.recovery_timeout - 1
+
+    # The slow probe loses to the hedge and is cancelled without an outcome
+    assert _execute(service, "one").output["provider"] == "anthropic"
+    assert openai.cancelled == 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+
+    # A non-retryable error says nothing about health either; the slot is freed again
+    assert _execute(service, "two").status == "error"
+    assert openai.calls == 2
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+
+
+def test_execute_agent_fails_fast_when_every_breaker_is_open(monkeypatch):
+    import time
+    from app.config import settings
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    monkeypatch.setattr(settings, "llm_retry_base_delay_seconds", 5.0)
+    openai = StubProvider("openai").install(service)
+    anthropic = StubProvider("anthropic").install(service)
+    for provider in ("openai", "anthropic"):
+        breaker = service._get_circuit_breaker(provider)
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+    started = time.perf_counter()
+    result = _execute(service)
+    assert time.perf_counter() - started < 1.0
+    assert result.status == "error" and "Circuit breaker open" in result.error
+    assert (openai.calls, anthropic.calls) == (0, 0)
+
+
+def test_failover_skips_equivalents_over_the_cost_limit(monkeypatch):
+    from app.services import execution_service as module
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    monkeypatch.setitem(module.MODEL_COSTS, "claude-3-opus-20240229", {"input": 100.0, "output": 100.0})
+    openai = StubProvider("openai", faults=[503] * 10).install(service)
+    anthropic = StubProvider("anthropic").install(service)
+
+    config = {
+        "model_provider": "openai", "model_name": "gpt-4", "system_prompt": "Be brief.",
+        "parameters": {"max_cost": 5.0},
+    }
+    result = asyncio.get_event_loop().run_until_complete(
+        service.execute_agent(config, {"query": "hello"}, user_id="resilience-user")
+    )
+    assert result.status == "error"
+    assert openai.calls > 0 and anthropic.calls == 0
+
+
+def test_admission_serves_interactive_before_background():
+    from app.services.admission_service import AdmissionController, Priority
+
+    async def scenario():
+        admission = AdmissionController({"openai": {"max_concurrency": 1}})
+        order = []
+
+        async def call(name, priority):
+            async with admission.admit("openai", priority):
+                order.append(name)
+
+        async with admission.admit("openai", Priority.INTERACTIVE):
+            background = asyncio.ensure_future(call("background", Priority.BACKGROUND))
+            batch = asyncio.ensure_future(call("batch", Priority.BATCH))
+            interactive = asyncio.ensure_future(call("interactive", Priority.INTERACTIVE))
+            await asyncio.sleep(0)
+            depth = admission.snapshot()["openai"]["queue_depth"]
+            assert depth == {"interactive": 1, "batch": 1, "background": 1}
+        await asyncio.gather(background, batch, interactive)
+        return order, admission.snapshot()["openai"]
+
+    order, stats = asyncio.get_event_loop().run_until_complete(scenario())
+    assert order == ["interactive", "batch", "background"]
+    assert stats["in_flight"] == 0 and stats["admitted"] == 4
+    assert stats["wait_seconds_max"] > 0
+
+
+def test_admission_waits_for_token_budget():
+    import time
+    from app.services.admission_service import ProviderGate
+
+    async def scenario():
+        gate = ProviderGate(max_concurrency=10, tokens_per_minute=6000)
+        assert await gate.acquire(tokens=6000) < 0.05
+        gate.release()
+        started = time.monotonic()
+        await gate.acquire(tokens=10)  # refills at 100 tokens/second
+        waited = time.monotonic() - started
+        gate.release(refund_tokens=10)
+        return waited
+
+    waited = asyncio.get_event_loop().run_until_complete(scenario())
+    assert 0.05 <= waited < 1.0
+
+
+def test_admission_caps_ollama_at_server_parallelism(monkeypatch):
+    from app.config import settings
+    from app.services.admission_service import AdmissionController
+
+    monkeypatch.setattr(settings, "ollama_max_parallel", 3)
+    admission = AdmissionController({})
+    assert admission.gate("ollama").max_concurrency == 3
+    assert admission.gate("openai").max_concurrency == settings.llm_max_concurrency
+    assert AdmissionController({"ollama": {"max_concurrency": 8}}).gate("ollama").max_concurrency == 8
+
+
+def test_token_budget_estimates_per_provider_family():
+    from app.services.token_budget import estimate_message_tokens, estimate_tokens
+
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    assert 150 <= estimate_tokens(text, "openai") <= 300
+    assert estimate_tokens(text, "anthropic") >= estimate_tokens(text, "openai")
+    assert estimate_tokens("", "openai") == 0
+    messages = [{"role": "system", "content": "hi"}, {"role": "user", "content": "there"}]
+    assert estimate_message_tokens(messages, "openai") == 2 * 4 + 1 + 2
+
+
+def test_fit_messages_trims_user_input_or_rejects():
+    from app.services.token_budget import (
+        TRUNCATION_MARKER, PromptBudgetError, estimate_message_tokens, fit_messages,
+    )
+
+    small = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hello"}]
+    tokens = estimate_message_tokens(small, "openai")
+    assert fit_messages("openai", "gpt-4", small, 1024) == (small, tokens, 1024, False)
+    # The completion cap is lowered to the room left in a small window
+    assert fit_messages("ollama", "llama3", small, 4096).max_tokens == 4096 - tokens
+
+    huge = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "START " + "word " * 20000 + "END"}]
+    fitted, tokens, max_tokens, truncated = fit_messages("openai", "gpt-4", huge, 1024)
+    assert truncated and max_tokens == 1024 and tokens + 1024 <= 8192
+    assert fitted[0] == huge[0]
+    assert fitted[1]["content"].startswith("START") and fitted[1]["content"].endswith("END")
+    assert TRUNCATION_MARKER in fitted[1]["content"]
+
+    with pytest.raises(PromptBudgetError):
+        fit_messages("openai", "gpt-4", huge, 1024, truncate=False)
+    assert not fit_messages("anthropic", "claude-3-haiku-20240307", huge, 1024).truncated
+
+
+def test_execute_agent_rejects_over_budget_prompt_before_calling(monkeypatch):
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    openai = StubProvider("openai").install(service)
+    anthropic = StubProvider("anthropic").install(service)
+    config = {
+        "model_provider": "openai", "model_name": "gpt-4", "system_prompt": "Be brief.",
+        "parameters": {"prompt_overflow": "reject"},
+    }
+    result = asyncio.get_event_loop().run_until_complete(
+        service.execute_agent(config, {"query": "word " * 20000}, user_id=str(uuid.uuid4()))
+    )
+    assert result.status == "error" and "context window" in result.error
+    assert (openai.calls, anthropic.calls) == (0, 0)
+
+    config["parameters"] = {"max_cost": 0.01}
+    result = asyncio.get_event_loop().run_until_complete(
+        service.execute_agent(config, {"query": "hello"}, user_id=str(uuid.uuid4()))
+    )
+    # 4096 completion tokens on gpt-4 could cost ~$0.25
+    assert result.status == "error" and "per-call limit" in result.error
+    assert openai.calls == 0
+
+
+def test_execute_agent_truncates_oversized_input(monkeypatch):
+    import json
+    from tests.fake_providers import StubProvider
+
+    service = _resilient_service(monkeypatch)
+    openai = StubProvider("openai")
+    sent = []
+
+    async def handler(request):
+        sent.append(json.loads(request.content))
+        return await openai.handler(request)
+
+    import httpx
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url=service._base_url("openai"), transport=httpx.MockTransport(handler),
+    )
+    config = {"model_provider": "openai", "model_name": "gpt-4", "system_prompt": "Be brief."}
+    result = asyncio.get_event_loop().run_until_complete(
+        service.execute_agent(config, {"query": "word " * 20000}, user_id=str(uuid.uuid4()))
+    )
+    assert result.status == "completed"
+    assert len(sent[0]["messages"][1]["content"]) < 20000 * 5
@@ -1,3 +1,6 @@
+import uuid
+import time
+import asyncio
 import pytest
 
 
@@ -87,3 +90,267 @@ def test_list_templates(client):
     response = client.get("/api/v1/workflows/templates")
     assert response.status_code == 200
     assert isinstance(response.json()["workflows"], list)
+
+
+def test_execute_workflow_runs_steps_in_background(client, db_session, sample_workflow_data):
+    create_resp = client.post("/api/v1/workflows", json=sample_workflow_data)
+    workflow_id = create_resp.json()["id"]
+
+    exec_resp = client.post(f"/api/v1/workflows/{workflow_id}/execute", json={
+        "input_data": {"query": "AI research"},
+    })
+    execution_id = exec_resp.json()["id"]
+    db_session.expire_all()
+
+    response = client.get(f"/api/v1/workflows/{workflow_id}/executions/{execution_id}")
+    data = response.json()
+    # Step 1 (agent) completes, Step 2 (human_review) pauses the run
+    assert data["status"] == "paused"
+    assert data["current_step"] == 2
+    assert [r["name"] for r in data["step_results"]] == ["Step 1", "Step 2"]
+    assert data["step_results"][0]["status"] == "completed"
+
+
+def _create_execution(db_session, steps, input_data):
+    from app.models.workflow import Workflow, WorkflowStep
+    from app.services import orchestration_service
+
+    workflow = Workflow(name="Engine", slug=f"engine-{uuid.uuid4().hex[:8]}", owner_id=uuid.uuid4())
+    db_session.add(workflow)
+    db_session.flush()
+    for step in steps:
+        db_session.add(WorkflowStep(workflow_id=workflow.id, **step))
+    db_session.commit()
+    return orchestration_service.start_execution(db_session, workflow.id, uuid.uuid4(), input_data)
+
+
+def _run(db_session, execution):
+    from tests.conftest import TestingSessionLocal
+    from app.services.workflow_engine_service import workflow_engine_service
+
+    asyncio.get_event_loop().run_until_complete(
+        workflow_engine_service.run_execution(execution.id, TestingSessionLocal)
+    )
+    db_session.refresh(execution)
+    return execution
+
+
+def test_engine_renders_step_references(db_session):
+    execution = _create_execution(db_session, [
+        {"name": "research", "step_type": "agent", "position": 0,
+         "input_mapping": {"query": "Topic: {{input.topic}}"}},
+        {"name": "summary", "step_type": "transform", "position": 1,
+         "input_mapping": {"text": "{{steps.research.result}}", "topic": "{{input.topic}}"}},
+    ], {"topic": "agents"})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "completed"
+    assert execution.current_step == 2
+    assert execution.output_data["topic"] == "agents"
+    assert "Topic: agents" in execution.output_data["text"]
+    assert execution.completed_at is not None
+
+
+def test_engine_follows_failure_branch(db_session):
+    fallback_id = uuid.uuid4()
+    execution = _create_execution(db_session, [
+        {"name": "check", "step_type": "condition", "position": 0,
+         "condition": {"left": "{{input.score}}", "operator": "gt", "right": 5},
+         "on_failure_step_id": fallback_id},
+        {"name": "happy", "step_type": "transform", "position": 1,
+         "input_mapping": {"path": "happy"}},
+        {"id": fallback_id, "name": "fallback", "step_type": "transform", "position": 2,
+         "input_mapping": {"path": "fallback"}},
+    ], {"score": 1})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "completed"
+    assert [r["name"] for r in execution.step_results] == ["check", "fallback"]
+    assert execution.output_data == {"path": "fallback"}
+
+
+def test_engine_fails_on_unhandled_step_error(db_session):
+    execution = _create_execution(db_session, [
+        {"name": "missing agent", "step_type": "agent", "position": 0, "agent_id": uuid.uuid4()},
+        {"name": "never", "step_type": "transform", "position": 1},
+    ], {})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "failed"
+    assert "not found" in execution.error_message
+    assert len(execution.step_results) == 1
+
+
+def _slow_agent(monkeypatch, delay=0.1):
+    from app.services.execution_service import ExecutionResult, execution_service
+
+    state = {"active": 0, "peak": 0}
+
+    async def fake_execute(agent_config, input_data, user_id, db=None, priority=None):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(delay)
+        state["active"] -= 1
+        return ExecutionResult(
+            execution_id=str(uuid.uuid4()), status="completed",
+            output={"result": f"answer to {input_data.get('query')}"},
+            tokens_used=10, cost=0.01,
+        )
+
+    monkeypatch.setattr(execution_service, "execute_agent", fake_execute)
+    return state
+
+
+def test_dependency_graph_from_connections_and_references():
+    from app.models.workflow import WorkflowStep
+    from app.services.workflow_engine_service import build_dependency_graph
+
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    steps = [
+        WorkflowStep(id=a, name="fan out", step_type="parallel", position=0, next_step_id=b),
+        WorkflowStep(id=b, name="search", step_type="agent", position=1, input_mapping={}),
+        WorkflowStep(id=c, name="merge", step_type="transform", position=2,
+                     input_mapping={"text": "{{steps.search.result}} / {{steps.fan out}}"}),
+    ]
+    deps = build_dependency_graph(steps)
+    assert deps == {a: set(), b: {a}, c: {a, b}}
+
+    steps[0].input_mapping = {"x": "{{steps.merge.result}}"}
+    with pytest.raises(ValueError):
+        build_dependency_graph(steps)
+
+
+def test_parallel_workflow_runs_independent_steps_concurrently(db_session, monkeypatch):
+    state = _slow_agent(monkeypatch, delay=0.1)
+    branches = [
+        {"name": f"search {i}", "step_type": "agent", "position": i + 1,
+         "input_mapping": {"query": f"{{{{input.topic}}}} angle {i}"}}
+        for i in range(6)
+    ]
+    execution = _create_execution(db_session, [
+        {"name": "fan out", "step_type": "parallel", "position": 0, "config": {"max_concurrency": 3}},
+        *branches,
+        {"name": "merge", "step_type": "transform", "position": 7,
+         "input_mapping": {f"r{i}": f"{{{{steps.search {i}.result}}}}" for i in range(6)}},
+    ], {"topic": "agents"})
+
+    started = time.time()
+    execution = _run(db_session, execution)
+    elapsed = time.time() - started
+
+    assert execution.status == "completed"
+    assert state["peak"] == 3
+    # Six 100ms calls at concurrency 3 take two rounds, not six
+    assert elapsed < 0.45
+    assert execution.current_step == 8
+    assert execution.total_tokens == 60
+    assert execution.step_results[-1]["name"] == "merge"
+    assert execution.output_data["r5"] == "answer to agents angle 5"
+
+
+def test_parallel_workflow_fails_when_branch_fails(db_session, monkeypatch):
+    _slow_agent(monkeypatch, delay=0.01)
+    execution = _create_execution(db_session, [
+        {"name": "fan out", "step_type": "parallel", "position": 0},
+        {"name": "ok", "step_type": "agent", "position": 1},
+        {"name": "broken", "step_type": "agent", "position": 2, "agent_id": uuid.uuid4()},
+        {"name": "merge", "step_type": "transform", "position": 3,
+         "input_mapping": {"a": "{{steps.ok.result}}", "b": "{{steps.broken.result}}"}},
+    ], {"query": "q"})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "failed"
+    assert "merge" not in [r["name"] for r in execution.step_results]
+
+
+def test_parallel_failure_handler_stands_in_for_failed_step(db_session, monkeypatch):
+    _slow_agent(monkeypatch, delay=0.01)
+    fallback_id = uuid.uuid4()
+    execution = _create_execution(db_session, [
+        {"name": "fan out", "step_type": "parallel", "position": 0},
+        {"name": "ok", "step_type": "agent", "position": 1},
+        {"name": "broken", "step_type": "agent", "position": 2, "agent_id": uuid.uuid4(),
+         "on_failure_step_id": fallback_id},
+        {"name": "merge", "step_type": "transform", "position": 3,
+         "input_mapping": {"a": "{{steps.ok.result}}", "b": "{{steps.broken.path}}"}},
+        {"id": fallback_id, "name": "fallback", "step_type": "transform", "position": 4,
+         "input_mapping": {"path": "fallback"}},
+    ], {"query": "q"})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "completed"
+    statuses = {r["name"]: r["status"] for r in execution.step_results}
+    assert statuses["broken"] == "error"
+    assert statuses["fallback"] == "completed" and statuses["merge"] == "completed"
+    assert execution.output_data["b"] == "fallback"
+
+
+def test_parallel_condition_false_branch_records_skipped_steps(db_session, monkeypatch):
+    _slow_agent(monkeypatch, delay=0.01)
+    check_id, else_id = uuid.uuid4(), uuid.uuid4()
+    execution = _create_execution(db_session, [
+        {"name": "fan out", "step_type": "parallel", "position": 0},
+        {"id": check_id, "name": "check", "step_type": "condition", "position": 1,
+         "condition": {"left": "{{input.score}}", "operator": "gt", "right": 5},
+         "on_failure_step_id": else_id},
+        {"name": "happy", "step_type": "transform", "position": 2,
+         "input_mapping": {"path": "happy", "after": "{{steps.check}}"}},
+        {"id": else_id, "name": "otherwise", "step_type": "transform", "position": 3,
+         "input_mapping": {"path": "otherwise"}},
+    ], {"score": 1})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "completed"
+    statuses = {r["name"]: r["status"] for r in execution.step_results}
+    assert statuses["happy"] == "skipped"
+    assert statuses["otherwise"] == "completed"
+    assert execution.output_data == {"path": "otherwise"}
+
+
+def _recording_agent(monkeypatch):
+    from app.services.execution_service import ExecutionResult, execution_service
+
+    calls = []
+
+    async def fake_execute(agent_config, input_data, user_id, db=None, priority=None):
+        calls.append({"db": db, "priority": priority})
+        await asyncio.sleep(0.01)
+        return ExecutionResult(
+            execution_id=str(uuid.uuid4()), status="completed",
+            output={"result": "ok"}, tokens_used=1, cost=0.0,
+        )
+
+    monkeypatch.setattr(execution_service, "execute_agent", fake_execute)
+    return calls
+
+
+def test_agent_steps_run_interactive_unless_workflow_is_background(db_session, monkeypatch):
+    from app.services import orchestration_service
+    from app.services.admission_service import Priority
+
+    calls = _recording_agent(monkeypatch)
+    execution = _create_execution(db_session, [
+        {"name": "research", "step_type": "agent", "position": 0},
+    ], {"query": "q"})
+    assert _run(db_session, execution).status == "completed"
+    assert calls[-1]["priority"] == Priority.INTERACTIVE
+
+    execution.workflow.is_background = True
+    db_session.commit()
+    execution = orchestration_service.start_execution(db_session, execution.workflow_id, uuid.uuid4(), {"query": "q"})
+    assert _run(db_session, execution).status == "completed"
+    assert calls[-1]["priority"] == Priority.BATCH
+
+
+def test_parallel_steps_each_get_their_own_session(db_session, monkeypatch):
+    calls = _recording_agent(monkeypatch)
+    execution = _create_execution(db_session, [
+        {"name": "fan out", "step_type": "parallel", "position": 0},
+        {"name": "a", "step_type": "agent", "position": 1},
+        {"name": "b", "step_type": "agent", "position": 2},
+    ], {"query": "q"})
+
+    execution = _run(db_session, execution)
+    assert execution.status == "completed"
+    sessions = [call["db"] for call in calls]
+    assert len(sessions) == 2 and sessions[0] is not sessions[1]